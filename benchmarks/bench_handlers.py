@@ -0,0 +1,436 @@
+"""
+Бенчмарк пропускной способности и задержек обработчиков сообщений и базы данных.
+
+Синтетические обновления (тексты разной длины, с entities и emoji, медиафайлы разных
+типов, заданное число пользователей) передаются напрямую в обработчики SignatureBot.
+Запросы к Bot API проходят через настоящий Bot с транспортом FakeRequest: параметры
+сериализуются так же, как перед отправкой в Telegram, но сетевого обмена нет, поэтому
+измеряется собственная работа бота.
+
+Отчет содержит обновления в секунду, перцентили задержки обработчиков, скорость доставки
+из очереди в каналы и операции базы данных в секунду. Результаты сохраняются в JSON,
+файл предыдущего запуска можно передать в --compare для сравнения между коммитами.
+
+Запуск: poetry run python -m benchmarks.bench_handlers --output results.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from http import HTTPStatus
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import telegram
+from telegram import Bot, MessageEntity, Update
+from telegram._utils.types import ODVInput
+from telegram.request import BaseRequest, RequestData
+
+from telegram_signature_bot.bot import SignatureBot
+from telegram_signature_bot.cache import ProfileCache
+from telegram_signature_bot.database import OutboxEntry
+from telegram_signature_bot.scheduler import SendScheduler
+from telegram_signature_bot.storage import BACKENDS, Storage, create_storage
+
+# Ограничения Telegram в бенчмарке не нужны: измеряется работа самого бота
+UNLIMITED_RATE = 1e9
+BENCHMARK_TOKEN = "123456:benchmark"
+
+WORDS = ["подпись", "канал", "сообщение", "новость", "report", "update", "бот", "Telegram"]
+EMOJI = ["🎉", "👋", "🔥", "👍🏽", "🇷🇺", "❤️", "🚀"]
+ENTITY_TYPES = [
+    MessageEntity.BOLD,
+    MessageEntity.ITALIC,
+    MessageEntity.CODE,
+    MessageEntity.UNDERLINE,
+]
+
+FILE = {"file_id": "file", "file_unique_id": "unique"}
+MEDIA = {
+    "photo": {"photo": [{**FILE, "width": 1280, "height": 720}]},
+    "video": {"video": {**FILE, "width": 1280, "height": 720, "duration": 10}},
+    "document": {"document": FILE},
+    "audio": {"audio": {**FILE, "duration": 180}},
+    "voice": {"voice": {**FILE, "duration": 5}},
+    "sticker": {
+        "sticker": {
+            **FILE,
+            "type": "regular",
+            "width": 512,
+            "height": 512,
+            "is_animated": False,
+            "is_video": False,
+        }
+    },
+}
+
+
+class FakeRequest(BaseRequest):
+    """Транспорт Bot API без сети: запрос сериализуется, ответ формируется на месте"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout: ODVInput[float] = BaseRequest.DEFAULT_NONE,
+        write_timeout: ODVInput[float] = BaseRequest.DEFAULT_NONE,
+        connect_timeout: ODVInput[float] = BaseRequest.DEFAULT_NONE,
+        pool_timeout: ODVInput[float] = BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        # Тело запроса собирается и разбирается так же, как при обмене с Telegram
+        payload = request_data.json_payload if request_data is not None else b"{}"
+        parameters: Dict[str, str] = json.loads(payload)
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint = url.rsplit("/", 1)[-1]
+        result: Any = True
+        if endpoint == "sendMediaGroup":
+            result = [self._message(parameters) for _ in json.loads(parameters["media"])]
+        elif endpoint.startswith(("send", "copy")):
+            result = self._message(parameters)
+        return HTTPStatus.OK, json.dumps({"ok": True, "result": result}).encode()
+
+    def _message(self, parameters: Dict[str, str]) -> Dict[str, Any]:
+        chat_id = parameters.get("chat_id", "0")
+        chat: Dict[str, Any] = (
+            {"id": int(chat_id), "type": "private"}
+            if chat_id.lstrip("-").isdigit()
+            else {"id": -1001, "type": "channel", "username": chat_id.lstrip("@")}
+        )
+        return {"message_id": next(self._message_ids), "date": 0, "chat": chat}
+
+
+class Workload:
+    """Генератор синтетических обновлений с воспроизводимым seed"""
+
+    def __init__(self, bot: Bot, users: int, seed: int):
+        self.bot = bot
+        self.users = users
+        self.random = random.Random(seed)
+        self._update_ids = itertools.count(1)
+
+    def text(self, words: int, emoji_ratio: float) -> str:
+        parts = [
+            self.random.choice(EMOJI)
+            if self.random.random() < emoji_ratio
+            else self.random.choice(WORDS)
+            for _ in range(words)
+        ]
+        return " ".join(parts)
+
+    def entities(self, text: str, count: int) -> List[Dict[str, Any]]:
+        # Смещения в кодовых единицах UTF-16, как их присылает Telegram
+        length = len(text.encode("utf-16-le")) // 2
+        entities = []
+        for _ in range(count):
+            offset = self.random.randrange(max(1, length - 1))
+            size = self.random.randint(1, max(1, min(20, length - offset)))
+            entities.append(
+                {"type": self.random.choice(ENTITY_TYPES), "offset": offset, "length": size}
+            )
+        return entities
+
+    def signature(self) -> tuple:
+        text = self.text(self.random.randint(2, 12), 0.1)
+        return text, [
+            MessageEntity.de_json(e, None) for e in self.entities(text, self.random.randint(0, 4))
+        ]
+
+    def update(self) -> Update:
+        user_id = self.random.randint(1, self.users)
+        message: Dict[str, Any] = {
+            "message_id": next(self._update_ids),
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+        }
+        if self.random.random() < 0.7:
+            # Короткие и длинные тексты, часть с большим количеством emoji
+            words = self.random.choice([5, 30, 150, 600])
+            text = self.text(words, self.random.choice([0.0, 0.1, 0.6]))
+            message["text"] = text
+            message["entities"] = self.entities(text, self.random.choice([0, 1, 5, 20]))
+        else:
+            kind = self.random.choice(list(MEDIA))
+            message.update(MEDIA[kind])
+            if kind != "sticker" and self.random.random() < 0.7:
+                caption = self.text(self.random.choice([3, 20, 80]), 0.2)
+                message["caption"] = caption
+                message["caption_entities"] = self.entities(caption, self.random.choice([0, 2, 8]))
+        return Update.de_json({"update_id": message["message_id"], "message": message}, self.bot)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def latency_report(latencies: List[float]) -> Dict[str, float]:
+    return {f"p{q}_ms": round(percentile(latencies, q) * 1000, 3) for q in (50, 95, 99)}
+
+
+async def setup_profiles(db: Storage, workload: Workload, channels: int) -> None:
+    """Подписи и каналы для всей популяции пользователей"""
+    for user_id in range(1, workload.users + 1):
+        text, entities = workload.signature()
+        await db.set_signature(user_id, text, entities)
+        for index in range(workload.random.randint(0, channels)):
+            await db.add_channel(user_id, f"@channel_{user_id}_{index}")
+
+
+async def bench_handlers(args: argparse.Namespace, db_path: str) -> Dict[str, Any]:
+    """Обработка обновлений с заданной конкурентностью и доставка очереди в каналы"""
+    transport = FakeRequest(args.api_latency / 1000)
+    fake_bot = Bot(BENCHMARK_TOKEN, request=transport, get_updates_request=FakeRequest())
+    scheduler = SendScheduler(
+        global_rate=UNLIMITED_RATE,
+        private_chat_rate=UNLIMITED_RATE,
+        private_chat_burst=UNLIMITED_RATE,
+        channel_rate=UNLIMITED_RATE,
+        channel_burst=UNLIMITED_RATE,
+    )
+    bot = SignatureBot(
+        BENCHMARK_TOKEN,
+        db_path,
+        storage=create_storage(args.storage, db_path, args.shards, cache=ProfileCache()),
+        scheduler=scheduler,
+        shutdown_drain_timeout=0,
+    )
+    workload = Workload(fake_bot, args.users, args.seed)
+    await bot.db.connect()
+    await setup_profiles(bot.db, workload, args.channels)
+    updates = [workload.update() for _ in range(args.updates)]
+    context = SimpleNamespace(bot=fake_bot, args=None)
+
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def handle(update: Update) -> None:
+        handler = bot.handle_message if update.message.text else bot.handle_media
+        async with semaphore:
+            started = time.perf_counter()
+            await handler(update, context)
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(handle(update) for update in updates))
+        elapsed = time.perf_counter() - started
+        queued = sum((await bot.db.outbox_stats()).values())
+
+        # Доставка накопленной очереди в каналы
+        drain_started = time.perf_counter()
+        await bot.outbox.start(fake_bot)
+        drained = await bot.outbox.drain(args.drain_timeout)
+        drain_elapsed = time.perf_counter() - drain_started
+        cache = bot.db.cache.stats() if bot.db.cache is not None else {}
+    finally:
+        await bot.post_stop(bot.application)
+        await bot.post_shutdown(bot.application)
+
+    return {
+        "updates": len(updates),
+        "seconds": round(elapsed, 4),
+        "updates_per_sec": round(len(updates) / elapsed, 1),
+        "latency": latency_report(latencies),
+        "api_requests": transport.requests,
+        "outbox": {
+            "queued": queued,
+            "drained": drained,
+            "seconds": round(drain_elapsed, 4),
+            "deliveries_per_sec": round(bot.outbox.delivered / drain_elapsed, 1),
+        },
+        "profile_cache": cache,
+    }
+
+
+async def measure(operation: Callable[[int], Awaitable[Any]], count: int) -> Dict[str, float]:
+    """Последовательное выполнение операции count раз"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(count):
+        op_started = time.perf_counter()
+        await operation(i)
+        latencies.append(time.perf_counter() - op_started)
+    elapsed = time.perf_counter() - started
+    return {"ops_per_sec": round(count / elapsed, 1), **latency_report(latencies)}
+
+
+async def bench_database(args: argparse.Namespace, db_path: str) -> Dict[str, Any]:
+    """Операции хранилища без кэша профилей, чтобы каждое чтение доходило до SQLite"""
+    db = create_storage(args.storage, db_path, args.shards, cache=ProfileCache(max_entries=0))
+    workload = Workload(Bot(BENCHMARK_TOKEN, request=FakeRequest()), args.users, args.seed)
+    signatures = [workload.signature() for _ in range(args.users)]
+    count = args.db_ops
+    users = args.users
+    results: Dict[str, Any] = {}
+    try:
+        await db.connect()
+        results["set_signature"] = await measure(
+            lambda i: db.set_signature(i % users + 1, *signatures[i % users]), count
+        )
+
+        async def set_signatures_concurrently(i: int) -> None:
+            await asyncio.gather(
+                *(
+                    db.set_signature((i * args.concurrency + u) % users + 1, *signatures[u % users])
+                    for u in range(args.concurrency)
+                )
+            )
+
+        # Одновременные изменения от многих пользователей записываются пачками
+        concurrent = await measure(set_signatures_concurrently, max(1, count // args.concurrency))
+        concurrent["ops_per_sec"] = round(concurrent["ops_per_sec"] * args.concurrency, 1)
+        results["set_signature_concurrent"] = concurrent
+        results["add_channel"] = await measure(
+            lambda i: db.add_channel(i % users + 1, f"@db_channel_{i}"), count
+        )
+        results["get_profile"] = await measure(lambda i: db.get_profile(i % users + 1), count)
+
+        async def get_profiles_concurrently(_: int) -> None:
+            await asyncio.gather(*(db.get_profile(u % users + 1) for u in range(args.concurrency)))
+
+        concurrent = await measure(get_profiles_concurrently, max(1, count // args.concurrency))
+        concurrent["ops_per_sec"] = round(concurrent["ops_per_sec"] * args.concurrency, 1)
+        results["get_profile_concurrent"] = concurrent
+        results["enqueue_outbox"] = await measure(
+            lambda i: db.enqueue_outbox(
+                [OutboxEntry(i % users + 1, i % users + 1, "@channel", "sendMessage", "{}")]
+            ),
+            count,
+        )
+    finally:
+        await db.close()
+    return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    """Изменение метрик относительно предыдущего запуска"""
+    before = flatten({k: previous.get(k, {}) for k in ("handlers", "database")})
+    after = flatten({k: current[k] for k in ("handlers", "database")})
+    print(f"\nСравнение с {previous.get('revision') or 'предыдущим запуском'}:")
+    for name, value in after.items():
+        old = before.get(name)
+        if not old or not name.endswith(("_per_sec", "_ms")):
+            continue
+        change = (value - old) / old * 100
+        print(f"  {name:50} {old:>12} -> {value:>12} ({change:+.1f}%)")
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    handlers = results["handlers"]
+    latency = handlers["latency"]
+    print(f"Обновлений: {handlers['updates']}, пользователей: {results['params']['users']}")
+    print(f"Обработчики: {handlers['updates_per_sec']} обновлений/с")
+    print(
+        f"Задержка: p50 {latency['p50_ms']} мс, p95 {latency['p95_ms']} мс, "
+        f"p99 {latency['p99_ms']} мс"
+    )
+    outbox = handlers["outbox"]
+    print(f"Очередь: {outbox['queued']} отправок, {outbox['deliveries_per_sec']} доставок/с")
+    print("База данных:")
+    for name, stats in results["database"].items():
+        print(f"  {name:24} {stats['ops_per_sec']:>10} оп/с, p99 {stats['p99_ms']} мс")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        handlers = await bench_handlers(args, str(Path(tmp) / "handlers.db"))
+        database = await bench_database(args, str(Path(tmp) / "database.db"))
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "python_telegram_bot": telegram.__version__,
+        "params": {
+            key: getattr(args, key)
+            for key in (
+                "updates",
+                "users",
+                "channels",
+                "concurrency",
+                "db_ops",
+                "api_latency",
+                "storage",
+                "shards",
+                "seed",
+            )
+        },
+        "handlers": handlers,
+        "database": database,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--updates", type=int, default=5000, help="число обновлений")
+    parser.add_argument("--users", type=int, default=1000, help="число пользователей")
+    parser.add_argument("--channels", type=int, default=3, help="максимум каналов на пользователя")
+    parser.add_argument("--concurrency", type=int, default=64, help="одновременных обновлений")
+    parser.add_argument("--db-ops", type=int, default=2000, help="операций на метод базы данных")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка Bot API, мс")
+    parser.add_argument("--storage", choices=BACKENDS, default="sqlite", help="хранилище")
+    parser.add_argument("--shards", type=int, default=4, help="сегментов хранилища sharded")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="ожидание очереди, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="файл для сохранения результатов в JSON")
+    parser.add_argument("--compare", type=Path, help="JSON предыдущего запуска для сравнения")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text()))
+    if args.output:
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2))
+        print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Микробенчмарк построения entities подписи для исходящего сообщения.
+
+Сравнивает прежний путь (разбор JSON и создание MessageEntity из словарей на каждое
+сообщение) со скомпилированным шаблоном, у которого entities только сдвигаются.
+
+Запуск: poetry run python -m benchmarks.bench_templates
+"""
+import json
+import timeit
+
+from telegram import MessageEntity
+
+from telegram_signature_bot.template import compile_signature, utf16_len
+
+SIGNATURE = "С уважением, Иван Иванов 👋\nCEO, Example Company\n+7 (999) 123-45-67"
+SIGNATURE_ENTITIES = [
+    MessageEntity(MessageEntity.BOLD, 13, 11),
+    MessageEntity(MessageEntity.ITALIC, 28, 20),
+    MessageEntity(MessageEntity.TEXT_LINK, 33, 15, url="https://example.com"),
+    MessageEntity(MessageEntity.PHONE_NUMBER, 49, 18),
+]
+MESSAGE = "Новый пост в канале 🎉🎉🎉 " * 20
+NUMBER = 20_000
+
+
+def rebuild_per_message(entities_json: str) -> list:
+    """Прежний путь: JSON из базы и пересчет смещений через len()"""
+    combined = []
+    for e in json.loads(entities_json):
+        combined.append(
+            MessageEntity(
+                type=e["type"],
+                offset=e["offset"] + len(MESSAGE) + 2,
+                length=e["length"],
+                url=e.get("url"),
+            )
+        )
+    return combined
+
+
+def main() -> None:
+    template = compile_signature(SIGNATURE, SIGNATURE_ENTITIES)
+    entities_json = template.entities_json()
+
+    legacy = timeit.timeit(lambda: rebuild_per_message(entities_json), number=NUMBER)
+    compiled = timeit.timeit(
+        lambda: template.shifted_entities(utf16_len(MESSAGE) + 2), number=NUMBER
+    )
+
+    print(f"Сообщений: {NUMBER}, entities в подписи: {len(SIGNATURE_ENTITIES)}")
+    print(f"Пересборка на каждое сообщение: {legacy / NUMBER * 1e6:8.2f} мкс/сообщение")
+    print(f"Скомпилированный шаблон:        {compiled / NUMBER * 1e6:8.2f} мкс/сообщение")
+    print(f"Ускорение: x{legacy / compiled:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Бенчмарк пропускной способности отправок при разных пулах соединений Bot API.
+
+Бот одновременно держит long polling getUpdates и отправляет сообщения на локальный
+сервер Bot API с задержкой ответа. Для каждого размера пула сравниваются общий пул
+для getUpdates и отправок и отдельные пулы, а для наибольшего размера еще и пул без
+keep-alive, открывающий соединение на каждый запрос. Для каждого запуска измеряются
+отправки в секунду, задержка отправки и загрузка пула.
+
+Запуск: poetry run python -m benchmarks.http_pool --messages 2000 --pool-sizes 2,8,32
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from telegram import Bot
+
+from benchmarks.bench_handlers import git_revision
+from telegram_signature_bot.fake_api import FakeTelegramServer
+from telegram_signature_bot.request import UPDATES_PROFILE, InstrumentedRequest, RequestProfile
+
+TOKEN = "123456:http_pool"
+
+
+async def long_poll(bot: Bot, timeout: int, stop: asyncio.Event) -> None:
+    """Long polling без новых обновлений, как у Updater"""
+    while not stop.is_set():
+        await bot.get_updates(timeout=timeout)
+
+
+async def measure(
+    args: argparse.Namespace, server: FakeTelegramServer, pool_size: int, mode: str
+) -> Dict[str, Any]:
+    """Отправка сообщений при одновременном long polling"""
+    # Запросы ждут свободного соединения, а не завершаются ошибкой
+    profile = RequestProfile(
+        pool_size=pool_size,
+        keepalive=0 if mode == "no_keepalive" else None,
+        pool_timeout=args.timeout,
+        read_timeout=args.timeout,
+    )
+    send_request = InstrumentedRequest(profile, "send")
+    updates_request = (
+        send_request if mode == "shared" else InstrumentedRequest(UPDATES_PROFILE, "updates")
+    )
+    bot = Bot(
+        TOKEN,
+        base_url=server.base_url,
+        request=send_request,
+        get_updates_request=updates_request,
+    )
+    await bot.initialize()
+    stop = asyncio.Event()
+    poller = asyncio.create_task(long_poll(bot, args.poll_timeout, stop))
+    # getUpdates успевает занять соединение
+    await asyncio.sleep(0.05)
+
+    latencies: List[float] = []
+    messages = iter(range(args.messages))
+
+    async def sender() -> None:
+        for index in messages:
+            started = time.perf_counter()
+            await bot.send_message(index + 1, f"pool {index}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await poller
+    stats = send_request.stats()
+    await bot.shutdown()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "pool_size": pool_size,
+        "sends_per_second": round(args.messages / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+        "max_in_flight": stats["max_in_flight"],
+        "waits": stats["waits"],
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    server = FakeTelegramServer(latency=args.api_latency / 1000)
+    await server.start()
+    runs = []
+    pool_sizes = [int(size) for size in args.pool_sizes.split(",")]
+    for pool_size in pool_sizes:
+        for mode in ("shared", "separate"):
+            runs.append(await measure(args, server, pool_size, mode))
+    runs.append(await measure(args, server, max(pool_sizes), "no_keepalive"))
+    await server.stop()
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {
+            key: getattr(args, key)
+            for key in ("messages", "concurrency", "pool_sizes", "api_latency", "poll_timeout")
+        },
+        "runs": runs,
+    }
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    params = results["params"]
+    print(
+        f"Сообщений: {params['messages']}, одновременных отправок: {params['concurrency']}, "
+        f"задержка API: {params['api_latency']} мс"
+    )
+    titles = {"shared": "общий", "separate": "отдельный", "no_keepalive": "без keep-alive"}
+    for run in results["runs"]:
+        print(
+            f"Пул {run['pool_size']:>4} ({titles[run['mode']]}): "
+            f"{run['sends_per_second']} отправок/с, p50 {run['p50_ms']} мс, "
+            f"p99 {run['p99_ms']} мс, запросов в пуле до {run['max_in_flight']}, "
+            f"ожиданий соединения {run['waits']}"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--messages", type=int, default=2000, help="число отправок")
+    parser.add_argument("--concurrency", type=int, default=64, help="одновременных отправок")
+    parser.add_argument("--pool-sizes", default="2,8,32", help="размеры пула через запятую")
+    parser.add_argument("--api-latency", type=float, default=20.0, help="задержка ответа API, мс")
+    parser.add_argument("--poll-timeout", type=int, default=1, help="таймаут getUpdates, с")
+    parser.add_argument("--timeout", type=float, default=60.0, help="таймауты запросов, с")
+    parser.add_argument("--output", type=Path, help="файл для сохранения результатов в JSON")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2))
+        print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
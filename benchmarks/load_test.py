@@ -0,0 +1,195 @@
+"""
+Сквозной нагрузочный тест: бот получает обновления через long polling от локального
+сервера Bot API и отвечает ему же по HTTP, как при работе с api.telegram.org.
+
+Проверяется весь путь: HTTP-клиент PTB, диспетчеризация Application, обработчики,
+база данных, планировщик отправки и очередь публикаций в каналы. Сервер генерирует
+сообщения с заданной скоростью и может добавлять задержку и ответы 429.
+
+Запуск: poetry run python -m benchmarks.load_test --rate 200 --updates 2000
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.bench_handlers import (
+    UNLIMITED_RATE,
+    Workload,
+    git_revision,
+    latency_report,
+    setup_profiles,
+)
+from telegram_signature_bot.bot import SignatureBot
+from telegram_signature_bot.fake_api import FakeTelegramServer, SentRequest
+from telegram_signature_bot.scheduler import SendScheduler
+
+TOKEN = "123456:load-test"
+TEXT_PREFIX = "load "
+
+
+class ReplyTracker:
+    """Сопоставление ответов бота с отправленными сообщениями по тексту"""
+
+    def __init__(self) -> None:
+        self.injected: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.channel_posts = 0
+        self.last_reply = 0.0
+
+    def text(self, index: int) -> str:
+        self.injected[index] = time.monotonic()
+        return f"{TEXT_PREFIX}{index}"
+
+    def on_request(self, sent: SentRequest) -> None:
+        if sent.method != "sendmessage":
+            return
+        chat_id = str(sent.params.get("chat_id"))
+        if not chat_id.lstrip("-").isdigit() or int(chat_id) < 0:
+            self.channel_posts += 1
+            return
+        first_line = str(sent.params.get("text", "")).split("\n", 1)[0]
+        if first_line.startswith(TEXT_PREFIX):
+            index = int(first_line[len(TEXT_PREFIX) :])
+            if index in self.injected:
+                self.latencies.append(sent.time - self.injected[index])
+                self.last_reply = sent.time
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    server = FakeTelegramServer(
+        latency=args.api_latency / 1000, flood_rate=args.flood_rate, seed=args.seed
+    )
+    tracker = ReplyTracker()
+    server.add_listener(tracker.on_request)
+    await server.start()
+
+    if args.telegram_limits:
+        scheduler = SendScheduler()
+    else:
+        scheduler = SendScheduler(
+            global_rate=UNLIMITED_RATE,
+            private_chat_rate=UNLIMITED_RATE,
+            private_chat_burst=UNLIMITED_RATE,
+            channel_rate=UNLIMITED_RATE,
+            channel_burst=UNLIMITED_RATE,
+        )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = SignatureBot(
+            TOKEN,
+            str(Path(tmp) / "load.db"),
+            scheduler=scheduler,
+            base_url=server.base_url,
+            shutdown_drain_timeout=args.timeout,
+            update_concurrency=args.update_concurrency,
+        )
+        application = bot.application
+        await application.initialize()
+        await bot.post_init(application)
+        await setup_profiles(
+            bot.db, Workload(application.bot, args.users, args.seed), args.channels
+        )
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+
+        started = time.monotonic()
+        server.start_traffic(args.rate, args.updates, args.users, tracker.text)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + args.updates / args.rate + args.timeout
+        max_lane_depth = 0
+        while len(tracker.latencies) < args.updates and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+            max_lane_depth = max(max_lane_depth, bot.update_processor.lanes.stats()["max_depth"])
+
+        # Остановка дожидается доставки очереди в каналы
+        await application.updater.stop()
+        await application.stop()
+        await bot.post_stop(application)
+        await application.shutdown()
+        await bot.post_shutdown(application)
+        await server.stop()
+        finished = time.monotonic()
+
+    replies = len(tracker.latencies)
+    elapsed = (tracker.last_reply or finished) - started
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {
+            key: getattr(args, key)
+            for key in (
+                "rate",
+                "updates",
+                "users",
+                "channels",
+                "update_concurrency",
+                "api_latency",
+                "flood_rate",
+                "telegram_limits",
+                "seed",
+            )
+        },
+        "replies": replies,
+        "lost": args.updates - replies,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(replies / elapsed, 1) if elapsed > 0 else 0.0,
+        "latency": latency_report(tracker.latencies),
+        "channel_posts": tracker.channel_posts,
+        "max_lane_depth": max_lane_depth,
+        "flood_responses": server.flood_responses,
+        "scheduler_retries": scheduler.retries,
+        "api_requests": len(server.sent),
+    }
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    latency = results["latency"]
+    params = results["params"]
+    print(f"Отправлено {params['updates']} сообщений со скоростью {params['rate']}/с")
+    print(f"Ответов: {results['replies']}, без ответа: {results['lost']}")
+    print(f"Сквозная пропускная способность: {results['updates_per_sec']} обновлений/с")
+    print(
+        f"Задержка до ответа: p50 {latency['p50_ms']} мс, p95 {latency['p95_ms']} мс, "
+        f"p99 {latency['p99_ms']} мс"
+    )
+    print(f"Публикаций в каналы: {results['channel_posts']}")
+    print(f"Ответов 429: {results['flood_responses']}, повторов: {results['scheduler_retries']}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--rate", type=float, default=200, help="сообщений в секунду")
+    parser.add_argument("--updates", type=int, default=2000, help="число сообщений")
+    parser.add_argument("--users", type=int, default=500, help="число пользователей")
+    parser.add_argument("--channels", type=int, default=2, help="максимум каналов на пользователя")
+    parser.add_argument(
+        "--update-concurrency", type=int, default=64, help="одновременно обрабатываемых обновлений"
+    )
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа API, мс")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument(
+        "--telegram-limits",
+        action="store_true",
+        help="ограничения скорости отправки как для настоящего Telegram",
+    )
+    parser.add_argument("--timeout", type=float, default=30.0, help="ожидание после генерации, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="файл для сохранения результатов в JSON")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2))
+        print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Бенчмарк старта бота со снимком профилей и без него.
+
+База заполняется профилями пользователей, после чего бот дважды запускается на
+локальном сервере Bot API с заранее накопленными сообщениями активных пользователей:
+сначала со снимком, записанным при предыдущей остановке, затем без него. Для каждого
+запуска измеряются загрузка снимка, время от запуска до первого обновления и первого
+ответа, время ответа на все накопленные сообщения и число чтений профилей из базы.
+
+Файлы базы после заполнения остаются в кэше страниц ОС, поэтому холодный старт здесь
+оптимистичнее, чем после перезапуска машины.
+
+Запуск: poetry run python -m benchmarks.startup --users 20000 --active 5000
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.bench_handlers import UNLIMITED_RATE, Workload, git_revision, setup_profiles
+from telegram_signature_bot.bot import SignatureBot
+from telegram_signature_bot.fake_api import FakeTelegramServer, SentRequest
+from telegram_signature_bot.scheduler import SendScheduler
+
+TOKEN = "123456:startup"
+TEXT_PREFIX = "startup "
+
+
+class FirstReplies:
+    """Время ответов на накопленные сообщения"""
+
+    def __init__(self) -> None:
+        self.times: List[float] = []
+
+    def on_request(self, sent: SentRequest) -> None:
+        if sent.method != "sendmessage" or str(sent.params.get("chat_id")).startswith("@"):
+            return
+        if str(sent.params.get("text", "")).startswith(TEXT_PREFIX):
+            self.times.append(sent.time)
+
+
+def make_bot(args: argparse.Namespace, base_url: str, db_path: Path) -> SignatureBot:
+    return SignatureBot(
+        TOKEN,
+        str(db_path),
+        scheduler=SendScheduler(
+            global_rate=UNLIMITED_RATE,
+            private_chat_rate=UNLIMITED_RATE,
+            private_chat_burst=UNLIMITED_RATE,
+            channel_rate=UNLIMITED_RATE,
+            channel_burst=UNLIMITED_RATE,
+        ),
+        base_url=base_url,
+        snapshot_path=str(db_path.with_name(db_path.name + ".snapshot")),
+        snapshot_size=args.snapshot_size,
+    )
+
+
+async def prepare(args: argparse.Namespace, db_path: Path) -> None:
+    """Заполнение базы и остановка бота, обслужившего активных пользователей"""
+    # Запросы к Bot API не нужны, поэтому Application не инициализируется
+    bot = make_bot(args, "http://127.0.0.1/bot", db_path)
+    application = bot.application
+    await bot.post_init(application)
+    await setup_profiles(bot.db, Workload(application.bot, args.users, args.seed), args.channels)
+    for user_id in range(1, args.active + 1):
+        await bot.db.get_profile(user_id)
+    await bot.post_stop(application)
+    await bot.post_shutdown(application)
+
+
+async def start(args: argparse.Namespace, db_path: Path, snapshot: bool) -> Dict[str, Any]:
+    """Запуск бота с накопленными сообщениями и ожидание ответов на них"""
+    server = FakeTelegramServer(latency=args.api_latency / 1000, seed=args.seed)
+    replies = FirstReplies()
+    server.add_listener(replies.on_request)
+    await server.start()
+    for index in range(args.active):
+        await server.inject_text(index + 1, f"{TEXT_PREFIX}{index}")
+
+    bot = make_bot(args, server.base_url, db_path)
+    if not snapshot:
+        Path(bot.snapshot_path).unlink(missing_ok=True)
+    application = bot.application
+    started = time.monotonic()
+    await application.initialize()
+    await bot.post_init(application)
+    initialized = time.monotonic()
+    loaded = len(bot.db.cache)
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=10)
+
+    deadline = started + args.timeout
+    while len(replies.times) < args.active and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+    stats = bot.db.cache.stats()
+    await application.updater.stop()
+    await application.stop()
+    await bot.post_stop(application)
+    await application.shutdown()
+    await bot.post_shutdown(application)
+    await server.stop()
+
+    def since_start(at: Optional[float]) -> Optional[float]:
+        return round((at - started) * 1000, 1) if at is not None else None
+
+    return {
+        "snapshot_profiles": loaded,
+        "post_init_ms": round((initialized - started) * 1000, 1),
+        "first_update_ms": since_start(
+            bot.started_at + bot.first_update_after
+            if bot.started_at is not None and bot.first_update_after is not None
+            else None
+        ),
+        "first_reply_ms": since_start(replies.times[0] if replies.times else None),
+        "all_replies_ms": since_start(max(replies.times) if replies.times else None),
+        "replies": len(replies.times),
+        "cache_hits": stats["hits"],
+        "db_profile_reads": stats["misses"],
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "startup.db"
+        await prepare(args, db_path)
+        # Сначала со снимком: запуск без снимка изменил бы файлы базы и сделал его устаревшим
+        warm = await start(args, db_path, snapshot=True)
+        cold = await start(args, db_path, snapshot=False)
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {
+            key: getattr(args, key)
+            for key in ("users", "active", "channels", "snapshot_size", "api_latency", "seed")
+        },
+        "with_snapshot": warm,
+        "without_snapshot": cold,
+    }
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    params = results["params"]
+    print(f"Пользователей: {params['users']}, активных: {params['active']}")
+    for name, title in (("with_snapshot", "Со снимком"), ("without_snapshot", "Без снимка")):
+        run = results[name]
+        print(
+            f"{title}: профилей в снимке {run['snapshot_profiles']}, "
+            f"post_init {run['post_init_ms']} мс, первое обновление {run['first_update_ms']} мс, "
+            f"первый ответ {run['first_reply_ms']} мс, "
+            f"{run['replies']} ответов за {run['all_replies_ms']} мс, "
+            f"чтений профилей из базы {run['db_profile_reads']}"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--users", type=int, default=20000, help="число пользователей в базе")
+    parser.add_argument("--active", type=int, default=2000, help="сообщений активных пользователей")
+    parser.add_argument("--channels", type=int, default=1, help="максимум каналов на пользователя")
+    parser.add_argument("--snapshot-size", type=int, default=50000, help="профилей в снимке")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа API, мс")
+    parser.add_argument("--timeout", type=float, default=60.0, help="ожидание ответов, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="файл для сохранения результатов в JSON")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2))
+        print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Сборка альбомов: сообщения с общим media_group_id приходят отдельными обновлениями,
+поэтому они накапливаются в течение короткого окна и обрабатываются одной пачкой.
+
+Альбом обрабатывается по окончании окна или раньше, если вызвана flush_matching,
+например при следующем обновлении того же пользователя: так альбом публикуется
+до отправленных после него сообщений.
+"""
+import asyncio
+import logging
+from typing import (
+    AsyncContextManager,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    TypeVar,
+    Union,
+)
+
+from telegram import (
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
+    Message,
+    MessageEntity,
+)
+
+T = TypeVar("T")
+
+# Элементы, которые можно отправить в send_media_group
+AlbumMedia = Union[InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo]
+
+# Окно ожидания следующего элемента альбома в секундах
+DEFAULT_ALBUM_WINDOW = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingAlbum(Generic[T]):
+    __slots__ = ("items", "deadline")
+
+    def __init__(self, deadline: float):
+        self.items: List[T] = []
+        self.deadline = deadline
+
+
+class AlbumCollector(Generic[T]):
+    """Буфер элементов альбомов с отложенной обработкой.
+
+    Окно отсчитывается от последнего полученного элемента, поэтому альбом
+    обрабатывается после того, как новые элементы перестали приходить. По окончании
+    окна альбом обрабатывается под guard(key), если он задан: например, в очереди
+    обновлений пользователя, чтобы не обогнать его следующие сообщения.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[T]], Awaitable[None]],
+        window: float = DEFAULT_ALBUM_WINDOW,
+        guard: Optional[Callable[[Hashable], AsyncContextManager[None]]] = None,
+    ):
+        self.flush = flush
+        self.window = window
+        self.guard = guard
+        self._pending: Dict[Hashable, _PendingAlbum[T]] = {}
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, key: Hashable, item: T) -> None:
+        """Добавление элемента в альбом, первый элемент запускает таймер"""
+        loop = asyncio.get_running_loop()
+        album = self._pending.get(key)
+        if album is None:
+            album = _PendingAlbum(loop.time() + self.window)
+            self._pending[key] = album
+            task = asyncio.create_task(self._flush_later(key, album))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            album.deadline = loop.time() + self.window
+        album.items.append(item)
+
+    async def close(self) -> None:
+        """Немедленная обработка всех накопленных альбомов"""
+        for task in list(self._tasks):
+            task.cancel()
+        pending, self._pending = self._pending, {}
+        for album in pending.values():
+            await self._run_flush(album.items)
+
+    async def flush_matching(self, match: Callable[[Hashable], bool]) -> None:
+        """Немедленная обработка накопленных альбомов с подходящим ключом без guard"""
+        for key in [key for key in self._pending if match(key)]:
+            album = self._pending.pop(key)
+            await self._run_flush(album.items)
+
+    async def _flush_later(self, key: Hashable, album: _PendingAlbum[T]) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Ждем, пока с последнего элемента не пройдет полное окно
+            while (delay := album.deadline - loop.time()) > 0:
+                await asyncio.sleep(delay)
+            if self.guard is None:
+                await self._flush_if_due(key, album)
+                return
+            async with self.guard(key):
+                # Пока ждали guard, могли прийти новые элементы
+                if album.deadline <= loop.time() or self._pending.get(key) is not album:
+                    await self._flush_if_due(key, album)
+                    return
+
+    async def _flush_if_due(self, key: Hashable, album: _PendingAlbum[T]) -> None:
+        # Альбом мог быть уже обработан через flush_matching
+        if self._pending.get(key) is album:
+            del self._pending[key]
+            await self._run_flush(album.items)
+
+    async def _run_flush(self, items: List[T]) -> None:
+        try:
+            await self.flush(items)
+        except Exception:
+            logger.exception("Error sending album")
+
+
+def input_media(
+    message: Message, caption: str, caption_entities: Sequence[MessageEntity]
+) -> Optional[AlbumMedia]:
+    """Элемент send_media_group для сообщения альбома"""
+    text = caption or None
+    entities = list(caption_entities) or None
+    if message.photo:
+        return InputMediaPhoto(message.photo[-1].file_id, caption=text, caption_entities=entities)
+    if message.video:
+        return InputMediaVideo(message.video.file_id, caption=text, caption_entities=entities)
+    if message.document:
+        return InputMediaDocument(message.document.file_id, caption=text, caption_entities=entities)
+    if message.audio:
+        return InputMediaAudio(message.audio.file_id, caption=text, caption_entities=entities)
+    return None
@@ -1,83 +1,504 @@
+import asyncio
+import functools
 import logging
-from typing import List
-
-from telegram import MessageEntity, Update
+import signal
+import time
+from typing import (
+    Any,
+    AsyncContextManager,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    cast,
+)
+
+from telegram import Message, MessageEntity, Update
 from telegram.error import TelegramError
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
-
+from telegram.ext import (
+    Application,
+    CommandHandler,
+    ContextTypes,
+    MessageHandler,
+    TypeHandler,
+    filters,
+)
+
+from .albums import DEFAULT_ALBUM_WINDOW, AlbumCollector, AlbumMedia, input_media
+from .cache import ProfileCache
 from .database import Database
+from .dedup import (
+    DEFAULT_DEDUP_CAPACITY,
+    HIGH_WATER_INTERVAL,
+    HIGH_WATER_META_KEY,
+    UpdateDeduplicator,
+)
+from .lanes import DEFAULT_UPDATE_CONCURRENCY, LaneUpdateProcessor
+from .media import MEDIA_FILTER, media_file_id, media_kind
+from .metrics import REGISTRY, F, MetricsServer, timed
+from .outbox import (
+    DEFAULT_FAN_OUT_LIMIT,
+    DEFAULT_MESSAGE_MAP_TTL,
+    Outbox,
+    OutboxRequest,
+    api_method,
+)
+from .permissions import DEFAULT_ACCESS_TTL, ChannelAccessCache
+from .profiler import DEFAULT_PROFILE_SECONDS, MAX_PROFILE_SECONDS, PROFILER
+from .request import SEND_PROFILE, UPDATES_PROFILE, InstrumentedRequest, RequestProfile
+from .scheduler import PRIORITY_REPLY, SendScheduler
+from .snapshot import DEFAULT_SNAPSHOT_SIZE, load_snapshot, write_snapshot
+from .splitting import CAPTION_LIMIT, TEXT_LIMIT, Part, split_message
+from .storage import Storage
+from .template import SignatureTemplate, shift_entity, utf16_len
+from .webhook import WebhookConfig, WebhookServer
+from .writebatch import DEFAULT_WRITE_WINDOW
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    "signature_bot_handler_seconds", "Длительность обработки обновлений", ["handler"]
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "signature_bot_handler_errors_total", "Необработанные ошибки обработчиков", ["handler"]
+)
+
+# Ключ альбома: пользователь, чат и media_group_id
+AlbumKey = Tuple[int, int, str]
+
+
+def text_requests(parts: Sequence[Part], method: str = "sendMessage") -> List[OutboxRequest]:
+    """Запросы sendMessage (или editMessageText) для частей текста"""
+    return [
+        OutboxRequest(method, {"text": text, "entities": entities or None})
+        for text, entities in parts
+    ]
+
+
+def edit_requests(message: Message, template: SignatureTemplate) -> List[OutboxRequest]:
+    """Правки опубликованных частей сообщения по одной на часть, как при публикации.
+
+    Пустой список, если сообщение нельзя исправить: у стикеров и видеосообщений нет caption.
+    """
+    if message.text is not None:
+        parts = split_message(message.text, message.entities or (), template)
+        return text_requests(parts, "editMessageText")
+    kind = media_kind(message)
+    if kind is None or not kind.supports_caption:
+        return []
+    (caption, caption_entities), *overflow = split_message(
+        message.caption or "", message.caption_entities or (), template, first_limit=CAPTION_LIMIT
+    )
+    caption_request = OutboxRequest(
+        "editMessageCaption", {"caption": caption, "caption_entities": caption_entities or None}
+    )
+    return [caption_request, *text_requests(overflow, "editMessageText")]
+
+
+def timed_handler(callback: F) -> F:
+    """Учет длительности и ошибок обработчика в метриках и в профилировании"""
+    name = callback.__name__
+    return timed(HANDLER_SECONDS, HANDLER_ERRORS, name)(PROFILER.traced(name)(callback))
 
 
 class SignatureBot:
-    def __init__(self, token: str, db_name: str = "signatures.db"):
-        self.application = Application.builder().token(token).build()
-        self.db = Database(db_name)
+    def __init__(
+        self,
+        token: str,
+        db_name: str = "signatures.db",
+        profile_cache: Optional[ProfileCache] = None,
+        channel_concurrency: int = DEFAULT_FAN_OUT_LIMIT,
+        scheduler: Optional[SendScheduler] = None,
+        album_window: float = DEFAULT_ALBUM_WINDOW,
+        outbox_max_attempts: int = 5,
+        shutdown_drain_timeout: float = 5.0,
+        base_url: Optional[str] = None,
+        metrics_port: Optional[int] = None,
+        metrics_host: str = "127.0.0.1",
+        write_window: float = DEFAULT_WRITE_WINDOW,
+        channel_access_ttl: float = DEFAULT_ACCESS_TTL,
+        storage: Optional[Storage] = None,
+        snapshot_path: Optional[str] = None,
+        snapshot_size: int = DEFAULT_SNAPSHOT_SIZE,
+        update_concurrency: int = DEFAULT_UPDATE_CONCURRENCY,
+        dedup_capacity: int = DEFAULT_DEDUP_CAPACITY,
+        send_profile: Optional[RequestProfile] = None,
+        updates_profile: Optional[RequestProfile] = None,
+        send_request: Optional[InstrumentedRequest] = None,
+        message_map_ttl: float = DEFAULT_MESSAGE_MAP_TTL,
+        admin_ids: Sequence[int] = (),
+        profile_dir: str = "profiles",
+        profile_seconds: float = 0.0,
+    ):
+        # Повторно доставленные обновления отбрасываются до обработчиков
+        self.deduplicator = UpdateDeduplicator(dedup_capacity)
+        self._high_water_saved: Optional[str] = None
+        self._high_water_task: Optional["asyncio.Task[None]"] = None
+        # Обновления разных пользователей обрабатываются параллельно, одного - по порядку
+        self.update_processor = LaneUpdateProcessor(
+            update_concurrency, deduplicator=self.deduplicator
+        )
+        # Отдельные пулы соединений для getUpdates и для отправок
+        # Пул отправок может быть общим для нескольких ботов процесса
+        self.send_request = (
+            send_request
+            if send_request is not None
+            else InstrumentedRequest(send_profile or SEND_PROFILE, "send")
+        )
+        self.updates_request = InstrumentedRequest(updates_profile or UPDATES_PROFILE, "updates")
+        builder = (
+            Application.builder()
+            .token(token)
+            .request(self.send_request)
+            .get_updates_request(self.updates_request)
+            .concurrent_updates(self.update_processor)
+        )
+        if base_url is not None:
+            # Другой сервер Bot API: локальный сервер Telegram или тестовая замена
+            builder = builder.base_url(base_url)
+        self.application = (
+            builder.post_init(self.post_init)
+            .post_stop(self.post_stop)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
+        # По умолчанию один файл SQLite; другое хранилище создается через create_storage
+        self.db_name = db_name
+        self.db: Storage = (
+            storage
+            if storage is not None
+            else Database(db_name, cache=profile_cache, write_window=write_window)
+        )
+        self.channel_concurrency = channel_concurrency
+        # Все исходящие запросы к Bot API проходят через планировщик
+        self.sender = scheduler if scheduler is not None else SendScheduler()
+        # Проверенные каналы; канал с неудачной отправкой проверяется заново
+        self.channel_access = ChannelAccessCache(channel_access_ttl)
+        # Отправки в каналы сохраняются в базе данных и доставляются в фоне
+        self.outbox = Outbox(
+            self.db,
+            self.sender,
+            workers=channel_concurrency,
+            max_attempts=outbox_max_attempts,
+            on_channel_error=self.channel_access.invalidate,
+            message_map_ttl=message_map_ttl,
+        )
+        self.shutdown_drain_timeout = shutdown_drain_timeout
+        self.send_album = timed_handler(self.handle_album)
+        # Альбом публикуется в очереди обновлений пользователя, не обгоняя его сообщения
+        self.albums: AlbumCollector[Tuple[Update, ContextTypes.DEFAULT_TYPE]] = AlbumCollector(
+            self.flush_album, album_window, guard=self.album_lane
+        )
+        self.metrics = (
+            MetricsServer(metrics_host, metrics_port) if metrics_port is not None else None
+        )
+        # Снимок профилей активных пользователей между перезапусками
+        self.snapshot_path = snapshot_path
+        self.snapshot_size = snapshot_size
+        self.started_at: Optional[float] = None
+        # Пользователи, которым доступна команда /profile
+        self.admin_ids = frozenset(admin_ids)
+        self.profile_dir = profile_dir
+        # Профилирование с момента запуска, 0 - отключено
+        self.profile_seconds = profile_seconds
+        self._profile_task: Optional["asyncio.Task[None]"] = None
+        # Время от запуска до первого обновления, для оценки холодного старта
+        self.first_update_after: Optional[float] = None
         self.setup_handlers()
         self.logger = logging.getLogger(__name__)
 
+    async def post_init(self, application: Application) -> None:
+        """Загрузка снимка профилей, открытие базы данных и запуск доставки отправок"""
+        self.started_at = time.monotonic()
+        if self.snapshot_path is not None:
+            # До открытия базы: проверка актуальности снимка сравнивает время изменения файлов
+            loaded = load_snapshot(self.db.cache, self.snapshot_path, self.db_name)
+            if loaded:
+                self.logger.info(
+                    f"Loaded {loaded} profiles from snapshot in "
+                    f"{(time.monotonic() - self.started_at) * 1000:.1f} ms"
+                )
+        await self.db.connect()
+        self._high_water_saved = await self.db.get_meta(HIGH_WATER_META_KEY)
+        self.deduplicator.restore(self._high_water_saved)
+        self._high_water_task = asyncio.create_task(self.persist_high_water())
+        await self.outbox.start(application.bot)
+        if self.metrics is not None:
+            self.register_metrics()
+            await self.metrics.start()
+        if self.profile_seconds > 0:
+            if PROFILER.running:
+                self.logger.warning("Profiler is already running, startup profiling skipped")
+            else:
+                self.start_profile(self.profile_seconds)
+
+    async def post_stop(self, application: Application) -> None:
+        """Отправка накопленных альбомов, остановка очереди и планировщика.
+
+        Выполняется после остановки приема обновлений, но до application.shutdown():
+        после него HTTP клиент бота закрыт и отправки невозможны.
+        """
+        await self.albums.close()
+        if self._profile_task is not None:
+            # Незавершенное профилирование останавливается без записи результатов
+            self._profile_task.cancel()
+            await asyncio.gather(self._profile_task, return_exceptions=True)
+            self._profile_task = None
+        # Даем очереди немного времени, остальное будет доставлено после перезапуска
+        await self.outbox.drain(self.shutdown_drain_timeout)
+        await self.outbox.stop()
+        await self.sender.close()
+
+    async def post_shutdown(self, application: Application) -> None:
+        """Сохранение границы обновлений, закрытие базы и запись снимка профилей"""
+        if self.metrics is not None:
+            await self.metrics.stop()
+        if self._high_water_task is not None:
+            self._high_water_task.cancel()
+            await asyncio.gather(self._high_water_task, return_exceptions=True)
+            self._high_water_task = None
+        await self.save_high_water()
+        await self.db.close()
+        if self.snapshot_path is not None and self.snapshot_size > 0:
+            # После закрытия базы, чтобы снимок был новее ее файлов
+            saved = write_snapshot(self.db.cache, self.snapshot_path, self.snapshot_size)
+            self.logger.info(f"Saved {saved} profiles to snapshot {self.snapshot_path}")
+
+    async def save_high_water(self) -> None:
+        """Сохранение границы обработанных обновлений, если она изменилась"""
+        value = self.deduplicator.dump()
+        if value != self._high_water_saved:
+            await self.db.set_meta(HIGH_WATER_META_KEY, value)
+            self._high_water_saved = value
+
+    async def persist_high_water(self) -> None:
+        """Периодическое сохранение границы: после сбоя повторятся только последние обновления"""
+        while True:
+            await asyncio.sleep(HIGH_WATER_INTERVAL)
+            try:
+                await self.save_high_water()
+            except Exception as e:
+                self.logger.error(f"Error saving update high water mark: {str(e)}")
+
+    async def first_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Учет времени от запуска до первого обновления"""
+        if self.first_update_after is None and self.started_at is not None:
+            self.first_update_after = time.monotonic() - self.started_at
+            self.logger.info(f"First update received {self.first_update_after:.3f} s after start")
+
+    async def flush_albums(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Публикация ожидающих альбомов пользователя перед его следующим обновлением"""
+        if update.effective_user is None or not len(self.albums):
+            return
+        user_id = update.effective_user.id
+        media_group_id = update.message.media_group_id if update.message else None
+        await self.albums.flush_matching(
+            lambda key: cast(AlbumKey, key)[0] == user_id
+            and cast(AlbumKey, key)[2] != media_group_id
+        )
+
+    def album_lane(self, key: Hashable) -> AsyncContextManager[None]:
+        """Очередь обновлений пользователя, отправившего альбом"""
+        user_id, _, _ = cast(AlbumKey, key)
+        return self.update_processor.lanes.hold(user_id)
+
+    async def reply_text(self, update: Update, text: str, **kwargs: Any) -> Message:
+        """Текстовый ответ пользователю через планировщик отправки"""
+        message = update.message or update.edited_message
+        assert message is not None
+        return await self.sender.send(
+            message.chat_id, lambda: message.reply_text(text, **kwargs), PRIORITY_REPLY
+        )
+
     def setup_handlers(self) -> None:
         """Настройка обработчиков команд"""
-        self.application.add_handler(CommandHandler("start", self.start))
-        self.application.add_handler(CommandHandler("set_signature", self.set_signature))
-        self.application.add_handler(CommandHandler("remove_signature", self.remove_signature))
-        self.application.add_handler(CommandHandler("show_signature", self.show_signature))
-        self.application.add_handler(CommandHandler("set_channel", self.set_channel))
-        self.application.add_handler(CommandHandler("remove_channel", self.remove_channel))
-        self.application.add_handler(CommandHandler("show_channel", self.show_channel))
-
-        # Обработчики сообщений
+        commands = {
+            "start": self.start,
+            "set_signature": self.set_signature,
+            "remove_signature": self.remove_signature,
+            "show_signature": self.show_signature,
+            "set_channel": self.set_channel,
+            "add_channel": self.add_channel,
+            "remove_channel": self.remove_channel,
+            "show_channel": self.show_channel,
+            "profile": self.profile,
+        }
+        # Отдельная группа: обработчик не мешает выбору обработчика в основной группе
+        self.application.add_handler(TypeHandler(Update, self.first_update), group=-1)
+        # Ожидающие альбомы пользователя публикуются раньше его следующего сообщения
+        self.application.add_handler(TypeHandler(Update, self.flush_albums), group=-2)
+        for command, callback in commands.items():
+            self.application.add_handler(CommandHandler(command, timed_handler(callback)))
+
+        # Обработчики новых сообщений; правки обрабатываются отдельно и не публикуются заново
+        new_message = filters.UpdateType.MESSAGE
         self.application.add_handler(
-            MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message)
+            MessageHandler(
+                new_message & filters.TEXT & ~filters.COMMAND, timed_handler(self.handle_message)
+            )
         )
-        # Добавляем обработчики медиафайлов
-        self.application.add_handler(MessageHandler(filters.PHOTO, self.handle_media))
-        self.application.add_handler(MessageHandler(filters.VIDEO, self.handle_media))
+        # Один обработчик для всех поддерживаемых типов медиафайлов
         self.application.add_handler(
-            MessageHandler(filters.AUDIO | filters.VOICE, self.handle_media)
+            MessageHandler(new_message & MEDIA_FILTER, timed_handler(self.handle_media))
+        )
+        self.application.add_handler(
+            MessageHandler(filters.UpdateType.EDITED_MESSAGE, timed_handler(self.handle_edit))
         )
 
+    def register_metrics(self) -> None:
+        """Метрики, значения которых считываются из объектов бота при запросе /metrics"""
+        cache = self.db.cache
+        REGISTRY.callback(
+            "signature_bot_profile_cache_requests_total",
+            "Обращения к кэшу профилей",
+            lambda: {("hit",): cache.hits, ("miss",): cache.misses},
+            ["result"],
+            "counter",
+        )
+        REGISTRY.callback(
+            "signature_bot_profile_cache_evictions_total",
+            "Вытеснения из кэша профилей по размеру и по сроку жизни",
+            lambda: {("size",): cache.evictions, ("ttl",): cache.expirations},
+            ["reason"],
+            "counter",
+        )
+        REGISTRY.callback(
+            "signature_bot_profile_cache_entries", "Записей в кэше профилей", lambda: len(cache)
+        )
+        REGISTRY.callback(
+            "signature_bot_profile_cache_bytes",
+            "Оценка памяти кэша профилей",
+            lambda: cache.size_bytes,
+        )
+        REGISTRY.callback(
+            "signature_bot_update_queue_size",
+            "Обновления, ожидающие обработки",
+            lambda: self.application.update_queue.qsize(),
+        )
+        REGISTRY.callback(
+            "signature_bot_update_lane_updates",
+            "Обновления в очередях пользователей: выполняемые и ожидающие своей очереди",
+            lambda: {
+                ("running",): self.update_processor.running,
+                ("waiting",): self.update_processor.lanes.stats()["waiting"],
+            },
+            ["state"],
+        )
+        REGISTRY.callback(
+            "signature_bot_update_lanes",
+            "Пользователи с обновлениями в обработке",
+            lambda: len(self.update_processor.lanes),
+        )
+        REGISTRY.callback(
+            "signature_bot_update_lane_max_depth",
+            "Обновления в самой длинной очереди пользователя",
+            lambda: self.update_processor.lanes.stats()["max_depth"],
+        )
+        pools = (self.send_request, self.updates_request)
+        REGISTRY.callback(
+            "signature_bot_telegram_pool_connections",
+            "Размер пула соединений Bot API",
+            lambda: {(request.pool,): request.profile.pool_size for request in pools},
+            ["pool"],
+        )
+        REGISTRY.callback(
+            "signature_bot_telegram_pool_in_flight",
+            "Выполняемые запросы к Bot API по пулам соединений",
+            lambda: {(request.pool,): request.in_flight for request in pools},
+            ["pool"],
+        )
+        REGISTRY.callback(
+            "signature_bot_telegram_pool_waits_total",
+            "Запросы к Bot API, начатые при занятых соединениях пула",
+            lambda: {(request.pool,): request.waits for request in pools},
+            ["pool"],
+            "counter",
+        )
+        REGISTRY.callback(
+            "signature_bot_telegram_pool_timeouts_total",
+            "Запросы к Bot API, не дождавшиеся свободного соединения",
+            lambda: {(request.pool,): request.pool_timeouts for request in pools},
+            ["pool"],
+            "counter",
+        )
+        REGISTRY.callback(
+            "signature_bot_send_queue_size",
+            "Запросы в очереди планировщика отправки",
+            lambda: self.sender.queue_size,
+        )
+        REGISTRY.callback(
+            "signature_bot_send_retries_total",
+            "Повторы отправки после ответа 429",
+            lambda: self.sender.retries,
+            type="counter",
+        )
+        REGISTRY.callback(
+            "signature_bot_pending_albums", "Альбомы, ожидающие сборки", lambda: len(self.albums)
+        )
+        REGISTRY.callback(
+            "signature_bot_outbox_items",
+            "Записи очереди отправок в каналы по статусам",
+            self.outbox_items,
+            ["status"],
+        )
+        REGISTRY.callback(
+            "signature_bot_outbox_deliveries_total",
+            "Результаты попыток доставки в каналы",
+            lambda: {
+                ("delivered",): self.outbox.delivered,
+                ("retried",): self.outbox.retried,
+                ("dead",): self.outbox.dead,
+            },
+            ["result"],
+            "counter",
+        )
+
+    async def outbox_items(self) -> Dict[Tuple[str, ...], float]:
+        stats = await self.db.outbox_stats()
+        return {(status,): stats.get(status, 0) for status in ("pending", "inflight", "dead")}
+
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обработчик команды /start"""
-        await update.message.reply_text(
+        await self.reply_text(
+            update,
             "Привет! Я бот для автоматического добавления подписи к сообщениям.\n\n"
             "Доступные команды:\n"
             "/set_signature <подпись> - установить подпись (поддерживается форматирование)\n"
             "/remove_signature - удалить подпись\n"
             "/show_signature - показать текущую подпись\n"
             "/set_channel @channel_name - установить канал для публикации\n"
-            "/remove_channel - удалить канал\n"
-            "/show_channel - показать текущий канал\n\n"
-            "Поддерживаются текстовые сообщения, фото, видео, аудио и голосовые сообщения."
+            "/add_channel @channel_name - добавить еще один канал\n"
+            "/remove_channel [@channel_name] - удалить канал или все каналы\n"
+            "/show_channel - показать текущие каналы\n"
+            "/profile [секунды] - профилирование бота (для администраторов)\n\n"
+            "Поддерживаются текстовые сообщения, фото, видео, анимации, аудио, голосовые "
+            "и видеосообщения, документы и стикеры.",
         )
 
     def extract_signature_entities(
         self, message: str, original_entities: List[MessageEntity], start_index: int
     ) -> List[MessageEntity]:
-        """Извлекает entities для подписи из сообщения"""
-        signature_entities = []
-        for entity in original_entities:
+        """Извлекает entities для подписи из сообщения.
+
+        start_index - позиция начала подписи в кодовых единицах UTF-16.
+        """
+        return [
+            shift_entity(entity, -start_index)
+            for entity in original_entities
             # Проверяем, относится ли entity к тексту подписи
-            if entity.offset >= start_index:
-                # Создаем новый entity с обновленным смещением
-                new_offset = entity.offset - start_index
-
-                # Для ссылок просто используем MessageEntity с типом TEXT_LINK
-                new_entity = MessageEntity(
-                    type=entity.type,
-                    offset=new_offset,
-                    length=entity.length,
-                    url=entity.url if entity.type == MessageEntity.TEXT_LINK else None,
-                )
-                signature_entities.append(new_entity)
-        return signature_entities
+            if entity.offset >= start_index
+        ]
 
     async def set_signature(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Установка подписи пользователя"""
         if not context.args:
-            await update.message.reply_text(
+            await self.reply_text(
+                update,
                 "Пожалуйста, укажите подпись после команды.\n"
                 "Пример: /set_signature С уважением, Иван\n\n"
-                "Поддерживается форматирование текста (выделение жирным, курсивом, ссылки и т.д.)"
+                "Поддерживается форматирование текста (выделение жирным, курсивом, ссылки и т.д.)",
             )
             return
 
@@ -90,205 +511,346 @@ class SignatureBot:
         else:
             signature = full_message[command_end + 1 :]
             signature_entities = self.extract_signature_entities(
-                full_message, update.message.entities or [], command_end + 1
+                full_message,
+                update.message.entities or [],
+                utf16_len(full_message[: command_end + 1]),
             )
 
         user_id = update.effective_user.id
-        self.db.set_signature(user_id, signature, signature_entities)
+        template = await self.db.set_signature(user_id, signature, signature_entities)
 
         # Показываем сохраненную подпись с форматированием
         message_prefix = "Подпись установлена:\n"
-        await update.message.reply_text(
-            f"{message_prefix}{signature}",
-            entities=[
-                MessageEntity(
-                    type=e.type,
-                    offset=e.offset + len(message_prefix),
-                    length=e.length,
-                    url=e.url if e.type == MessageEntity.TEXT_LINK else None,
-                )
-                for e in signature_entities
-            ],
+        await self.reply_text(
+            update,
+            f"{message_prefix}{template.text}",
+            entities=list(template.shifted_entities(utf16_len(message_prefix))),
         )
 
     async def show_signature(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Показ текущей подписи пользователя"""
         user_id = update.effective_user.id
-        signature, entities = self.db.get_signature(user_id)
+        template = (await self.db.get_profile(user_id)).template
         message_prefix = "Ваша текущая подпись:\n"
 
-        if signature:
-            # Преобразуем сохраненные entities обратно в объекты MessageEntity
-            telegram_entities = []
-            if entities:
-                for e in entities:
-                    entity = MessageEntity(
-                        type=e["type"],
-                        offset=e["offset"] + len(message_prefix),
-                        length=e["length"],
-                        url=e.get("url"),
-                    )
-                    telegram_entities.append(entity)
-
-            await update.message.reply_text(
-                f"{message_prefix}{signature}", entities=telegram_entities
+        if template and template.text:
+            await self.reply_text(
+                update,
+                f"{message_prefix}{template.text}",
+                entities=list(template.shifted_entities(utf16_len(message_prefix))),
             )
         else:
-            await update.message.reply_text("У вас нет установленной подписи.")
+            await self.reply_text(update, "У вас нет установленной подписи.")
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обработка входящих сообщений"""
         user_id = update.effective_user.id
-        signature, signature_entities = self.db.get_signature(user_id)
-        channel = self.db.get_channel(user_id)
-
-        if signature:
-            # Копируем оригинальное сообщение и его форматирование
-            original_message = update.message.text or ""
-            original_entities = list(update.message.entities or [])
-
-            # Добавляем подпись с переносом строк
-            message_with_signature = f"{original_message}\n\n{signature}"
-
-            # Объединяем entities из сообщения и подписи
-            combined_entities = list(original_entities)
-            if signature_entities:
-                # Преобразуем сохраненные entities подписи
-                for e in signature_entities:
-                    new_offset = e["offset"] + len(original_message) + 2
-                    entity = MessageEntity(
-                        type=e["type"], offset=new_offset, length=e["length"], url=e.get("url")
-                    )
-                    combined_entities.append(entity)
-
-            # Отправляем сообщение пользователю
-            await update.message.reply_text(message_with_signature, entities=combined_entities)
-
-            # Отправляем в канал, если он установлен
-            if channel:
-                try:
-                    await context.bot.send_message(
-                        channel, message_with_signature, entities=combined_entities
-                    )
-                except TelegramError as e:
-                    self.logger.error(f"Error sending message to channel {channel}: {str(e)}")
-                    await update.message.reply_text(
-                        f"Ошибка при отправке в канал {channel}. "
-                        f"Проверьте права бота и существование канала.\n"
-                        f"Ошибка: {str(e)}"
-                    )
+        profile = await self.db.get_profile(user_id)
+        template = profile.template
+
+        if template and template.text:
+            # Добавляем подпись к тексту сообщения вместе с его форматированием,
+            # слишком длинный текст делится на части с подписью в последней
+            parts = split_message(
+                update.message.text or "", update.message.entities or (), template
+            )
+            replies = [
+                functools.partial(update.message.reply_text, text, entities=entities)
+                for text, entities in parts
+            ]
+            await self.publish(update, profile.channels, replies, text_requests(parts))
+
+    async def publish(
+        self,
+        update: Update,
+        channels: Sequence[str],
+        replies: Sequence[Callable[[], Awaitable[object]]],
+        requests: Sequence[OutboxRequest],
+    ) -> None:
+        """Постановка отправок в каналы в очередь и отправка копии пользователю.
+
+        Каждый запрос копии - отдельная задача планировщика со своим токеном ограничения
+        скорости; запросы выполняются по порядку, после ошибки остальные не отправляются.
+        Ошибки доставки в каналы сообщаются пользователю позже одной сводкой.
+        """
+        message = update.message
+        assert message is not None
+        await self.outbox.enqueue(
+            update.effective_user.id,
+            message.chat_id,
+            channels,
+            requests,
+            source=f"{message.chat_id}:{message.message_id}",
+            source_message_id=message.message_id,
+        )
+        try:
+            for reply in replies:
+                await self.sender.send(message.chat_id, reply, PRIORITY_REPLY)
+        except TelegramError as e:
+            error_msg = f"Ошибка при отправке сообщения: {str(e)}"
+            self.logger.error(error_msg)
+            await self.reply_text(update, error_msg)
 
     async def handle_media(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Обработка медиафайлов (фото, видео, аудио, голосовые сообщения)"""
+        """Обработка медиафайлов всех типов из таблицы MEDIA_KINDS"""
         if not update.message:
             return
 
+        message = update.message
+        if message.media_group_id:
+            # Элементы альбома отправляются одной пачкой после сборки всего альбома;
+            # до этого обновление не считается обработанным
+            self.deduplicator.hold(update)
+            self.albums.add(
+                (update.effective_user.id, message.chat_id, message.media_group_id),
+                (update, context),
+            )
+            return
+
+        kind = media_kind(message)
+        if kind is None:
+            return
+
         user_id = update.effective_user.id
-        signature, signature_entities = self.db.get_signature(user_id)
-        channel = self.db.get_channel(user_id)
+        profile = await self.db.get_profile(user_id)
+        template = profile.template
+
+        if template and template.text:
+            bot = context.bot
+            if kind.supports_caption:
+                # Добавляем подпись к caption вместе с его форматированием,
+                # не поместившееся в caption продолжается текстовыми сообщениями
+                (caption, caption_entities), *overflow = split_message(
+                    message.caption or "",
+                    message.caption_entities or (),
+                    template,
+                    first_limit=CAPTION_LIMIT,
+                )
+                options: Dict[str, Any] = {
+                    "caption": caption,
+                    "caption_entities": caption_entities,
+                }
+            else:
+                # Стикеры и видеосообщения без caption: подпись отдельным сообщением
+                options = {}
+                overflow = [(template.text, list(template.entities))]
+
+            # Те же запросы для каналов в виде вызовов Bot API
+            if message.has_protected_content:
+                post = OutboxRequest(
+                    api_method(kind.send_method),
+                    {kind.attribute: media_file_id(message, kind), **options},
+                )
+            else:
+                post = OutboxRequest(
+                    "copyMessage",
+                    {"from_chat_id": message.chat_id, "message_id": message.message_id, **options},
+                )
+            requests = [post, *text_requests(overflow)]
+
+            chat_id = message.chat_id
+            if message.has_protected_content:
+                # Защищенное содержимое нельзя копировать, отправляем по file_id
+                send = getattr(bot, kind.send_method)
+                copy = functools.partial(send, chat_id, media_file_id(message, kind), **options)
+            else:
+                copy = functools.partial(
+                    bot.copy_message, chat_id, message.chat_id, message.message_id, **options
+                )
+            replies = [
+                copy,
+                *(
+                    functools.partial(bot.send_message, chat_id, text, entities=entities)
+                    for text, entities in overflow
+                ),
+            ]
+            await self.publish(update, profile.channels, replies, requests)
+
+    async def flush_album(self, items: List[Tuple[Update, ContextTypes.DEFAULT_TYPE]]) -> None:
+        """Публикация собранного альбома и завершение обновлений его элементов"""
+        try:
+            await self.send_album(items)
+        finally:
+            for update, _ in items:
+                self.deduplicator.release(update)
+
+    async def handle_album(self, items: List[Tuple[Update, ContextTypes.DEFAULT_TYPE]]) -> None:
+        """Отправка собранного альбома одним send_media_group каждому адресату.
+
+        Подпись добавляется один раз, к caption первого элемента; не поместившееся
+        в caption отправляется текстовыми сообщениями после альбома.
+        """
+        # Элементы попадают в альбом только из handle_media, где message проверен
+        items.sort(key=lambda item: cast(Message, item[0].message).message_id)
+        messages = [cast(Message, update.message) for update, _ in items]
+        first, context = items[0]
+        profile = await self.db.get_profile(first.effective_user.id)
+        template = profile.template
+        if not (template and template.text):
+            return
 
-        # Получаем caption медиафайла и его форматирование
-        caption = update.message.caption or ""
-        caption_entities = list(update.message.caption_entities or [])
+        media: List[AlbumMedia] = []
+        overflow: List[Part] = []
+        for index, message in enumerate(messages):
+            caption = message.caption or ""
+            caption_entities: Sequence[MessageEntity] = message.caption_entities or ()
+            if index == 0:
+                (caption, caption_entities), *overflow = split_message(
+                    caption, caption_entities, template, first_limit=CAPTION_LIMIT
+                )
+            item = input_media(message, caption, caption_entities)
+            if item is not None:
+                media.append(item)
+
+        bot = context.bot
+        chat_id = messages[0].chat_id
+        replies: List[Callable[[], Awaitable[object]]] = [
+            functools.partial(
+                bot.send_media_group, chat_id, media, reply_to_message_id=messages[0].message_id
+            ),
+            *(
+                functools.partial(bot.send_message, chat_id, text, entities=entities)
+                for text, entities in overflow
+            ),
+        ]
+        await self.publish(
+            first,
+            profile.channels,
+            replies,
+            [OutboxRequest("sendMediaGroup", {"media": media}), *text_requests(overflow)],
+        )
 
-        if signature:
-            # Добавляем подпись к caption
-            caption_with_signature = f"{caption}\n\n{signature}" if caption else signature
-
-            # Объединяем entities из caption и подписи
-            combined_entities = list(caption_entities)
-            if signature_entities:
-                for e in signature_entities:
-                    new_offset = e["offset"] + len(caption) + (2 if caption else 0)
-                    entity = MessageEntity(
-                        type=e["type"], offset=new_offset, length=e["length"], url=e.get("url")
-                    )
-                    combined_entities.append(entity)
+    async def handle_edit(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Исправление опубликованных в каналах копий отредактированного сообщения.
 
-            try:
-                # Определяем тип медиафайла и отправляем копию
-                if update.message.photo:
-                    photo = update.message.photo[-1]  # Берем самое качественное фото
-                    await update.message.reply_photo(
-                        photo.file_id,
-                        caption=caption_with_signature,
-                        caption_entities=combined_entities,
-                    )
-                    if channel:
-                        await context.bot.send_photo(
-                            channel,
-                            photo.file_id,
-                            caption=caption_with_signature,
-                            caption_entities=combined_entities,
-                        )
-
-                elif update.message.video:
-                    video = update.message.video
-                    await update.message.reply_video(
-                        video.file_id,
-                        caption=caption_with_signature,
-                        caption_entities=combined_entities,
-                    )
-                    if channel:
-                        await context.bot.send_video(
-                            channel,
-                            video.file_id,
-                            caption=caption_with_signature,
-                            caption_entities=combined_entities,
-                        )
-
-                elif update.message.audio:
-                    audio = update.message.audio
-                    await update.message.reply_audio(
-                        audio.file_id,
-                        caption=caption_with_signature,
-                        caption_entities=combined_entities,
-                    )
-                    if channel:
-                        await context.bot.send_audio(
-                            channel,
-                            audio.file_id,
-                            caption=caption_with_signature,
-                            caption_entities=combined_entities,
-                        )
-
-                elif update.message.voice:
-                    voice = update.message.voice
-                    await update.message.reply_voice(
-                        voice.file_id,
-                        caption=caption_with_signature,
-                        caption_entities=combined_entities,
+        Копии изменяются на месте с заново добавленной подписью, новые сообщения не
+        публикуются. Части сопоставляются по номеру: если после правки сообщение делится
+        на другое число частей, копии в канале не меняются и пользователь получает
+        предупреждение.
+        """
+        message = update.edited_message
+        assert message is not None
+        user_id = update.effective_user.id
+        posts = await self.db.get_posts(user_id, message.chat_id, message.message_id)
+        if not posts:
+            # Сообщение не публиковалось, еще не доставлено или сведения о нем устарели
+            return
+        profile = await self.db.get_profile(user_id)
+        template = profile.template
+        if not (template and template.text):
+            return
+        requests = edit_requests(message, template)
+        if not requests:
+            return
+
+        channels: Dict[str, Dict[int, int]] = {}
+        for post in posts:
+            channels.setdefault(post.chat_id, {})[post.part] = post.message_id
+        mismatched = []
+        for chat_id, message_ids in channels.items():
+            if sorted(message_ids) != list(range(len(requests))):
+                mismatched.append(chat_id)
+                continue
+            await self.outbox.enqueue(
+                user_id,
+                message.chat_id,
+                [chat_id],
+                [
+                    OutboxRequest(
+                        request.method, {**request.payload, "message_id": message_ids[part]}
                     )
-                    if channel:
-                        await context.bot.send_voice(
-                            channel,
-                            voice.file_id,
-                            caption=caption_with_signature,
-                            caption_entities=combined_entities,
-                        )
-
-            except TelegramError as e:
-                error_msg = f"Ошибка при отправке медиафайла: {str(e)}"
-                if channel:
-                    error_msg += f"\nПроверьте права бота в канале {channel}"
-                self.logger.error(error_msg)
-                await update.message.reply_text(error_msg)
+                    for part, request in enumerate(requests)
+                ],
+                # Повторно доставленная правка не ставится в очередь второй раз
+                source=f"{message.chat_id}:{message.message_id}:edit:{update.update_id}",
+            )
+        if mismatched:
+            await self.reply_text(
+                update,
+                "Исправление не применено в каналах "
+                f"({', '.join(mismatched)}): после правки сообщение делится на другое "
+                "число частей. Опубликуйте его заново.",
+            )
+
+    async def profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Профилирование бота на заданное число секунд, только для администраторов"""
+        if update.effective_user.id not in self.admin_ids:
+            await self.reply_text(update, "Команда доступна только администраторам бота.")
+            return
+        try:
+            seconds = float(context.args[0]) if context.args else DEFAULT_PROFILE_SECONDS
+        except ValueError:
+            await self.reply_text(update, "Пожалуйста, укажите длительность в секундах.")
+            return
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            await self.reply_text(
+                update, f"Длительность должна быть от 0 до {MAX_PROFILE_SECONDS:g} секунд."
+            )
+            return
+        if PROFILER.running:
+            await self.reply_text(update, "Профилирование уже запущено.")
+            return
+        self.start_profile(seconds, update.message.chat_id if update.message else None)
+        await self.reply_text(update, f"Профилирование запущено на {seconds:g} с.")
+
+    def start_profile(self, seconds: float, chat_id: Optional[int] = None) -> None:
+        """Запуск профилирования; по окончании сводка отправляется в чат chat_id"""
+        PROFILER.start()
+        self._profile_task = asyncio.create_task(self._finish_profile(seconds, chat_id))
+
+    async def _finish_profile(self, seconds: float, chat_id: Optional[int]) -> None:
+        try:
+            report = await PROFILER.collect(seconds, self.profile_dir)
+        except Exception as e:
+            self.logger.error(f"Error writing profile: {str(e)}")
+            return
+        if chat_id is None:
+            return
+        text = f"Профиль записан в {report.collapsed_path}\n\n"
+        # Сводка целыми строками в пределах одного сообщения
+        for line in report.summary.splitlines():
+            if utf16_len(text) + utf16_len(line) + 1 > TEXT_LIMIT:
+                break
+            text += line + "\n"
+        bot = self.application.bot
+        await self.sender.send(chat_id, lambda: bot.send_message(chat_id, text), PRIORITY_REPLY)
 
     async def remove_signature(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Удаление подписи пользователя"""
         user_id = update.effective_user.id
-        signature = self.db.get_signature(user_id)
+        signature, _ = await self.db.get_signature(user_id)
         if signature:
-            self.db.remove_signature(user_id)
-            await update.message.reply_text("Подпись удалена.")
+            await self.db.remove_signature(user_id)
+            await self.reply_text(update, "Подпись удалена.")
         else:
-            await update.message.reply_text("У вас нет установленной подписи.")
+            await self.reply_text(update, "У вас нет установленной подписи.")
+
+    async def check_channel_access(
+        self, context: ContextTypes.DEFAULT_TYPE, channel_id: str
+    ) -> None:
+        """Проверка доступа бота к каналу, при отсутствии доступа бросает TelegramError"""
+        await self.channel_access.check(context.bot, channel_id)
+
+    async def reply_channel_error(self, update: Update, error: TelegramError) -> None:
+        """Сообщение об ошибке доступа к каналу"""
+        self.logger.error(
+            f"Error setting channel for user {update.effective_user.id}: {str(error)}"
+        )
+        await self.reply_text(
+            update,
+            f"Ошибка при установке канала. Убедитесь, что:\n"
+            f"1. Канал существует\n"
+            f"2. Бот добавлен в канал как администратор\n"
+            f"3. ID канала указан верно\n\n"
+            f"Ошибка: {str(error)}",
+        )
 
     async def set_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Установка канала для публикации"""
+        """Установка единственного канала для публикации"""
         if not context.args:
-            await update.message.reply_text(
-                "Пожалуйста, укажите ID канала после команды.\n" "Пример: /set_channel @mychannel"
+            await self.reply_text(
+                update,
+                "Пожалуйста, укажите ID канала после команды.\n" "Пример: /set_channel @mychannel",
             )
             return
 
@@ -297,40 +859,100 @@ class SignatureBot:
 
         try:
             # Проверяем, есть ли у бота доступ к каналу
-            test_message = await context.bot.send_message(channel_id, "Тестовое сообщение")
-            await context.bot.delete_message(channel_id, test_message.message_id)
+            await self.check_channel_access(context, channel_id)
 
-            self.db.set_channel(user_id, channel_id)
-            await update.message.reply_text(f"Канал {channel_id} успешно установлен.")
+            await self.db.set_channel(user_id, channel_id)
+            await self.reply_text(update, f"Канал {channel_id} успешно установлен.")
         except TelegramError as e:
-            self.logger.error(f"Error setting channel for user {user_id}: {str(e)}")
-            await update.message.reply_text(
-                f"Ошибка при установке канала. Убедитесь, что:\n"
-                f"1. Канал существует\n"
-                f"2. Бот добавлен в канал как администратор\n"
-                f"3. ID канала указан верно\n\n"
-                f"Ошибка: {str(e)}"
+            await self.reply_channel_error(update, e)
+
+    async def add_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Добавление канала к списку каналов для публикации"""
+        if not context.args:
+            await self.reply_text(
+                update,
+                "Пожалуйста, укажите ID канала после команды.\n" "Пример: /add_channel @mychannel",
             )
+            return
+
+        channel_id = context.args[0]
+        user_id = update.effective_user.id
+
+        try:
+            await self.check_channel_access(context, channel_id)
+
+            await self.db.add_channel(user_id, channel_id)
+            await self.reply_text(update, f"Канал {channel_id} добавлен.")
+        except TelegramError as e:
+            await self.reply_channel_error(update, e)
 
     async def remove_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Удаление канала"""
+        """Удаление одного канала или всех каналов"""
         user_id = update.effective_user.id
-        channel = self.db.get_channel(user_id)
-        if channel:
-            self.db.remove_channel(user_id)
-            await update.message.reply_text("Канал удален.")
+        channel_id = context.args[0] if context.args else None
+        if await self.db.remove_channel(user_id, channel_id):
+            await self.reply_text(
+                update, f"Канал {channel_id} удален." if channel_id else "Каналы удалены."
+            )
+        elif channel_id:
+            await self.reply_text(update, f"Канал {channel_id} не найден в вашем списке.")
         else:
-            await update.message.reply_text("У вас нет установленного канала.")
+            await self.reply_text(update, "У вас нет установленного канала.")
 
     async def show_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Показ текущего канала"""
+        """Показ текущих каналов"""
         user_id = update.effective_user.id
-        channel = self.db.get_channel(user_id)
-        if channel:
-            await update.message.reply_text(f"Ваш текущий канал: {channel}")
+        channels = await self.db.get_channels(user_id)
+        if len(channels) == 1:
+            await self.reply_text(update, f"Ваш текущий канал: {channels[0]}")
+        elif channels:
+            await self.reply_text(update, "Ваши каналы:\n" + "\n".join(channels))
+        else:
+            await self.reply_text(update, "У вас нет установленного канала.")
+
+    def run(self, webhook: Optional[WebhookConfig] = None) -> None:
+        """Запуск бота: long polling или вебхук, если переданы его параметры"""
+        if webhook is None:
+            self.application.run_polling()
         else:
-            await update.message.reply_text("У вас нет установленного канала.")
+            asyncio.run(self.run_webhook(webhook))
 
-    def run(self) -> None:
-        """Запуск бота"""
-        self.application.run_polling()
+    async def run_webhook(self, config: WebhookConfig) -> None:
+        """Прием обновлений через вебхук до получения сигнала остановки"""
+        server = WebhookServer(config, self.application.bot, self.application.update_queue)
+        await self.application.initialize()
+        try:
+            await self.post_init(self.application)
+            await server.start()
+            try:
+                await self.application.bot.set_webhook(
+                    config.webhook_url,
+                    secret_token=config.secret_token,
+                    max_connections=config.max_connections,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+                await self.application.start()
+                self.logger.info(f"Вебхук зарегистрирован: {config.webhook_url}")
+                await wait_for_stop_signal()
+            finally:
+                if self.application.running:
+                    await self.application.stop()
+                await server.stop()
+                await self.post_stop(self.application)
+        finally:
+            # Порядок как в run_polling: post_stop до shutdown, post_shutdown после
+            await self.application.shutdown()
+            await self.post_shutdown(self.application)
+
+
+async def wait_for_stop_signal() -> None:
+    """Ожидание SIGINT или SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
@@ -0,0 +1,179 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .template import SignatureTemplate
+
+# Приблизительный размер одного entity подписи в памяти (объект MessageEntity)
+ENTITY_SIZE_ESTIMATE = 400
+# Накладные расходы на запись кэша: ключ, узел OrderedDict и служебный объект
+ENTRY_OVERHEAD = 200
+
+
+class UserProfile:
+    """Компактная запись профиля пользователя: скомпилированная подпись и каналы"""
+
+    __slots__ = ("template", "channels")
+
+    def __init__(
+        self,
+        template: Optional[SignatureTemplate] = None,
+        channels: Tuple[str, ...] = (),
+    ):
+        self.template = template
+        self.channels = channels
+
+    @property
+    def signature(self) -> Optional[str]:
+        return self.template.text if self.template is not None else None
+
+    def estimated_size(self) -> int:
+        """Оценка объема памяти, занимаемого записью, в байтах"""
+        size = sys.getsizeof(self)
+        if self.template is not None:
+            size += sys.getsizeof(self.template) + sys.getsizeof(self.template.text)
+            size += len(self.template.entities) * ENTITY_SIZE_ESTIMATE
+        if self.channels:
+            size += sys.getsizeof(self.channels)
+            size += sum(sys.getsizeof(channel) for channel in self.channels)
+        return size
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, UserProfile):
+            return NotImplemented
+        return (self.template, self.channels) == (other.template, other.channels)
+
+    def __repr__(self) -> str:
+        return f"UserProfile(template={self.template!r}, channels={self.channels!r})"
+
+
+class _CacheEntry:
+    __slots__ = ("profile", "expires_at", "size")
+
+    def __init__(self, profile: UserProfile, expires_at: float, size: int):
+        self.profile = profile
+        self.expires_at = expires_at
+        self.size = size
+
+
+class ProfileCache:
+    """Ограниченный LRU-кэш профилей пользователей со сроком жизни записей.
+
+    Размер ограничивается как числом записей, так и оценкой занимаемой памяти.
+    Отсутствующие профили тоже кэшируются, чтобы сообщения пользователей без подписи
+    не приводили к запросам в базу данных.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        ttl: float = 300.0,
+        max_bytes: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        # Поколение увеличивается при каждой инвалидации, чтобы не сохранять
+        # в кэш результат чтения, начатого до изменения данных
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._entries
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, user_id: int) -> Optional[UserProfile]:
+        """Получение профиля из кэша или None при промахе"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= self._clock():
+            self._remove(user_id)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry.profile
+
+    def put(self, user_id: int, profile: UserProfile, generation: Optional[int] = None) -> None:
+        """Сохранение профиля в кэш.
+
+        Если передано поколение и с тех пор была инвалидация, запись не сохраняется.
+        """
+        if self.max_entries <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        if user_id in self._entries:
+            self._remove(user_id)
+
+        size = profile.estimated_size() + ENTRY_OVERHEAD
+        self._entries[user_id] = _CacheEntry(profile, self._clock() + self.ttl, size)
+        self._bytes += size
+        self._evict()
+
+    def invalidate(self, user_id: int) -> None:
+        """Удаление профиля пользователя из кэша"""
+        self.generation += 1
+        if user_id in self._entries:
+            self._remove(user_id)
+
+    def clear(self) -> None:
+        """Полная очистка кэша"""
+        self.generation += 1
+        self._entries.clear()
+        self._bytes = 0
+
+    def recent(self, limit: int) -> List[Tuple[int, UserProfile]]:
+        """До limit последних использованных профилей, от давних к свежим; счетчики не меняются"""
+        now = self._clock()
+        profiles: List[Tuple[int, UserProfile]] = []
+        for user_id in reversed(self._entries):
+            if len(profiles) >= limit:
+                break
+            entry = self._entries[user_id]
+            if entry.expires_at > now:
+                profiles.append((user_id, entry.profile))
+        profiles.reverse()
+        return profiles
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики работы кэша"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, user_id: int) -> None:
+        entry = self._entries.pop(user_id)
+        self._bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
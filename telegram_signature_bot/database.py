@@ -1,116 +1,652 @@
+import asyncio
 import json
-import sqlite3
-from typing import List, Optional, Tuple
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
 
+import aiosqlite
 from telegram import MessageEntity
 
+from .cache import ProfileCache, UserProfile
+from .metrics import REGISTRY, F, timed
+from .migrations import migrate
+from .profiler import phase
+from .template import SignatureTemplate, compile_signature, load_template, utf16_len
+from .writebatch import DEFAULT_WRITE_BATCH_SIZE, DEFAULT_WRITE_WINDOW, Statement, WriteBatcher
+
+# Размер кэша подготовленных выражений sqlite3 на одно соединение
+STATEMENT_CACHE_SIZE = 128
+
+# Разделитель каналов в результате group_concat, не встречается в идентификаторах каналов
+CHANNEL_SEPARATOR = "\n"
+
+# Профиль целиком одним запросом: подпись по первичному ключу и каналы по индексу
+PROFILE_SQL = """
+    SELECT p.signature, p.signature_length, p.entities,
+           (SELECT group_concat(c.channel_id, ?) FROM profile_channels AS c
+            WHERE c.bot_id = u.bot_id AND c.user_id = u.user_id)
+    FROM (SELECT ? AS bot_id, ? AS user_id) AS u
+    LEFT JOIN profiles AS p ON p.bot_id = u.bot_id AND p.user_id = u.user_id
+"""
+UPSERT_SIGNATURE_SQL = """
+    INSERT INTO profiles (bot_id, user_id, signature, entities, signature_length)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (bot_id, user_id) DO UPDATE
+    SET signature = excluded.signature, entities = excluded.entities,
+        signature_length = excluded.signature_length
+"""
+# Все пользователи бота ?1 с подписью или каналами по возрастанию идентификатора
+EXPORT_SQL = """
+    SELECT u.user_id, p.signature, p.entities,
+           (SELECT group_concat(c.channel_id, ?2) FROM profile_channels AS c
+            WHERE c.bot_id = ?1 AND c.user_id = u.user_id)
+    FROM (
+        SELECT user_id FROM profiles WHERE bot_id = ?1
+        UNION SELECT user_id FROM profile_channels WHERE bot_id = ?1
+    ) AS u
+    LEFT JOIN profiles AS p ON p.bot_id = ?1 AND p.user_id = u.user_id
+    ORDER BY u.user_id
+"""
+# Запись outbox AS o - первая недоставленная в своем канале (индекс outbox_channel)
+CHANNEL_HEAD_SQL = """o.id = (
+    SELECT MIN(id) FROM outbox
+    WHERE bot_id = o.bot_id AND chat_id = o.chat_id AND status IN ('pending', 'inflight')
+)"""
+
+# Число строк, получаемых из курсора за одно обращение к потоку aiosqlite
+EXPORT_FETCH_SIZE = 1000
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "signature_bot_db_query_seconds", "Длительность запросов к базе данных", ["query"]
+)
+DB_QUERY_ERRORS = REGISTRY.counter(
+    "signature_bot_db_query_errors_total", "Ошибки запросов к базе данных", ["query"]
+)
+
+
+def timed_query(name: str) -> Callable[[F], F]:
+    """Учет длительности и ошибок запроса в метриках и в фазах профилирования"""
+    metered = timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, name)
+    traced = phase(f"db:{name}")
+    return lambda func: metered(traced(func))
+
+
+class OutboxEntry(NamedTuple):
+    """Новая отправка в канал: вызов Bot API и его параметры в JSON.
+
+    Запись с ключом key не добавляется, если в очереди уже есть запись с тем же ключом.
+    """
+
+    user_id: int
+    user_chat_id: int
+    chat_id: Union[int, str]
+    method: str
+    payload: str
+    key: Optional[str] = None
+    # Исходное сообщение пользователя и номер запроса среди его отправок: после
+    # доставки записи опубликованное сообщение сохраняется в message_map
+    source_message_id: Optional[int] = None
+    part: int = 0
+
+
+class ProfileRecord(NamedTuple):
+    """Профиль пользователя для импорта и экспорта"""
+
+    user_id: int
+    signature: Optional[str]
+    # Entities подписи в формате Bot API
+    entities: Optional[List[dict]]
+    channels: Tuple[str, ...] = ()
+
+
+class OutboxItem(NamedTuple):
+    """Запись очереди отправок, выбранная для доставки"""
+
+    id: int
+    user_id: int
+    user_chat_id: int
+    chat_id: str
+    method: str
+    payload: str
+    attempts: int
+    source_message_id: Optional[int] = None
+    part: int = 0
+
+
+class PostedMessage(NamedTuple):
+    """Сообщение, опубликованное в канале по части исходного сообщения"""
+
+    chat_id: str
+    part: int
+    message_id: int
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений aiosqlite.
+
+    Одно соединение используется для записи (SQLite допускает только одного писателя),
+    остальные - для параллельного чтения в режиме WAL.
+    """
+
+    def __init__(self, db_name: str, size: int = 4):
+        self.db_name = db_name
+        self.size = max(1, size)
+        self._writer: Optional[aiosqlite.Connection] = None
+        # Примитивы asyncio создаются при открытии, внутри работающего цикла событий
+        self._readers: Optional["asyncio.Queue[aiosqlite.Connection]"] = None
+        self._all_readers: List[aiosqlite.Connection] = []
+        self._write_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def is_memory(self) -> bool:
+        return self.db_name == ":memory:"
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_name, cached_statements=STATEMENT_CACHE_SIZE)
+        await conn.execute("PRAGMA busy_timeout = 5000")
+        return conn
+
+    async def open(self) -> None:
+        """Открытие соединений и включение WAL"""
+        if self.is_open:
+            return
+        self._write_lock = asyncio.Lock()
+        self._readers = asyncio.Queue()
+        self._writer = await self._connect()
+        if not self.is_memory:
+            await self._writer.execute("PRAGMA journal_mode = WAL")
+            # Отдельные читатели имеют смысл только для файловой базы
+            for _ in range(self.size):
+                conn = await self._connect()
+                self._all_readers.append(conn)
+                self._readers.put_nowait(conn)
+
+    async def close(self) -> None:
+        """Закрытие всех соединений пула"""
+        for conn in self._all_readers:
+            await conn.close()
+        self._all_readers.clear()
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Эксклюзивный доступ к соединению для записи"""
+        assert self._write_lock is not None, "Пул соединений не открыт"
+        async with self._write_lock:
+            assert self._writer is not None, "Пул соединений не открыт"
+            yield self._writer
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение для чтения из пула"""
+        if not self._all_readers:
+            async with self.writer() as conn:
+                yield conn
+            return
+        assert self._readers is not None
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
 
 class Database:
-    def __init__(self, db_name: str = "signatures.db"):
+    """Хранилище SQLite.
+
+    bot_id отделяет данные ботов, работающих с одной базой через общий пул соединений
+    (pool): такой пул открывает и закрывает его владелец, а не Database.
+    """
+
+    def __init__(
+        self,
+        db_name: str = "signatures.db",
+        pool_size: int = 4,
+        cache: Optional[ProfileCache] = None,
+        write_window: float = DEFAULT_WRITE_WINDOW,
+        write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE,
+        bot_id: int = 0,
+        pool: Optional[ConnectionPool] = None,
+    ):
         self.db_name = db_name
-        self.init_db()
-
-    def init_db(self) -> None:
-        """Инициализация базы данных"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            # Таблица для подписей
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS signatures (
-                    user_id INTEGER PRIMARY KEY,
-                    signature TEXT NOT NULL,
-                    entities TEXT
-                )
-            """
+        self.bot_id = bot_id
+        self._owns_pool = pool is None
+        self.pool = pool if pool is not None else ConnectionPool(db_name, pool_size)
+        self.cache = cache if cache is not None else ProfileCache()
+        # Изменения настроек пользователей фиксируются пачками
+        self.writes = WriteBatcher(self._writer, write_window, write_batch_size)
+        self._open_lock: Optional[asyncio.Lock] = None
+
+    async def connect(self) -> None:
+        """Открытие пула соединений и инициализация схемы"""
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self.pool.is_open:
+                return
+            await self.pool.open()
+            await self.init_db()
+
+    async def close(self) -> None:
+        """Запись накопленных изменений и закрытие пула соединений"""
+        await self.writes.close()
+        if self._owns_pool:
+            await self.pool.close()
+
+    @asynccontextmanager
+    async def _reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        if not self.pool.is_open:
+            await self.connect()
+        async with self.pool.reader() as conn:
+            yield conn
+
+    @asynccontextmanager
+    async def _writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        if not self.pool.is_open:
+            await self.connect()
+        async with self.pool.writer() as conn:
+            yield conn
+
+    async def init_db(self) -> None:
+        """Инициализация базы данных: применение недостающих миграций схемы"""
+        async with self.pool.writer() as conn:
+            await migrate(conn)
+
+    async def get_meta(self, key: str) -> Optional[str]:
+        """Служебный параметр базы"""
+        async with self._reader() as conn:
+            async with conn.execute(
+                "SELECT value FROM meta WHERE bot_id = ? AND key = ?", (self.bot_id, key)
+            ) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def set_meta(self, key: str, value: str) -> None:
+        async with self._writer() as conn:
+            await conn.execute(
+                "INSERT OR REPLACE INTO meta (bot_id, key, value) VALUES (?, ?, ?)",
+                (self.bot_id, key, value),
             )
-            # Таблица для каналов пользователей
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS channels (
-                    user_id INTEGER PRIMARY KEY,
-                    channel_id TEXT NOT NULL
+            await conn.commit()
+
+    @timed_query("set_signature")
+    async def set_signature(
+        self, user_id: int, signature: str, entities: Optional[List[MessageEntity]] = None
+    ) -> SignatureTemplate:
+        """Сохранение подписи пользователя с форматированием.
+
+        Подпись компилируется в шаблон один раз, длина в UTF-16 сохраняется рядом с текстом.
+        """
+        template = compile_signature(signature, entities)
+        params = (
+            self.bot_id,
+            user_id,
+            template.text,
+            template.entities_json(),
+            template.utf16_length,
+        )
+        await self.writes.submit(
+            [(UPSERT_SIGNATURE_SQL, params)], ("signature", user_id), coalesce=True
+        )
+        self.cache.invalidate(user_id)
+        return template
+
+    @timed_query("get_signature")
+    async def get_signature(self, user_id: int) -> Tuple[Optional[str], Optional[List[dict]]]:
+        """Получение подписи пользователя вместе с форматированием"""
+        async with self._reader() as conn:
+            async with conn.execute(
+                "SELECT signature, entities FROM profiles WHERE bot_id = ? AND user_id = ?",
+                (self.bot_id, user_id),
+            ) as cursor:
+                result = await cursor.fetchone()
+
+        if not result or result[0] is None:
+            return None, None
+
+        signature, entities_json = result
+        entities = json.loads(entities_json) if entities_json else None
+        return signature, entities
+
+    @timed_query("remove_signature")
+    async def remove_signature(self, user_id: int) -> None:
+        """Удаление подписи пользователя"""
+        await self.writes.submit(
+            [("DELETE FROM profiles WHERE bot_id = ? AND user_id = ?", (self.bot_id, user_id))],
+            ("signature", user_id),
+            coalesce=True,
+        )
+        self.cache.invalidate(user_id)
+
+    @timed_query("add_channel")
+    async def add_channel(self, user_id: int, channel_id: str) -> None:
+        """Добавление канала к списку каналов пользователя"""
+        await self.writes.submit(
+            [
+                (
+                    "INSERT OR IGNORE INTO profile_channels (bot_id, user_id, channel_id) "
+                    "VALUES (?, ?, ?)",
+                    (self.bot_id, user_id, channel_id),
                 )
-            """
+            ],
+            ("channels", user_id),
+        )
+        self.cache.invalidate(user_id)
+
+    @timed_query("set_channel")
+    async def set_channel(self, user_id: int, channel_id: str) -> None:
+        """Замена всех каналов пользователя одним каналом"""
+        await self.writes.submit(
+            [
+                (
+                    "DELETE FROM profile_channels WHERE bot_id = ? AND user_id = ?",
+                    (self.bot_id, user_id),
+                ),
+                (
+                    "INSERT INTO profile_channels (bot_id, user_id, channel_id) VALUES (?, ?, ?)",
+                    (self.bot_id, user_id, channel_id),
+                ),
+            ],
+            ("channels", user_id),
+            coalesce=True,
+        )
+        self.cache.invalidate(user_id)
+
+    @timed_query("get_channels")
+    async def get_channels(self, user_id: int) -> List[str]:
+        """Получение каналов пользователя"""
+        async with self._reader() as conn:
+            async with conn.execute(
+                "SELECT channel_id FROM profile_channels WHERE bot_id = ? AND user_id = ?",
+                (self.bot_id, user_id),
+            ) as cursor:
+                rows = await cursor.fetchall()
+        return [row[0] for row in rows]
+
+    @timed_query("remove_channel")
+    async def remove_channel(self, user_id: int, channel_id: Optional[str] = None) -> int:
+        """Удаление канала пользователя или всех его каналов, возвращает число удаленных"""
+        if channel_id is None:
+            statement: Statement = (
+                "DELETE FROM profile_channels WHERE bot_id = ? AND user_id = ?",
+                (self.bot_id, user_id),
+            )
+        else:
+            statement = (
+                "DELETE FROM profile_channels WHERE bot_id = ? AND user_id = ? AND channel_id = ?",
+                (self.bot_id, user_id, channel_id),
             )
-            conn.commit()
+        removed = await self.writes.submit([statement], ("channels", user_id))
+        self.cache.invalidate(user_id)
+        return removed
 
-    def set_signature(
-        self, user_id: int, signature: str, entities: Optional[List[MessageEntity]] = None
-    ) -> None:
-        """Сохранение подписи пользователя с форматированием"""
-        # Конвертируем entities в JSON-совместимый формат
-        entities_json = None
-        if entities:
-            entities_dict = [
-                {
-                    "type": entity.type,
-                    "offset": entity.offset,
-                    "length": entity.length,
-                    "url": getattr(entity, "url", None),  # Для TEXT_LINK
-                }
-                for entity in entities
-            ]
-            entities_json = json.dumps(entities_dict)
-
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+    async def get_profile(self, user_id: int) -> UserProfile:
+        """Получение профиля пользователя одним запросом с чтением через кэш"""
+        profile = self.cache.get(user_id)
+        if profile is not None:
+            return profile
+
+        generation = self.cache.generation
+        profile = await self._load_profile(user_id)
+        self.cache.put(user_id, profile, generation)
+        return profile
+
+    @timed_query("get_profile")
+    async def _load_profile(self, user_id: int) -> UserProfile:
+        async with self._reader() as conn:
+            async with conn.execute(
+                PROFILE_SQL, (CHANNEL_SEPARATOR, self.bot_id, user_id)
+            ) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            # Запрос всегда возвращает строку, даже для пользователя без профиля
+            return UserProfile(None, ())
+        signature, signature_length, entities_json, channels = row
+
+        template = (
+            load_template(signature, signature_length, entities_json)
+            if signature is not None
+            else None
+        )
+        return UserProfile(template, tuple(channels.split(CHANNEL_SEPARATOR)) if channels else ())
+
+    @timed_query("enqueue_outbox")
+    async def enqueue_outbox(self, items: Sequence[OutboxEntry]) -> None:
+        """Добавление отправок в очередь одной транзакцией"""
+        now = time.time()
+        async with self._writer() as conn:
+            await conn.executemany(
                 """
-                INSERT OR REPLACE INTO signatures (user_id, signature, entities)
-                VALUES (?, ?, ?)
+                INSERT OR IGNORE INTO outbox
+                    (bot_id, user_id, user_chat_id, chat_id, method, payload, dedup_key,
+                     source_message_id, part, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-                (user_id, signature, entities_json),
+                [
+                    (
+                        self.bot_id,
+                        entry.user_id,
+                        entry.user_chat_id,
+                        str(entry.chat_id),
+                        entry.method,
+                        entry.payload,
+                        entry.key,
+                        entry.source_message_id,
+                        entry.part,
+                        now,
+                        now,
+                    )
+                    for entry in items
+                ],
             )
-            conn.commit()
+            await conn.commit()
 
-    def get_signature(self, user_id: int) -> Tuple[Optional[str], Optional[List[dict]]]:
-        """Получение подписи пользователя вместе с форматированием"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT signature, entities FROM signatures WHERE user_id = ?", (user_id,)
+    @timed_query("claim_outbox")
+    async def claim_outbox(self, limit: int, now: float) -> List[OutboxItem]:
+        """Выборка готовых к отправке записей с пометкой их как отправляемых.
+
+        В каждый канал отправляется одна запись за раз в порядке id: запись выбирается,
+        только если она первая среди недоставленных записей своего канала.
+        """
+        async with self._writer() as conn:
+            async with conn.execute(
+                f"""
+                SELECT id, user_id, user_chat_id, chat_id, method, payload, attempts,
+                       source_message_id, part
+                FROM outbox AS o
+                WHERE bot_id = ? AND status = 'pending' AND next_attempt_at <= ?
+                AND {CHANNEL_HEAD_SQL}
+                ORDER BY id LIMIT ?
+            """,
+                (self.bot_id, now, limit),
+            ) as cursor:
+                items = [OutboxItem(*row) for row in await cursor.fetchall()]
+            if items:
+                await conn.executemany(
+                    "UPDATE outbox SET status = 'inflight' WHERE id = ?",
+                    [(item.id,) for item in items],
+                )
+                await conn.commit()
+        return items
+
+    @timed_query("next_outbox_attempt")
+    async def next_outbox_attempt(self) -> Optional[float]:
+        """Время ближайшей отправки среди первых записей каналов"""
+        async with self._reader() as conn:
+            async with conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox AS o "
+                f"WHERE bot_id = ? AND status = 'pending' AND {CHANNEL_HEAD_SQL}",
+                (self.bot_id,),
+            ) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    @timed_query("complete_outbox")
+    async def complete_outbox(self, item_id: int, message_id: Optional[int] = None) -> None:
+        """Удаление доставленной записи.
+
+        message_id - сообщение, опубликованное по записи с исходным сообщением: оно
+        запоминается в той же транзакции для последующего исправления публикации.
+        """
+        async with self._writer() as conn:
+            if message_id is not None:
+                await conn.execute(
+                    """
+                    INSERT OR REPLACE INTO message_map
+                        (bot_id, user_chat_id, source_message_id, chat_id, part, message_id,
+                         created_at)
+                    SELECT bot_id, user_chat_id, source_message_id, chat_id, part, ?, ?
+                    FROM outbox WHERE id = ? AND source_message_id IS NOT NULL
+                """,
+                    (message_id, time.time(), item_id),
+                )
+            await conn.execute("DELETE FROM outbox WHERE id = ?", (item_id,))
+            await conn.commit()
+
+    @timed_query("retry_outbox")
+    async def retry_outbox(self, item_id: int, next_attempt_at: float, error: str) -> None:
+        """Возврат записи в очередь для повторной попытки"""
+        async with self._writer() as conn:
+            await conn.execute(
+                """
+                UPDATE outbox
+                SET status = 'pending', attempts = attempts + 1, next_attempt_at = ?,
+                    last_error = ?
+                WHERE id = ?
+            """,
+                (next_attempt_at, error, item_id),
             )
-            result = cursor.fetchone()
+            await conn.commit()
 
-            if not result:
-                return None, None
+    @timed_query("dead_letter_outbox")
+    async def dead_letter_outbox(self, item_id: int, error: str) -> None:
+        """Перевод записи в недоставленные"""
+        async with self._writer() as conn:
+            await conn.execute(
+                """
+                UPDATE outbox SET status = 'dead', attempts = attempts + 1, last_error = ?
+                WHERE id = ?
+            """,
+                (error, item_id),
+            )
+            await conn.commit()
 
-            signature, entities_json = result
-            entities = json.loads(entities_json) if entities_json else None
-            return signature, entities
+    @timed_query("recover_outbox")
+    async def recover_outbox(self) -> int:
+        """Возврат в очередь записей, отправка которых прервалась остановкой процесса"""
+        async with self._writer() as conn:
+            cursor = await conn.execute(
+                "UPDATE outbox SET status = 'pending' WHERE bot_id = ? AND status = 'inflight'",
+                (self.bot_id,),
+            )
+            recovered = cursor.rowcount
+            await conn.commit()
+        return recovered
 
-    def remove_signature(self, user_id: int) -> None:
-        """Удаление подписи пользователя"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM signatures WHERE user_id = ?", (user_id,))
-            conn.commit()
-
-    def set_channel(self, user_id: int, channel_id: str) -> None:
-        """Сохранение канала пользователя"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+    @timed_query("get_posts")
+    async def get_posts(
+        self, user_id: int, user_chat_id: int, source_message_id: int
+    ) -> List[PostedMessage]:
+        """Сообщения в каналах, опубликованные по исходному сообщению пользователя"""
+        async with self._reader() as conn:
+            async with conn.execute(
                 """
-                INSERT OR REPLACE INTO channels (user_id, channel_id)
-                VALUES (?, ?)
+                SELECT chat_id, part, message_id FROM message_map
+                WHERE bot_id = ? AND user_chat_id = ? AND source_message_id = ?
+                ORDER BY chat_id, part
             """,
-                (user_id, channel_id),
+                (self.bot_id, user_chat_id, source_message_id),
+            ) as cursor:
+                rows = await cursor.fetchall()
+        return [PostedMessage(*row) for row in rows]
+
+    @timed_query("prune_posts")
+    async def prune_posts(self, before: float) -> int:
+        """Удаление сведений о публикациях старше before, возвращает число удаленных"""
+        async with self._writer() as conn:
+            cursor = await conn.execute(
+                "DELETE FROM message_map WHERE bot_id = ? AND created_at < ?",
+                (self.bot_id, before),
             )
-            conn.commit()
-
-    def get_channel(self, user_id: int) -> Optional[str]:
-        """Получение канала пользователя"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT channel_id FROM channels WHERE user_id = ?", (user_id,))
-            result = cursor.fetchone()
-            return result[0] if result else None
-
-    def remove_channel(self, user_id: int) -> None:
-        """Удаление канала пользователя"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM channels WHERE user_id = ?", (user_id,))
-            conn.commit()
+            removed = cursor.rowcount
+            await conn.commit()
+        return removed
+
+    @timed_query("outbox_stats")
+    async def outbox_stats(self) -> Dict[str, int]:
+        """Число записей очереди по статусам"""
+        async with self._reader() as conn:
+            async with conn.execute(
+                "SELECT status, COUNT(*) FROM outbox WHERE bot_id = ? GROUP BY status",
+                (self.bot_id,),
+            ) as cursor:
+                rows = await cursor.fetchall()
+        return {status: count for status, count in rows}
+
+    async def export_profiles(self) -> AsyncIterator[ProfileRecord]:
+        """Потоковое чтение всех профилей без загрузки их в память целиком"""
+        async with self._reader() as conn:
+            async with conn.execute(EXPORT_SQL, (self.bot_id, CHANNEL_SEPARATOR)) as cursor:
+                cursor.arraysize = EXPORT_FETCH_SIZE
+                async for user_id, signature, entities_json, channels in cursor:
+                    yield ProfileRecord(
+                        user_id,
+                        signature,
+                        json.loads(entities_json) if entities_json else None,
+                        tuple(channels.split(CHANNEL_SEPARATOR)) if channels else (),
+                    )
+
+    @timed_query("import_profiles")
+    async def import_profiles(
+        self, records: Sequence[ProfileRecord], replace: bool = False
+    ) -> None:
+        """Загрузка пачки профилей одной транзакцией.
+
+        Подписи из записей заменяют существующие, каналы добавляются к существующим.
+        При replace запись полностью определяет профиль: прежние каналы удаляются,
+        а подпись удаляется, если в записи ее нет.
+        """
+        signatures = [
+            (
+                self.bot_id,
+                record.user_id,
+                record.signature,
+                json.dumps(record.entities) if record.entities else None,
+                utf16_len(record.signature),
+            )
+            for record in records
+            if record.signature is not None
+        ]
+        channels = [
+            (self.bot_id, record.user_id, channel)
+            for record in records
+            for channel in record.channels
+        ]
+        async with self._writer() as conn:
+            try:
+                if replace:
+                    user_ids = [(self.bot_id, record.user_id) for record in records]
+                    await conn.executemany(
+                        "DELETE FROM profiles WHERE bot_id = ? AND user_id = ?", user_ids
+                    )
+                    await conn.executemany(
+                        "DELETE FROM profile_channels WHERE bot_id = ? AND user_id = ?", user_ids
+                    )
+                await conn.executemany(UPSERT_SIGNATURE_SQL, signatures)
+                await conn.executemany(
+                    "INSERT OR IGNORE INTO profile_channels (bot_id, user_id, channel_id) "
+                    "VALUES (?, ?, ?)",
+                    channels,
+                )
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+        # Пачка может затронуть много пользователей, проще сбросить кэш целиком
+        self.cache.clear()
@@ -0,0 +1,191 @@
+"""
+Отбрасывание повторно доставленных обновлений.
+
+После перезапуска или повтора запроса вебхука Telegram может прислать уже обработанное
+обновление еще раз. Обновление считается повтором, если:
+- его update_id или пара (чат, message_id) нового сообщения есть среди последних
+  capacity ключей (ограниченный по памяти LRU-набор, проверка за O(1));
+- его update_id не больше границы, до которой включительно все обновления были
+  обработаны к прошлой остановке; граница периодически сохраняется в базе и
+  восстанавливается при запуске.
+
+Во время работы граница не применяется: Telegram не гарантирует порядок обновлений,
+и в режиме вебхука с несколькими соединениями обновление с меньшим update_id может
+прийти позже. Повторы внутри процесса отбрасываются только по набору последних ключей.
+Граница продвигается только по непрерывному ряду обработанных update_id: обновления,
+которые еще обрабатываются или еще не пришли, после аварийной остановки будут обработаны
+заново, а не потеряны. Telegram выдает update_id подряд, но пропуск в ряду возможен,
+поэтому не пришедшие за MISSING_UPDATE_TIMEOUT секунд update_id считаются пропущенными.
+Обновление, работа по которому продолжается после обработчика (элемент альбома до его
+сборки), удерживается через hold до вызова release. Если обновлений не было неделю,
+Telegram выбирает следующий update_id случайно, поэтому такая граница не применяется.
+"""
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Set, Tuple
+
+from telegram import Update
+
+from .metrics import REGISTRY
+
+DEFAULT_DEDUP_CAPACITY = 100_000
+# Служебный параметр базы: "<update_id> <время>"
+HIGH_WATER_META_KEY = "update_high_water"
+# Через неделю без обновлений update_id выбирается заново, граница устаревает раньше
+HIGH_WATER_TTL = 6 * 24 * 3600
+# Интервал сохранения границы в базу в секундах
+HIGH_WATER_INTERVAL = 1.0
+# Время ожидания обновления, пропущенного в ряду update_id, в секундах
+MISSING_UPDATE_TIMEOUT = 60.0
+
+DUPLICATE_UPDATES = REGISTRY.counter(
+    "signature_bot_duplicate_updates_total",
+    "Отброшенные повторно доставленные обновления",
+    ["reason"],
+)
+
+
+def update_keys(update: object) -> List[Hashable]:
+    """Ключи обновления: update_id и (чат, message_id) нового сообщения"""
+    if not isinstance(update, Update):
+        return []
+    keys: List[Hashable] = [update.update_id]
+    # Исправленное сообщение сохраняет message_id, поэтому учитываются только новые
+    message = update.message or update.channel_post
+    if message is not None:
+        keys.append((message.chat_id, message.message_id))
+    return keys
+
+
+def parse_high_water(value: Optional[str]) -> Tuple[int, float]:
+    """Граница и время ее сохранения из значения meta"""
+    if not value:
+        return 0, 0.0
+    update_id, saved_at = value.split()
+    return int(update_id), float(saved_at)
+
+
+class UpdateDeduplicator:
+    """Учет обработанных обновлений"""
+
+    def __init__(
+        self, capacity: int = DEFAULT_DEDUP_CAPACITY, clock: Callable[[], float] = time.time
+    ):
+        self.capacity = capacity
+        self._clock = clock
+        self._recent: "OrderedDict[Hashable, None]" = OrderedDict()
+        # update_id обрабатываемых обновлений
+        self._inflight: Set[int] = set()
+        # Обработанные, но удержанные до release обновления
+        self._held: Set[int] = set()
+        # Все обновления до _done включительно обработаны или пропущены, _finished -
+        # обработанные после первого пропуска в ряду
+        self._done: Optional[int] = None
+        self._finished: Set[int] = set()
+        # Время последнего продвижения _done, от него отсчитывается ожидание пропуска
+        self._advanced_at = 0.0
+        # Граница, восстановленная при запуске; во время работы не меняется
+        self.high_water = 0
+        self.last_update_at = 0.0
+        self._update_id_hits = DUPLICATE_UPDATES.labels("update_id")
+        self._message_hits = DUPLICATE_UPDATES.labels("message")
+        self._high_water_hits = DUPLICATE_UPDATES.labels("high_water")
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def restore(self, value: Optional[str]) -> None:
+        """Загрузка сохраненной границы, если она не устарела"""
+        update_id, saved_at = parse_high_water(value)
+        if self._clock() - saved_at < HIGH_WATER_TTL:
+            self.high_water = max(self.high_water, update_id)
+            self.last_update_at = max(self.last_update_at, saved_at)
+
+    def dump(self) -> str:
+        return f"{self.watermark()} {self.last_update_at}"
+
+    def begin(self, update: object) -> bool:
+        """Регистрация обновления перед обработкой, False для повтора"""
+        keys = update_keys(update)
+        if not keys:
+            return True
+        now = self._clock()
+        if now - self.last_update_at >= HIGH_WATER_TTL:
+            # update_id мог начаться заново
+            self.high_water = 0
+            self._done = None
+            self._finished.clear()
+        self.last_update_at = now
+
+        update_id = keys[0]
+        assert isinstance(update_id, int)
+        if update_id in self._recent:
+            self._update_id_hits.inc()
+            return False
+        if any(key in self._recent for key in keys[1:]):
+            self._message_hits.inc()
+            return False
+        if update_id <= self.high_water:
+            self._high_water_hits.inc()
+            return False
+
+        for key in keys:
+            self._recent[key] = None
+        while len(self._recent) > self.capacity:
+            self._recent.popitem(last=False)
+        self._inflight.add(update_id)
+        if self._done is None:
+            # Ряд начинается с восстановленной границы или с первого обновления
+            self._done = self.high_water or update_id - 1
+            self._advanced_at = now
+        return True
+
+    def finish(self, update: object) -> None:
+        """Завершение обработки обновления, в том числе с ошибкой"""
+        if not isinstance(update, Update) or update.update_id in self._held:
+            return
+        if update.update_id in self._inflight:
+            self._inflight.remove(update.update_id)
+            if self._done is not None and update.update_id > self._done:
+                self._finished.add(update.update_id)
+                self._advance()
+
+    def hold(self, update: object) -> None:
+        """Обновление остается незавершенным после finish до вызова release"""
+        if isinstance(update, Update) and update.update_id in self._inflight:
+            self._held.add(update.update_id)
+
+    def release(self, update: object) -> None:
+        """Завершение удержанного обновления"""
+        if isinstance(update, Update):
+            self._held.discard(update.update_id)
+            self.finish(update)
+
+    def watermark(self) -> int:
+        """Наибольший update_id, до которого включительно все обновления обработаны"""
+        if self._done is None:
+            return self.high_water
+        self._advance()
+        done = self._done
+        if self._inflight:
+            # Обновление, пришедшее раньше начала ряда, может еще обрабатываться
+            done = min(done, min(self._inflight) - 1)
+        return max(self.high_water, done)
+
+    def _advance(self) -> None:
+        assert self._done is not None
+        while self._finished:
+            following = self._done + 1
+            if following in self._finished:
+                self._finished.remove(following)
+                self._done = following
+                self._advanced_at = self._clock()
+            elif following in self._inflight:
+                break
+            elif self._clock() - self._advanced_at >= MISSING_UPDATE_TIMEOUT:
+                # Пропуск в ряду: не пришедшие update_id до следующего известного
+                seen = min(self._finished | {i for i in self._inflight if i > self._done})
+                self._done = seen - 1
+                self._advanced_at = self._clock()
+            else:
+                break
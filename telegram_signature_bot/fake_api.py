@@ -0,0 +1,304 @@
+"""
+Локальная замена Telegram Bot API для нагрузочного и сквозного тестирования.
+
+Сервер отвечает на запросы бота по адресу /bot<token>/<method>: отдает обновления
+через getUpdates, принимает отправки сообщений и медиафайлов и записывает их для
+последующей проверки. Обновления добавляются методом inject или генерируются
+с заданной скоростью. Можно задать задержку ответа и долю ответов 429, чтобы
+проверить поведение бота при ограничениях Telegram.
+
+Бот подключается к серверу через base_url, например TELEGRAM_API_URL=http://127.0.0.1:8081/bot
+"""
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+import zlib
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qsl
+
+from .httpserver import HttpRequest, HttpResponse, HttpServer
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые возвращают отправленное сообщение
+MESSAGE_METHODS = frozenset(
+    {
+        "sendmessage",
+        "sendphoto",
+        "sendvideo",
+        "sendanimation",
+        "sendaudio",
+        "sendvoice",
+        "senddocument",
+        "sendvideonote",
+        "sendsticker",
+    }
+)
+
+# Методы, которые можно ограничивать ответом 429
+SEND_METHODS = MESSAGE_METHODS | {"copymessage", "sendmediagroup"}
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+# Бот - администратор любого чата с правом публикации
+BOT_ADMINISTRATOR = {
+    "status": "administrator",
+    "user": BOT_USER,
+    "can_be_edited": False,
+    "is_anonymous": False,
+    "can_manage_chat": True,
+    "can_delete_messages": True,
+    "can_manage_video_chats": False,
+    "can_restrict_members": False,
+    "can_promote_members": False,
+    "can_change_info": False,
+    "can_invite_users": False,
+    "can_post_messages": True,
+    "can_edit_messages": True,
+}
+
+
+class SentRequest(NamedTuple):
+    """Запрос бота, принятый сервером"""
+
+    method: str
+    params: Dict[str, Any]
+    time: float
+
+
+def _parse_params(request: HttpRequest) -> Dict[str, Any]:
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        return json.loads(request.body) if request.body else {}
+    params: Dict[str, Any] = dict(request.query)
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        params.update(parse_qsl(request.body.decode()))
+    # Сложные параметры передаются строкой JSON
+    for key, value in params.items():
+        if isinstance(value, str) and value[:1] in "[{":
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                pass
+    return params
+
+
+def text_update(update_id: int, user_id: int, text: str) -> Dict[str, Any]:
+    """Текстовое сообщение пользователя в личном чате с ботом"""
+    message: Dict[str, Any] = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        # Команда распознается обработчиками по entity bot_command
+        command = {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+        message["entities"] = [command]
+    return {"update_id": update_id, "message": message}
+
+
+class FakeTelegramServer:
+    """Сервер, имитирующий Bot API для одного или нескольких ботов"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        flood_rate: float = 0.0,
+        retry_after: int = 1,
+        seed: Optional[int] = None,
+    ):
+        self.http = HttpServer(self.handle_request, host, port)
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+        self.sent: List[SentRequest] = []
+        self.flood_responses = 0
+        self.updates_served = 0
+        self._updates: List[Dict[str, Any]] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_updates: Optional[asyncio.Condition] = None
+        self._listeners: List[Callable[[SentRequest], None]] = []
+        self._traffic: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def base_url(self) -> str:
+        """Адрес для base_url бота"""
+        return f"{self.http.url}/bot"
+
+    async def start(self) -> None:
+        self._new_updates = asyncio.Condition()
+        await self.http.start()
+        logger.info(f"Fake Bot API listening on {self.http.url}")
+
+    async def stop(self) -> None:
+        await self.stop_traffic()
+        await self.http.stop()
+
+    def next_update_id(self) -> int:
+        return next(self._update_ids)
+
+    async def inject(self, update: Dict[str, Any]) -> None:
+        """Добавление обновления для следующего getUpdates"""
+        assert self._new_updates is not None
+        async with self._new_updates:
+            self._updates.append(update)
+            self._new_updates.notify_all()
+
+    async def inject_text(self, user_id: int, text: str) -> int:
+        """Добавление текстового сообщения пользователя, возвращает update_id"""
+        update_id = self.next_update_id()
+        await self.inject(text_update(update_id, user_id, text))
+        return update_id
+
+    async def inject_edit(self, user_id: int, message_id: int, text: str) -> int:
+        """Добавление правки текстового сообщения пользователя, возвращает update_id"""
+        update_id = self.next_update_id()
+        update = text_update(update_id, user_id, text)
+        message = update.pop("message")
+        message.update(message_id=message_id, edit_date=int(time.time()))
+        update["edited_message"] = message
+        await self.inject(update)
+        return update_id
+
+    def start_traffic(
+        self, rate: float, count: int, users: int, text: Callable[[int], str] = str
+    ) -> None:
+        """Фоновая генерация count текстовых сообщений от users пользователей со скоростью rate"""
+        self._traffic = asyncio.create_task(self._generate(rate, count, users, text))
+
+    async def stop_traffic(self) -> None:
+        if self._traffic is not None:
+            self._traffic.cancel()
+            try:
+                await self._traffic
+            except asyncio.CancelledError:
+                pass
+            self._traffic = None
+
+    def add_listener(self, listener: Callable[[SentRequest], None]) -> None:
+        """Вызов listener для каждого принятого запроса отправки"""
+        self._listeners.append(listener)
+
+    def requests(self, method: str) -> List[SentRequest]:
+        """Принятые запросы с заданным методом"""
+        return [sent for sent in self.sent if sent.method == method.lower()]
+
+    async def _generate(
+        self, rate: float, count: int, users: int, text: Callable[[int], str]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for index in range(count):
+            # Расписание от начала генерации, чтобы задержки event loop не снижали скорость
+            delay = started + index / rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.inject_text(self.random.randint(1, users), text(index))
+
+    async def handle_request(self, request: HttpRequest) -> HttpResponse:
+        """Маршрутизация /bot<token>/<method>"""
+        parts = request.path.strip("/").split("/")
+        if len(parts) != 2 or not parts[0].startswith("bot"):
+            return self._error(HTTPStatus.NOT_FOUND, "Not Found")
+        method = parts[1].lower()
+        try:
+            params = _parse_params(request)
+        except ValueError:
+            return self._error(HTTPStatus.BAD_REQUEST, "Bad Request: invalid parameters")
+
+        if method == "getupdates":
+            return self._ok(await self._get_updates(params))
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method in SEND_METHODS and self.random.random() < self.flood_rate:
+            self.flood_responses += 1
+            return self._error(
+                HTTPStatus.TOO_MANY_REQUESTS,
+                f"Too Many Requests: retry after {self.retry_after}",
+                {"retry_after": self.retry_after},
+            )
+        sent = SentRequest(method, params, time.monotonic())
+        self.sent.append(sent)
+        for listener in self._listeners:
+            listener(sent)
+        return self._ok(self._result(method, params))
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        assert self._new_updates is not None
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        async with self._new_updates:
+            # Обновления до offset подтверждены ботом
+            if offset:
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            if not self._updates and timeout:
+                try:
+                    await asyncio.wait_for(self._new_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._updates[:limit]
+        self.updates_served += len(batch)
+        return batch
+
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == "getme":
+            return BOT_USER
+        if method in MESSAGE_METHODS:
+            return self._message(params)
+        if method == "copymessage":
+            return {"message_id": next(self._message_ids)}
+        if method == "sendmediagroup":
+            return [self._message(params) for _ in params.get("media", ())]
+        if method == "getchat":
+            return self._chat(params.get("chat_id"))
+        if method == "getchatmember":
+            return BOT_ADMINISTRATOR
+        return True
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(params.get("chat_id")),
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        return message
+
+    @staticmethod
+    def _chat(chat_id: Any) -> Dict[str, Any]:
+        chat_id = str(chat_id)
+        if chat_id.lstrip("-").isdigit():
+            chat_type = "private" if int(chat_id) > 0 else "channel"
+            return {"id": int(chat_id), "type": chat_type}
+        # Стабильный идентификатор канала по его имени
+        channel_id = -1000000000000 - zlib.crc32(chat_id.encode())
+        return {"id": channel_id, "type": "channel", "username": chat_id.lstrip("@")}
+
+    @staticmethod
+    def _ok(result: Any) -> HttpResponse:
+        body = json.dumps({"ok": True, "result": result}).encode()
+        return HttpResponse(HTTPStatus.OK, body, "application/json")
+
+    @staticmethod
+    def _error(
+        status: int, description: str, parameters: Optional[Dict[str, Any]] = None
+    ) -> HttpResponse:
+        data: Dict[str, Any] = {"ok": False, "error_code": int(status), "description": description}
+        if parameters:
+            data["parameters"] = parameters
+        return HttpResponse(status, json.dumps(data).encode(), "application/json")
@@ -0,0 +1,151 @@
+"""
+Минимальный HTTP/1.1 сервер на asyncio для служебных эндпоинтов бота.
+
+Поддерживает keep-alive и тела запросов с Content-Length, чего достаточно для вебхуков
+Telegram и локальных служебных страниц. Маршрутизация выполняется обработчиком.
+"""
+import asyncio
+import logging
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Ограничение размера тела запроса
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+
+class HttpRequest(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes
+
+
+class HttpResponse(NamedTuple):
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+
+
+Handler = Callable[[HttpRequest], Awaitable[HttpResponse]]
+
+
+class HttpServer:
+    """HTTP сервер, передающий каждый запрос одному обработчику"""
+
+    def __init__(
+        self,
+        handler: Handler,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        max_connections: Optional[int] = None,
+    ):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set["asyncio.Task[None]"] = set()
+        self._limit: Optional[asyncio.Semaphore] = None
+
+    async def start(self) -> None:
+        """Запуск сервера; при port=0 порт выбирается системой и сохраняется в self.port"""
+        if self.max_connections:
+            self._limit = asyncio.Semaphore(self.max_connections)
+        self._server = await asyncio.start_server(self._on_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        """Остановка сервера и закрытие открытых соединений"""
+        if self._server is None:
+            return
+        self._server.close()
+        for task in list(self._connections):
+            task.cancel()
+        await self._server.wait_closed()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _on_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        assert task is not None
+        self._connections.add(task)
+        try:
+            if self._limit is not None:
+                async with self._limit:
+                    await self._serve(reader, writer)
+            else:
+                await self._serve(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # Соединение закрывается при остановке сервера; отмена не передается дальше,
+            # иначе asyncio в Python 3.11 сообщает об ошибке в обратном вызове потока
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while True:
+            parsed = await self._read_request(reader)
+            if parsed is None:
+                return
+            request, keep_alive = parsed
+            try:
+                response = await self.handler(request)
+            except Exception:
+                logger.exception(f"Error handling {request.method} {request.path}")
+                response = HttpResponse(500, b"Internal Server Error")
+            self._write_response(writer, response, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                return
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> Optional[Tuple[HttpRequest, bool]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, version = request_line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", "0"))
+        if length > MAX_BODY_SIZE:
+            raise ConnectionError("Request body is too large")
+        body = await reader.readexactly(length) if length else b""
+
+        url = urlsplit(target)
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" and (version != "HTTP/1.0" or connection == "keep-alive")
+        request = HttpRequest(method.upper(), url.path, dict(parse_qsl(url.query)), headers, body)
+        return request, keep_alive
+
+    @staticmethod
+    def _write_response(
+        writer: asyncio.StreamWriter, response: HttpResponse, keep_alive: bool
+    ) -> None:
+        reason = HTTPStatus(response.status).phrase
+        head = (
+            f"HTTP/1.1 {response.status} {reason}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Content-Length: {len(response.body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + response.body)
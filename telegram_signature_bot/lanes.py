@@ -0,0 +1,151 @@
+"""
+Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+Обновления разных пользователей обрабатываются одновременно, а обновления одного
+пользователя - строго по очереди в порядке получения, поэтому его сообщения публикуются
+в каналы в том же порядке, в котором он их отправил. Обновление, ожидающее своей
+очереди, не занимает место в лимите одновременной обработки: медленный пользователь
+не задерживает остальных.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Dict, Generic, Hashable, Optional, TypeVar
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from .dedup import UpdateDeduplicator
+
+K = TypeVar("K", bound=Hashable)
+
+DEFAULT_UPDATE_CONCURRENCY = 64
+# Ограничение принятых, но еще не обработанных обновлений
+DEFAULT_MAX_PENDING_UPDATES = 4096
+
+logger = logging.getLogger(__name__)
+
+
+class Lanes(Generic[K]):
+    """Очереди по ключу: владельцы одного ключа выполняются по одному в порядке входа"""
+
+    def __init__(self) -> None:
+        # Ключ -> future, завершающийся, когда последний вошедший освободит очередь
+        self._tails: Dict[K, "asyncio.Future[None]"] = {}
+        # Ключ -> число выполняемых и ожидающих владельцев
+        self._depths: Dict[K, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._depths)
+
+    def depth(self, key: K) -> int:
+        return self._depths.get(key, 0)
+
+    @asynccontextmanager
+    async def hold(self, key: K) -> AsyncIterator[None]:
+        """Ожидание очереди ключа; место в очереди занимается до первого await"""
+        previous = self._tails.get(key)
+        turn: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._tails[key] = turn
+        self._depths[key] = self._depths.get(key, 0) + 1
+        try:
+            if previous is not None:
+                # Отмена ожидающего не должна отменять future предыдущего
+                await asyncio.shield(previous)
+            yield
+        finally:
+            self._depths[key] -= 1
+            if not self._depths[key]:
+                del self._depths[key]
+            if previous is not None and not previous.done():
+                # Отмененный в ожидании передает очередь только после предыдущего
+                previous.add_done_callback(lambda _: self._pass(key, turn))
+            else:
+                self._pass(key, turn)
+
+    def _pass(self, key: K, turn: "asyncio.Future[None]") -> None:
+        turn.set_result(None)
+        if self._tails.get(key) is turn:
+            del self._tails[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Число очередей, ожидающих владельцев и глубина самой длинной очереди"""
+        return {
+            "lanes": len(self._depths),
+            "waiting": sum(self._depths.values()) - len(self._depths),
+            "max_depth": max(self._depths.values(), default=0),
+        }
+
+
+def lane_key(update: object) -> Optional[int]:
+    """Очередь обновления: пользователь, иначе чат; None - без ограничения порядка"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class LaneUpdateProcessor(BaseUpdateProcessor):
+    """Обработчик обновлений PTB с очередью на каждого пользователя.
+
+    Лимит PTB (max_concurrent_updates) ограничивает принятые обновления вместе с
+    ожидающими своей очереди, а max_running_updates - одновременно выполняемые.
+    Повторно доставленные обновления отбрасываются до вызова обработчиков.
+    """
+
+    def __init__(
+        self,
+        max_running_updates: int = DEFAULT_UPDATE_CONCURRENCY,
+        max_pending_updates: int = DEFAULT_MAX_PENDING_UPDATES,
+        deduplicator: Optional[UpdateDeduplicator] = None,
+    ):
+        if max_running_updates < 1:
+            raise ValueError("`max_running_updates` must be a positive integer!")
+        super().__init__(max(max_pending_updates, max_running_updates))
+        self.max_running_updates = max_running_updates
+        self._running: Optional[asyncio.BoundedSemaphore] = None
+        self.lanes: Lanes[int] = Lanes()
+        self.deduplicator = deduplicator
+        self.running = 0
+
+    async def initialize(self) -> None:
+        # Семафор создается в цикле событий приложения
+        self._running = asyncio.BoundedSemaphore(self.max_running_updates)
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        if self._running is None:
+            await self.initialize()
+        assert self._running is not None
+        if self.deduplicator is not None and not self.deduplicator.begin(update):
+            logger.info(f"Dropping duplicate update {getattr(update, 'update_id', update)}")
+            if asyncio.iscoroutine(coroutine):
+                coroutine.close()
+            return
+        try:
+            key = lane_key(update)
+            if key is None:
+                async with self._running:
+                    await self._run(coroutine)
+                return
+            async with self.lanes.hold(key):
+                async with self._running:
+                    await self._run(coroutine)
+        finally:
+            if self.deduplicator is not None:
+                self.deduplicator.finish(update)
+
+    async def _run(self, coroutine: "Awaitable[Any]") -> None:
+        self.running += 1
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"running": self.running, **self.lanes.stats()}
@@ -1,14 +1,28 @@
+import asyncio
 import logging
 import os
 import sys
 from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
 
 from dotenv import load_dotenv
 
 from .bot import SignatureBot
+from .cache import ProfileCache
+from .database import Database
+from .dedup import DEFAULT_DEDUP_CAPACITY
+from .lanes import DEFAULT_UPDATE_CONCURRENCY
+from .outbox import DEFAULT_MESSAGE_MAP_TTL
+from .request import SEND_PROFILE, UPDATES_PROFILE, RequestProfile, SharedRequest
+from .scheduler import SendScheduler
+from .sharding import DEFAULT_SHARDS
+from .snapshot import DEFAULT_SNAPSHOT_SIZE
+from .storage import create_storage
+from .tenants import TenantConfig, TenantRunner
+from .webhook import WebhookConfig
 
 
-def load_environment():
+def load_environment(required_vars: Sequence[str] = ("TELEGRAM_BOT_TOKEN",)):
     """Загрузка переменных окружения"""
     # Загружаем .env файл
     env_path = Path(__file__).parent.parent / ".env"
@@ -16,7 +30,6 @@ def load_environment():
         load_dotenv(env_path)
 
     # Проверяем наличие требуемых переменных
-    required_vars = ["TELEGRAM_BOT_TOKEN"]
     missing_vars = [var for var in required_vars if not os.getenv(var)]
 
     if missing_vars:
@@ -24,38 +37,197 @@ def load_environment():
         sys.exit(1)
 
 
-def main() -> None:
-    """Основная функция для запуска бота"""
-    # Загружаем переменные окружения
-    load_environment()
+def data_directory() -> Path:
+    """Каталог данных бота, создается при необходимости"""
+    data_dir = Path.home() / "telegram-signature-bot" / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
 
-    # Настройка логирования
+
+def database_path(env: str) -> str:
+    """Путь к базе данных окружения"""
+    return str(data_directory() / f"{env}.db")
+
+
+def storage_path(env: str, backend: str) -> str:
+    """Файл базы данных окружения или каталог сегментов для хранилища sharded"""
+    if backend == "sharded":
+        return str(data_directory() / f"{env}-shards")
+    return database_path(env)
+
+
+def load_webhook_config() -> Optional[WebhookConfig]:
+    """Параметры вебхука, если выбран режим UPDATE_MODE=webhook"""
+    if os.getenv("UPDATE_MODE", "polling") != "webhook":
+        return None
+    url = os.getenv("WEBHOOK_URL")
+    if not url:
+        print("Error: WEBHOOK_URL is required when UPDATE_MODE=webhook")
+        sys.exit(1)
+    return WebhookConfig(
+        url=url,
+        listen=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+        port=int(os.getenv("WEBHOOK_PORT", "8443")),
+        path=os.getenv("WEBHOOK_PATH", "/webhook"),
+        secret_token=os.getenv("WEBHOOK_SECRET") or None,
+        max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")),
+    )
+
+
+def load_request_profile(prefix: str, default: RequestProfile) -> RequestProfile:
+    """Параметры пула соединений Bot API из переменных <prefix>_POOL_SIZE и т.д."""
+
+    def number(name: str, value: float) -> float:
+        return float(os.getenv(f"{prefix}_{name}", str(value)))
+
+    keepalive = os.getenv(f"{prefix}_KEEPALIVE")
+    return RequestProfile(
+        pool_size=int(os.getenv(f"{prefix}_POOL_SIZE", str(default.pool_size))),
+        keepalive=int(keepalive) if keepalive else default.keepalive,
+        keepalive_expiry=number("KEEPALIVE_EXPIRY", default.keepalive_expiry),
+        http_version=os.getenv(f"{prefix}_HTTP_VERSION", default.http_version),
+        connect_timeout=number("CONNECT_TIMEOUT", default.connect_timeout),
+        read_timeout=number("READ_TIMEOUT", default.read_timeout),
+        write_timeout=number("WRITE_TIMEOUT", default.write_timeout),
+        pool_timeout=number("POOL_TIMEOUT", default.pool_timeout),
+    )
+
+
+def setup_logging() -> None:
     log_level = os.getenv("LOG_LEVEL", "INFO")
     logging.basicConfig(
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         level=getattr(logging, log_level),
     )
 
+
+def load_profile_cache() -> ProfileCache:
+    """Кэш профилей пользователей с параметрами из окружения"""
+    max_bytes = os.getenv("PROFILE_CACHE_MAX_BYTES")
+    return ProfileCache(
+        max_entries=int(os.getenv("PROFILE_CACHE_SIZE", "100000")),
+        ttl=float(os.getenv("PROFILE_CACHE_TTL", "300")),
+        max_bytes=int(max_bytes) if max_bytes else None,
+    )
+
+
+def bot_options() -> Dict[str, Any]:
+    """Параметры SignatureBot из окружения, общие для start-bot и start-bots"""
+    return dict(
+        channel_concurrency=int(os.getenv("CHANNEL_CONCURRENCY", "5")),
+        dedup_capacity=int(os.getenv("DEDUP_CAPACITY", str(DEFAULT_DEDUP_CAPACITY))),
+        update_concurrency=int(os.getenv("UPDATE_CONCURRENCY", str(DEFAULT_UPDATE_CONCURRENCY))),
+        # Ограничения скорости Telegram действуют для каждого бота отдельно
+        scheduler=SendScheduler(
+            global_rate=float(os.getenv("SEND_RATE_GLOBAL", "30")),
+            channel_rate=float(os.getenv("SEND_RATE_CHANNEL", "20")) / 60,
+        ),
+        album_window=float(os.getenv("ALBUM_WINDOW", "1.0")),
+        outbox_max_attempts=int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5")),
+        base_url=os.getenv("TELEGRAM_API_URL") or None,
+        updates_profile=load_request_profile("TELEGRAM_UPDATES", UPDATES_PROFILE),
+        channel_access_ttl=float(os.getenv("CHANNEL_ACCESS_TTL", "600")),
+        message_map_ttl=float(os.getenv("MESSAGE_MAP_TTL", str(DEFAULT_MESSAGE_MAP_TTL))),
+        admin_ids=[int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id],
+        profile_dir=os.getenv("PROFILE_DIR") or str(data_directory() / "profiles"),
+    )
+
+
+def main() -> None:
+    """Основная функция для запуска бота"""
+    # Загружаем переменные окружения
+    load_environment()
+
+    # Настройка логирования
+    setup_logging()
+
     logger = logging.getLogger(__name__)
+    webhook = load_webhook_config()
 
     try:
         # Получаем токен
         token = os.getenv("TELEGRAM_BOT_TOKEN")
 
-        # Определяем путь к базе данных
-        env = os.getenv("ENVIRONMENT", "development")
-        data_dir = Path.home() / "telegram-signature-bot" / "data"
-        data_dir.mkdir(parents=True, exist_ok=True)
-        db_path = str(data_dir / f"{env}.db")
+        # Определяем хранилище и путь к базе данных
+        backend = os.getenv("STORAGE_BACKEND", "sqlite")
+        db_path = storage_path(os.getenv("ENVIRONMENT", "development"), backend)
+
+        # Настраиваем кэш профилей пользователей
+        profile_cache = load_profile_cache()
+
+        storage = create_storage(
+            backend,
+            db_path,
+            shards=int(os.getenv("STORAGE_SHARDS", str(DEFAULT_SHARDS))),
+            cache=profile_cache,
+            write_window=float(os.getenv("DB_WRITE_WINDOW", "0")),
+        )
+
+        # Снимок активных профилей для быстрого старта после перезапуска, 0 - отключен
+        snapshot_size = int(os.getenv("PROFILE_SNAPSHOT_SIZE", str(DEFAULT_SNAPSHOT_SIZE)))
+
+        # Эндпоинт /metrics включается указанием порта
+        metrics_port = os.getenv("METRICS_PORT")
 
         # Инициализируем и запускаем бота
-        bot = SignatureBot(token, db_path)
-        logger.info(f"Бот запущен с базой данных {db_path}")
-        bot.run()
+        bot = SignatureBot(
+            token,
+            db_path,
+            storage=storage,
+            snapshot_path=f"{db_path}.snapshot" if snapshot_size and backend != "memory" else None,
+            snapshot_size=snapshot_size,
+            send_profile=load_request_profile("TELEGRAM_SEND", SEND_PROFILE),
+            metrics_port=int(metrics_port) if metrics_port else None,
+            metrics_host=os.getenv("METRICS_HOST", "127.0.0.1"),
+            # Профилирование первых секунд работы, например для разбора медленного старта
+            profile_seconds=float(os.getenv("PROFILE_SECONDS", "0")),
+            **bot_options(),
+        )
+        logger.info(f"Бот запущен с хранилищем {backend}: {db_path}")
+        bot.run(webhook)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {str(e)}")
         sys.exit(1)
 
 
+def main_tenants() -> None:
+    """Запуск нескольких ботов из файла конфигурации в одном процессе"""
+    load_environment(required_vars=())
+    setup_logging()
+    logger = logging.getLogger(__name__)
+
+    try:
+        config_path = os.getenv("TENANTS_CONFIG") or str(data_directory() / "tenants.json")
+        # Отдельная база: данные единственного бота start-bot хранятся с bot_id 0
+        db_path = database_path(f"{os.getenv('ENVIRONMENT', 'development')}-tenants")
+
+        def make_bot(
+            config: TenantConfig, storage: Database, send_request: SharedRequest
+        ) -> SignatureBot:
+            return SignatureBot(
+                config.token,
+                db_path,
+                storage=storage,
+                send_request=send_request,
+                **bot_options(),
+            )
+
+        metrics_port = os.getenv("METRICS_PORT")
+        runner = TenantRunner(
+            db_path,
+            bot_factory=make_bot,
+            send_profile=load_request_profile("TELEGRAM_SEND", SEND_PROFILE),
+            cache_factory=load_profile_cache,
+            write_window=float(os.getenv("DB_WRITE_WINDOW", "0")),
+            metrics_port=int(metrics_port) if metrics_port else None,
+            metrics_host=os.getenv("METRICS_HOST", "127.0.0.1"),
+        )
+        logger.info(f"Боты запускаются из {config_path} с базой {db_path}")
+        asyncio.run(runner.run(config_path))
+    except Exception as e:
+        logger.error(f"Ошибка при запуске ботов: {str(e)}")
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
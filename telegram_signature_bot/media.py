@@ -0,0 +1,61 @@
+"""
+Таблица поддерживаемых типов медиафайлов.
+
+Медиафайлы пересылаются через copy_message с заменой caption, без повторной загрузки
+и без отдельной ветки на каждый тип. Методы send_* из таблицы используются только
+для сообщений с защищенным содержимым, которые нельзя копировать.
+"""
+from typing import NamedTuple, Optional, Tuple, cast
+
+from telegram import Message
+from telegram.ext import filters
+
+
+class MediaKind(NamedTuple):
+    # Атрибут сообщения с медиафайлом
+    attribute: str
+    # Метод Bot для отправки по file_id
+    send_method: str
+    # Может ли сообщение этого типа иметь caption
+    supports_caption: bool = True
+
+
+# Порядок важен: анимации также содержат document, поэтому проверяются раньше
+MEDIA_KINDS: Tuple[MediaKind, ...] = (
+    MediaKind("photo", "send_photo"),
+    MediaKind("video", "send_video"),
+    MediaKind("animation", "send_animation"),
+    MediaKind("audio", "send_audio"),
+    MediaKind("voice", "send_voice"),
+    MediaKind("document", "send_document"),
+    MediaKind("video_note", "send_video_note", supports_caption=False),
+    MediaKind("sticker", "send_sticker", supports_caption=False),
+)
+
+# Единый фильтр для всех типов из таблицы
+MEDIA_FILTER = (
+    filters.PHOTO
+    | filters.VIDEO
+    | filters.ANIMATION
+    | filters.AUDIO
+    | filters.VOICE
+    | filters.Document.ALL
+    | filters.VIDEO_NOTE
+    | filters.Sticker.ALL
+)
+
+
+def media_kind(message: Message) -> Optional[MediaKind]:
+    """Тип медиафайла в сообщении или None"""
+    for kind in MEDIA_KINDS:
+        if getattr(message, kind.attribute):
+            return kind
+    return None
+
+
+def media_file_id(message: Message, kind: MediaKind) -> str:
+    """file_id медиафайла, для фото - в наибольшем размере"""
+    media = getattr(message, kind.attribute)
+    if kind.attribute == "photo":
+        media = media[-1]
+    return cast(str, media.file_id)
@@ -0,0 +1,231 @@
+"""
+Хранилище в памяти процесса для тестов и бенчмарков.
+
+Повторяет поведение Database без файла и потоков aiosqlite: профили хранятся уже
+скомпилированными шаблонами, поэтому кэш профилей не нужен. Данные пропадают при
+остановке процесса.
+"""
+import itertools
+import json
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from telegram import MessageEntity
+
+from .cache import ProfileCache, UserProfile
+from .database import OutboxEntry, OutboxItem, PostedMessage, ProfileRecord
+from .template import SignatureTemplate, compile_signature, load_template
+
+
+class _OutboxRow:
+    __slots__ = ("entry", "status", "attempts", "next_attempt_at", "last_error")
+
+    def __init__(self, entry: OutboxEntry, now: float):
+        self.entry = entry
+        self.status = "pending"
+        self.attempts = 0
+        self.next_attempt_at = now
+        self.last_error: Optional[str] = None
+
+
+class MemoryStorage:
+    """Реализация Storage на словарях"""
+
+    def __init__(self, cache: Optional[ProfileCache] = None):
+        # Кэш не используется для чтения и нужен только для совместимости метрик бота
+        self.cache = cache if cache is not None else ProfileCache()
+        self._signatures: Dict[int, SignatureTemplate] = {}
+        self._channels: Dict[int, Set[str]] = {}
+        self._outbox: Dict[int, _OutboxRow] = {}
+        self._outbox_ids = itertools.count(1)
+        self._outbox_keys: Dict[str, int] = {}
+        self._meta: Dict[str, str] = {}
+        # (чат пользователя, исходное сообщение) -> (канал, часть) -> (сообщение, время)
+        self._posts: Dict[Tuple[int, int], Dict[Tuple[str, int], Tuple[int, float]]] = {}
+
+    async def connect(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def get_meta(self, key: str) -> Optional[str]:
+        return self._meta.get(key)
+
+    async def set_meta(self, key: str, value: str) -> None:
+        self._meta[key] = value
+
+    async def set_signature(
+        self, user_id: int, signature: str, entities: Optional[List[MessageEntity]] = None
+    ) -> SignatureTemplate:
+        template = compile_signature(signature, entities)
+        self._signatures[user_id] = template
+        return template
+
+    async def get_signature(self, user_id: int) -> Tuple[Optional[str], Optional[List[dict]]]:
+        template = self._signatures.get(user_id)
+        if template is None:
+            return None, None
+        entities_json = template.entities_json()
+        return template.text, json.loads(entities_json) if entities_json else None
+
+    async def remove_signature(self, user_id: int) -> None:
+        self._signatures.pop(user_id, None)
+
+    async def add_channel(self, user_id: int, channel_id: str) -> None:
+        self._channels.setdefault(user_id, set()).add(channel_id)
+
+    async def set_channel(self, user_id: int, channel_id: str) -> None:
+        self._channels[user_id] = {channel_id}
+
+    async def get_channels(self, user_id: int) -> List[str]:
+        # Порядок как у первичного ключа таблицы profile_channels
+        return sorted(self._channels.get(user_id, ()))
+
+    async def remove_channel(self, user_id: int, channel_id: Optional[str] = None) -> int:
+        channels = self._channels.get(user_id)
+        if not channels:
+            return 0
+        if channel_id is None:
+            del self._channels[user_id]
+            return len(channels)
+        if channel_id not in channels:
+            return 0
+        channels.discard(channel_id)
+        if not channels:
+            del self._channels[user_id]
+        return 1
+
+    async def get_profile(self, user_id: int) -> UserProfile:
+        return UserProfile(
+            self._signatures.get(user_id), tuple(sorted(self._channels.get(user_id, ())))
+        )
+
+    async def enqueue_outbox(self, items: Sequence[OutboxEntry]) -> None:
+        now = time.time()
+        for entry in items:
+            if entry.key is not None and entry.key in self._outbox_keys:
+                continue
+            item_id = next(self._outbox_ids)
+            if entry.key is not None:
+                self._outbox_keys[entry.key] = item_id
+            self._outbox[item_id] = _OutboxRow(entry._replace(chat_id=str(entry.chat_id)), now)
+
+    def _channel_heads(self) -> Iterator[Tuple[int, _OutboxRow]]:
+        """Первые недоставленные записи каналов, как в Database.claim_outbox"""
+        channels: Set[Union[int, str]] = set()
+        # Словарь упорядочен по возрастанию id
+        for item_id, row in self._outbox.items():
+            if row.status == "dead" or row.entry.chat_id in channels:
+                continue
+            channels.add(row.entry.chat_id)
+            if row.status == "pending":
+                yield item_id, row
+
+    async def claim_outbox(self, limit: int, now: float) -> List[OutboxItem]:
+        items: List[OutboxItem] = []
+        for item_id, row in self._channel_heads():
+            if len(items) >= limit:
+                break
+            if row.next_attempt_at <= now:
+                entry = row.entry
+                items.append(
+                    OutboxItem(
+                        item_id,
+                        entry.user_id,
+                        entry.user_chat_id,
+                        str(entry.chat_id),
+                        entry.method,
+                        entry.payload,
+                        row.attempts,
+                        entry.source_message_id,
+                        entry.part,
+                    )
+                )
+        for item in items:
+            self._outbox[item.id].status = "inflight"
+        return items
+
+    async def next_outbox_attempt(self) -> Optional[float]:
+        return min((row.next_attempt_at for _, row in self._channel_heads()), default=None)
+
+    async def complete_outbox(self, item_id: int, message_id: Optional[int] = None) -> None:
+        row = self._outbox.pop(item_id, None)
+        if row is None:
+            return
+        entry = row.entry
+        if entry.key is not None:
+            del self._outbox_keys[entry.key]
+        if message_id is not None and entry.source_message_id is not None:
+            posts = self._posts.setdefault((entry.user_chat_id, entry.source_message_id), {})
+            posts[(str(entry.chat_id), entry.part)] = (message_id, time.time())
+
+    async def retry_outbox(self, item_id: int, next_attempt_at: float, error: str) -> None:
+        row = self._outbox.get(item_id)
+        if row is not None:
+            row.status = "pending"
+            row.attempts += 1
+            row.next_attempt_at = next_attempt_at
+            row.last_error = error
+
+    async def dead_letter_outbox(self, item_id: int, error: str) -> None:
+        row = self._outbox.get(item_id)
+        if row is not None:
+            row.status = "dead"
+            row.attempts += 1
+            row.last_error = error
+
+    async def recover_outbox(self) -> int:
+        recovered = 0
+        for row in self._outbox.values():
+            if row.status == "inflight":
+                row.status = "pending"
+                recovered += 1
+        return recovered
+
+    async def get_posts(
+        self, user_id: int, user_chat_id: int, source_message_id: int
+    ) -> List[PostedMessage]:
+        posts = self._posts.get((user_chat_id, source_message_id), {})
+        return [
+            PostedMessage(chat_id, part, message_id)
+            for (chat_id, part), (message_id, _) in sorted(posts.items())
+        ]
+
+    async def prune_posts(self, before: float) -> int:
+        removed = 0
+        for source, posts in list(self._posts.items()):
+            for key, (_, created_at) in list(posts.items()):
+                if created_at < before:
+                    del posts[key]
+                    removed += 1
+            if not posts:
+                del self._posts[source]
+        return removed
+
+    async def outbox_stats(self) -> Dict[str, int]:
+        stats: Dict[str, int] = {}
+        for row in self._outbox.values():
+            stats[row.status] = stats.get(row.status, 0) + 1
+        return stats
+
+    async def export_profiles(self) -> AsyncIterator[ProfileRecord]:
+        for user_id in sorted(self._signatures.keys() | self._channels.keys()):
+            signature, entities = await self.get_signature(user_id)
+            channels = tuple(await self.get_channels(user_id))
+            yield ProfileRecord(user_id, signature, entities, channels)
+
+    async def import_profiles(
+        self, records: Sequence[ProfileRecord], replace: bool = False
+    ) -> None:
+        for record in records:
+            if replace:
+                self._signatures.pop(record.user_id, None)
+                self._channels.pop(record.user_id, None)
+            if record.signature is not None:
+                entities_json = json.dumps(record.entities) if record.entities else None
+                self._signatures[record.user_id] = load_template(
+                    record.signature, None, entities_json
+                )
+            if record.channels:
+                self._channels.setdefault(record.user_id, set()).update(record.channels)
@@ -0,0 +1,299 @@
+"""
+Метрики работы бота в текстовом формате Prometheus.
+
+Счетчики и гистограммы объявляются на уровне модулей, которые их обновляют, и
+регистрируются в общем реестре REGISTRY. Запись значения - это обращение к словарю и
+поиск корзины гистограммы, поэтому метрики собираются всегда, а HTTP эндпоинт /metrics
+включается отдельно. Значения, которые и так хранятся в объектах бота (размеры очередей,
+счетчики кэша), считываются функциями обратного вызова в момент запроса.
+"""
+import functools
+import inspect
+import logging
+import math
+import time
+from bisect import bisect_left
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
+
+from .httpserver import HttpRequest, HttpResponse, HttpServer
+
+T = TypeVar("T")
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+LabelValues = Tuple[str, ...]
+Sample = Union[float, Dict[LabelValues, float]]
+
+# Корзины гистограмм длительности в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._children: Dict[LabelValues, _CounterChild] = {}
+
+    def labels(self, *values: str) -> _CounterChild:
+        """Счетчик для набора значений меток; результат можно сохранить заранее"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _CounterChild()
+        return child
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def collect(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}{labels} {_format_value(child.value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам, обычно длительностей в секундах"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._children: Dict[LabelValues, _HistogramChild] = {}
+
+    def labels(self, *values: str) -> _HistogramChild:
+        """Гистограмма для набора значений меток; результат можно сохранить заранее"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _HistogramChild(self.buckets)
+        return child
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def collect(self) -> Iterator[str]:
+        names = self.labelnames + ("le",)
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                labels = _format_labels(names, values + (_format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class CallbackMetric(_Metric):
+    """Метрика, значение которой вычисляется при каждом запросе /metrics.
+
+    Функция возвращает число или словарь значений по наборам меток и может быть
+    асинхронной, например для запроса размера очереди в базе данных.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Union[Sample, Awaitable[Sample]]],
+        labelnames: Sequence[str] = (),
+        type: str = "gauge",
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.type = type
+
+    async def sample(self) -> Dict[LabelValues, float]:
+        value = self.callback()
+        if inspect.isawaitable(value):
+            value = await value
+        if isinstance(value, dict):
+            return value
+        return {(): float(value)}  # type: ignore[arg-type]
+
+
+class Registry:
+    """Набор метрик, отображаемых на /metrics"""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: T) -> T:
+        assert isinstance(metric, _Metric)
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str) -> None:
+        self._metrics.pop(name, None)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Union[Sample, Awaitable[Sample]]],
+        labelnames: Sequence[str] = (),
+        type: str = "gauge",
+    ) -> CallbackMetric:
+        """Регистрация метрики с обратным вызовом, существующая заменяется"""
+        self.unregister(name)
+        return self.register(CallbackMetric(name, documentation, callback, labelnames, type))
+
+    async def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, CallbackMetric):
+                try:
+                    samples = await metric.sample()
+                except Exception:
+                    logger.exception(f"Error collecting metric {metric.name}")
+                    continue
+                lines.extend(metric.header())
+                for values, value in samples.items():
+                    labels = _format_labels(metric.labelnames, values)
+                    lines.append(f"{metric.name}{labels} {_format_value(value)}")
+            elif isinstance(metric, (Counter, Histogram)):
+                lines.extend(metric.header())
+                lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def timed(histogram: Histogram, errors: Counter, name: str) -> Callable[[F], F]:
+    """Декоратор асинхронной функции: длительность вызова и число ошибок с меткой name"""
+    child = histogram.labels(name)
+    failed = errors.labels(name)
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                failed.inc()
+                raise
+            finally:
+                child.observe(time.perf_counter() - started)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+class MetricsServer:
+    """HTTP сервер, отдающий метрики реестра на /metrics"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100, registry: Registry = REGISTRY):
+        self.registry = registry
+        self.http = HttpServer(self.handle_request, host, port)
+
+    async def start(self) -> None:
+        await self.http.start()
+        logger.info(f"Metrics available at {self.http.url}/metrics")
+
+    async def stop(self) -> None:
+        await self.http.stop()
+
+    async def handle_request(self, request: HttpRequest) -> HttpResponse:
+        if request.path != "/metrics":
+            return HttpResponse(404, b"Not Found")
+        if request.method != "GET":
+            return HttpResponse(405, b"Method Not Allowed")
+        body = await self.registry.render()
+        return HttpResponse(200, body.encode(), CONTENT_TYPE)
@@ -0,0 +1,313 @@
+"""
+Версионированные миграции схемы базы данных.
+
+Текущая версия схемы хранится в PRAGMA user_version. Каждая миграция выполняется
+в отдельной транзакции вместе с обновлением номера версии, поэтому прерванный запуск
+не оставляет базу в промежуточном состоянии.
+"""
+import logging
+from typing import Awaitable, Callable, List
+
+import aiosqlite
+
+from .template import utf16_len
+
+Migration = Callable[[aiosqlite.Connection], Awaitable[None]]
+
+logger = logging.getLogger(__name__)
+
+
+async def _create_initial_tables(conn: aiosqlite.Connection) -> None:
+    """Версия 1: раздельные таблицы подписей и каналов"""
+    # IF NOT EXISTS нужен для баз, созданных до появления миграций (user_version = 0)
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS signatures (
+            user_id INTEGER PRIMARY KEY,
+            signature TEXT NOT NULL,
+            entities TEXT
+        )
+    """
+    )
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS channels (
+            user_id INTEGER PRIMARY KEY,
+            channel_id TEXT NOT NULL
+        )
+    """
+    )
+
+
+async def _merge_profiles(conn: aiosqlite.Connection) -> None:
+    """Версия 2: единая строка профиля на пользователя"""
+    await conn.execute(
+        """
+        CREATE TABLE profiles (
+            user_id INTEGER PRIMARY KEY,
+            signature TEXT,
+            entities TEXT,
+            channel_id TEXT
+        )
+    """
+    )
+    await conn.execute(
+        """
+        INSERT INTO profiles (user_id, signature, entities, channel_id)
+        SELECT u.user_id, s.signature, s.entities, c.channel_id
+        FROM (SELECT user_id FROM signatures UNION SELECT user_id FROM channels) AS u
+        LEFT JOIN signatures AS s ON s.user_id = u.user_id
+        LEFT JOIN channels AS c ON c.user_id = u.user_id
+    """
+    )
+    await conn.execute("DROP TABLE signatures")
+    await conn.execute("DROP TABLE channels")
+
+
+async def _add_signature_length(conn: aiosqlite.Connection) -> None:
+    """Версия 3: длина подписи в кодовых единицах UTF-16 хранится рядом с текстом"""
+    await conn.execute("ALTER TABLE profiles ADD COLUMN signature_length INTEGER")
+    async with conn.execute(
+        "SELECT user_id, signature FROM profiles WHERE signature IS NOT NULL"
+    ) as cursor:
+        rows = await cursor.fetchall()
+    await conn.executemany(
+        "UPDATE profiles SET signature_length = ? WHERE user_id = ?",
+        [(utf16_len(signature), user_id) for user_id, signature in rows],
+    )
+
+
+async def _split_channels(conn: aiosqlite.Connection) -> None:
+    """Версия 4: несколько каналов на пользователя в отдельной таблице"""
+    await conn.execute(
+        """
+        CREATE TABLE profile_channels (
+            user_id INTEGER NOT NULL,
+            channel_id TEXT NOT NULL,
+            PRIMARY KEY (user_id, channel_id)
+        ) WITHOUT ROWID
+    """
+    )
+    await conn.execute(
+        """
+        INSERT INTO profile_channels (user_id, channel_id)
+        SELECT user_id, channel_id FROM profiles WHERE channel_id IS NOT NULL
+    """
+    )
+    # Пересоздаем таблицу профилей без колонки канала
+    await conn.execute(
+        """
+        CREATE TABLE profiles_new (
+            user_id INTEGER PRIMARY KEY,
+            signature TEXT NOT NULL,
+            entities TEXT,
+            signature_length INTEGER NOT NULL
+        )
+    """
+    )
+    await conn.execute(
+        """
+        INSERT INTO profiles_new (user_id, signature, entities, signature_length)
+        SELECT user_id, signature, entities, signature_length
+        FROM profiles WHERE signature IS NOT NULL
+    """
+    )
+    await conn.execute("DROP TABLE profiles")
+    await conn.execute("ALTER TABLE profiles_new RENAME TO profiles")
+
+
+async def _create_outbox(conn: aiosqlite.Connection) -> None:
+    """Версия 5: очередь отложенных отправок в каналы"""
+    await conn.execute(
+        """
+        CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            user_chat_id INTEGER NOT NULL,
+            chat_id TEXT NOT NULL,
+            method TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        )
+    """
+    )
+    await conn.execute("CREATE INDEX outbox_due ON outbox (status, next_attempt_at)")
+
+
+async def _create_meta(conn: aiosqlite.Connection) -> None:
+    """Версия 6: служебные параметры базы, например номер сегмента"""
+    await conn.execute(
+        """
+        CREATE TABLE meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """
+    )
+
+
+async def _index_outbox_channels(conn: aiosqlite.Connection) -> None:
+    """Версия 7: поиск первой недоставленной записи канала для доставки по порядку"""
+    await conn.execute(
+        """
+        CREATE INDEX outbox_channel ON outbox (chat_id, id)
+        WHERE status IN ('pending', 'inflight')
+    """
+    )
+
+
+async def _add_outbox_dedup_key(conn: aiosqlite.Connection) -> None:
+    """Версия 8: ключ идемпотентности записи очереди, повтор с тем же ключом не добавляется"""
+    await conn.execute("ALTER TABLE outbox ADD COLUMN dedup_key TEXT")
+    await conn.execute(
+        "CREATE UNIQUE INDEX outbox_dedup ON outbox (dedup_key) WHERE dedup_key IS NOT NULL"
+    )
+
+
+async def _add_bot_namespace(conn: aiosqlite.Connection) -> None:
+    """Версия 9: данные нескольких ботов в одной базе, bot_id 0 - единственный бот процесса"""
+    await conn.execute(
+        """
+        CREATE TABLE profiles_new (
+            bot_id INTEGER NOT NULL DEFAULT 0,
+            user_id INTEGER NOT NULL,
+            signature TEXT NOT NULL,
+            entities TEXT,
+            signature_length INTEGER NOT NULL,
+            PRIMARY KEY (bot_id, user_id)
+        ) WITHOUT ROWID
+    """
+    )
+    await conn.execute(
+        """
+        INSERT INTO profiles_new (user_id, signature, entities, signature_length)
+        SELECT user_id, signature, entities, signature_length FROM profiles
+    """
+    )
+    await conn.execute("DROP TABLE profiles")
+    await conn.execute("ALTER TABLE profiles_new RENAME TO profiles")
+
+    await conn.execute(
+        """
+        CREATE TABLE profile_channels_new (
+            bot_id INTEGER NOT NULL DEFAULT 0,
+            user_id INTEGER NOT NULL,
+            channel_id TEXT NOT NULL,
+            PRIMARY KEY (bot_id, user_id, channel_id)
+        ) WITHOUT ROWID
+    """
+    )
+    await conn.execute(
+        """
+        INSERT INTO profile_channels_new (user_id, channel_id)
+        SELECT user_id, channel_id FROM profile_channels
+    """
+    )
+    await conn.execute("DROP TABLE profile_channels")
+    await conn.execute("ALTER TABLE profile_channels_new RENAME TO profile_channels")
+
+    await conn.execute(
+        """
+        CREATE TABLE meta_new (
+            bot_id INTEGER NOT NULL DEFAULT 0,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (bot_id, key)
+        ) WITHOUT ROWID
+    """
+    )
+    await conn.execute("INSERT INTO meta_new (key, value) SELECT key, value FROM meta")
+    await conn.execute("DROP TABLE meta")
+    await conn.execute("ALTER TABLE meta_new RENAME TO meta")
+
+    # Очередь отправок каждого бота выбирается и упорядочивается отдельно
+    await conn.execute("ALTER TABLE outbox ADD COLUMN bot_id INTEGER NOT NULL DEFAULT 0")
+    await conn.execute("DROP INDEX outbox_due")
+    await conn.execute("CREATE INDEX outbox_due ON outbox (bot_id, status, next_attempt_at)")
+    await conn.execute("DROP INDEX outbox_channel")
+    await conn.execute(
+        """
+        CREATE INDEX outbox_channel ON outbox (bot_id, chat_id, id)
+        WHERE status IN ('pending', 'inflight')
+    """
+    )
+    await conn.execute("DROP INDEX outbox_dedup")
+    await conn.execute(
+        """
+        CREATE UNIQUE INDEX outbox_dedup ON outbox (bot_id, dedup_key)
+        WHERE dedup_key IS NOT NULL
+    """
+    )
+
+
+async def _create_message_map(conn: aiosqlite.Connection) -> None:
+    """Версия 10: соответствие исходных сообщений опубликованным для исправления публикаций"""
+    # Исходное сообщение и номер части запроса записи очереди
+    await conn.execute("ALTER TABLE outbox ADD COLUMN source_message_id INTEGER")
+    await conn.execute("ALTER TABLE outbox ADD COLUMN part INTEGER NOT NULL DEFAULT 0")
+    await conn.execute(
+        """
+        CREATE TABLE message_map (
+            bot_id INTEGER NOT NULL DEFAULT 0,
+            user_chat_id INTEGER NOT NULL,
+            source_message_id INTEGER NOT NULL,
+            chat_id TEXT NOT NULL,
+            part INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (bot_id, user_chat_id, source_message_id, chat_id, part)
+        ) WITHOUT ROWID
+    """
+    )
+    # Удаление устаревших записей по времени
+    await conn.execute("CREATE INDEX message_map_created ON message_map (created_at)")
+
+
+# Порядок важен: миграция с индексом i переводит схему в версию i + 1
+MIGRATIONS: List[Migration] = [
+    _create_initial_tables,
+    _merge_profiles,
+    _add_signature_length,
+    _split_channels,
+    _create_outbox,
+    _create_meta,
+    _index_outbox_channels,
+    _add_outbox_dedup_key,
+    _add_bot_namespace,
+    _create_message_map,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def get_schema_version(conn: aiosqlite.Connection) -> int:
+    """Текущая версия схемы базы данных"""
+    async with conn.execute("PRAGMA user_version") as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+async def migrate(conn: aiosqlite.Connection) -> int:
+    """Применение недостающих миграций, возвращает итоговую версию схемы"""
+    version = await get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Версия схемы базы данных {version} новее поддерживаемой {SCHEMA_VERSION}"
+        )
+
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info(f"Миграция схемы базы данных до версии {target}")
+        await conn.execute("BEGIN")
+        try:
+            await migration(conn)
+            # PRAGMA не поддерживает параметры, значение - доверенное целое число
+            await conn.execute(f"PRAGMA user_version = {target}")
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+    return SCHEMA_VERSION
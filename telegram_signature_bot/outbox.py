@@ -0,0 +1,364 @@
+"""
+Очередь отправок в каналы, сохраняемая в базе данных.
+
+Обработчик сообщения только записывает запросы к Bot API в таблицу outbox и сразу
+отвечает пользователю. Записи выбирает фоновый читатель, а доставляют несколько
+воркеров через общий планировщик отправки. Доставка выполняется хотя бы один раз:
+запись удаляется только после успешного ответа Telegram, а записи, отправка которых
+прервалась остановкой процесса, возвращаются в очередь при следующем запуске.
+Временные ошибки повторяются с экспоненциальной задержкой, постоянные ошибки и
+исчерпание попыток переводят запись в недоставленные с уведомлением пользователя.
+
+В каждый канал одновременно доставляется только одна запись, следующая выбирается
+после доставки или отказа по предыдущей, поэтому сообщения появляются в канале в порядке
+добавления в очередь даже при повторах. В хранилище sharded порядок соблюдается внутри
+сегмента, то есть для всех сообщений одного пользователя.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple, Type
+
+from telegram import (
+    Bot,
+    InputMedia,
+    InputMediaAnimation,
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
+    TelegramObject,
+)
+from telegram.error import BadRequest, ChatMigrated, Forbidden, InvalidToken
+
+from .albums import AlbumCollector
+from .database import OutboxEntry, OutboxItem
+from .scheduler import PRIORITY_CHANNEL, PRIORITY_REPLY, SendScheduler
+from .storage import Storage
+from .template import load_entity
+
+# Ошибки, повтор которых не поможет: нет прав, канал не существует, неверный запрос
+PERMANENT_ERRORS = (BadRequest, Forbidden, InvalidToken, ChatMigrated)
+
+# Повторная правка с тем же содержимым: сообщение в канале уже в нужном виде
+NOT_MODIFIED_ERROR = "message is not modified"
+
+# Число воркеров, доставляющих отправки в каналы, по умолчанию
+DEFAULT_FAN_OUT_LIMIT = 5
+
+# Сведения об опубликованных сообщениях для их исправления хранятся неделю
+DEFAULT_MESSAGE_MAP_TTL = 7 * 24 * 3600.0
+# Интервал удаления устаревших сведений о публикациях
+MESSAGE_MAP_PRUNE_INTERVAL = 3600.0
+
+# Окно сбора недоставленных отправок одного пользователя в одно уведомление
+NOTIFY_WINDOW = 1.0
+# Интервал проверки очереди при ожидании ее опустошения
+DRAIN_POLL_INTERVAL = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRequest(NamedTuple):
+    """Запрос к Bot API для каждого канала; chat_id подставляется при доставке"""
+
+    method: str
+    payload: Dict[str, Any]
+
+
+def _to_json(obj: object) -> Any:
+    if isinstance(obj, TelegramObject):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# Классы элементов sendMediaGroup по полю type
+INPUT_MEDIA_TYPES: Dict[str, Type[InputMedia]] = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+    "animation": InputMediaAnimation,
+}
+
+
+def load_input_media(data: Dict[str, Any]) -> InputMedia:
+    """Элемент sendMediaGroup из сохраненного в очереди словаря.
+
+    Bot.do_api_request принимает media только объектами InputMedia.
+    """
+    data = dict(data)
+    media_class = INPUT_MEDIA_TYPES[data.pop("type")]
+    entities = data.pop("caption_entities", None)
+    if entities is not None:
+        data["caption_entities"] = [load_entity(entity) for entity in entities]
+    return media_class(**data)
+
+
+def posted_message_id(result: Any) -> Optional[int]:
+    """Идентификатор опубликованного сообщения из ответа Bot API.
+
+    sendMessage и другие отправки возвращают Message, copyMessage - MessageId, а
+    sendMediaGroup - список сообщений, из которых запоминается первое.
+    """
+    if isinstance(result, list):
+        result = result[0] if result else None
+    if isinstance(result, dict):
+        return result.get("message_id")
+    return None
+
+
+def api_method(name: str) -> str:
+    """Имя метода Bot API по имени метода Bot: send_photo -> sendPhoto"""
+    head, *rest = name.split("_")
+    return head + "".join(part.capitalize() for part in rest)
+
+
+class Outbox:
+    """Доставка отправок из таблицы outbox пулом воркеров"""
+
+    def __init__(
+        self,
+        db: Storage,
+        sender: SendScheduler,
+        workers: int = DEFAULT_FAN_OUT_LIMIT,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 300.0,
+        poll_interval: float = 5.0,
+        notify_window: float = NOTIFY_WINDOW,
+        on_channel_error: Optional[Callable[[str], None]] = None,
+        message_map_ttl: float = DEFAULT_MESSAGE_MAP_TTL,
+    ):
+        self.db = db
+        self.sender = sender
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        # Вызывается для канала при каждой неудачной отправке
+        self.on_channel_error = on_channel_error
+        # Время хранения сведений о публикациях, 0 - не удалять
+        self.message_map_ttl = message_map_ttl
+        self.failures: AlbumCollector[Tuple[int, str, str]] = AlbumCollector(
+            self._notify, notify_window
+        )
+
+        self._bot: Optional[Bot] = None
+        self._queue: Optional["asyncio.Queue[OutboxItem]"] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self, bot: Bot) -> None:
+        """Возврат прерванных отправок в очередь и запуск воркеров"""
+        if self.running:
+            return
+        self._bot = bot
+        recovered = await self.db.recover_outbox()
+        if recovered:
+            logger.info(f"Восстановлено отправок из очереди: {recovered}")
+        self._queue = asyncio.Queue(self.workers)
+        self._wakeup = asyncio.Event()
+        self._spawn(self._feed())
+        for _ in range(self.workers):
+            self._spawn(self._work())
+        if self.message_map_ttl > 0:
+            self._spawn(self._prune())
+
+    async def stop(self) -> None:
+        """Остановка воркеров; недоставленные записи остаются в базе данных"""
+        tasks, self._tasks = self._tasks, set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if tasks:
+            # Выбранные, но не доставленные записи будут отправлены при следующем запуске
+            await self.db.recover_outbox()
+        await self.failures.close()
+        self._queue = None
+        self._wakeup = None
+
+    async def drain(self, timeout: float) -> bool:
+        """Ожидание доставки или отказа по всем записям очереди, False по истечении времени"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while await self._unfinished():
+            if not self.running or loop.time() >= deadline:
+                return False
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+        return True
+
+    async def enqueue(
+        self,
+        user_id: int,
+        user_chat_id: int,
+        channels: Sequence[str],
+        requests: Sequence[OutboxRequest],
+        source: Optional[str] = None,
+        source_message_id: Optional[int] = None,
+    ) -> None:
+        """Сохранение отправок во все каналы одной транзакцией.
+
+        source - идентификатор исходного сообщения: повторная постановка в очередь
+        отправок того же сообщения игнорируется, пока они не доставлены.
+        source_message_id - исходное сообщение в чате пользователя: опубликованные по нему
+        сообщения запоминаются для исправления при редактировании исходного.
+        """
+        entries = [
+            OutboxEntry(
+                user_id,
+                user_chat_id,
+                channel,
+                request.method,
+                json.dumps(
+                    {k: v for k, v in request.payload.items() if v is not None},
+                    default=_to_json,
+                    ensure_ascii=False,
+                ),
+                f"{source}:{channel}:{index}" if source is not None else None,
+                source_message_id,
+                index,
+            )
+            for channel in channels
+            for index, request in enumerate(requests)
+        ]
+        if not entries:
+            return
+        await self.db.enqueue_outbox(entries)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _unfinished(self) -> int:
+        stats = await self.db.outbox_stats()
+        return stats.get("pending", 0) + stats.get("inflight", 0)
+
+    def backoff(self, attempts: int) -> float:
+        """Задержка перед повтором после заданного числа неудачных попыток"""
+        return min(self.max_delay, self.base_delay * 2.0 ** max(0, attempts - 1))
+
+    def _spawn(self, coro: Any) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+
+    async def _feed(self) -> None:
+        assert self._queue is not None and self._wakeup is not None
+        while True:
+            self._wakeup.clear()
+            items = await self.db.claim_outbox(self.workers, time.time())
+            for item in items:
+                await self._queue.put(item)
+            if items:
+                continue
+
+            # Ждем новой записи или срока ближайшего повтора
+            timeout = self.poll_interval
+            next_at = await self.db.next_outbox_attempt()
+            if next_at is not None:
+                timeout = min(timeout, max(0.0, next_at - time.time()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _prune(self) -> None:
+        while True:
+            try:
+                removed = await self.db.prune_posts(time.time() - self.message_map_ttl)
+                if removed:
+                    logger.info(f"Pruned {removed} published messages older than TTL")
+            except Exception as e:
+                logger.error(f"Error pruning published messages: {str(e)}")
+            await asyncio.sleep(MESSAGE_MAP_PRUNE_INTERVAL)
+
+    async def _work(self) -> None:
+        assert self._queue is not None
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(item)
+            except Exception:
+                logger.exception(f"Error processing outbox item {item.id}")
+
+    async def _deliver(self, item: OutboxItem) -> None:
+        assert self._bot is not None
+        bot = self._bot
+        api_kwargs = {"chat_id": item.chat_id, **json.loads(item.payload)}
+        if item.method == "sendMediaGroup":
+            api_kwargs["media"] = [load_input_media(media) for media in api_kwargs["media"]]
+        try:
+            result = await self.sender.send(
+                item.chat_id,
+                # Имена методов Bot API не зависят от регистра; в нижнем регистре у Bot нет
+                # одноименного метода, и do_api_request не предупреждает о его наличии
+                lambda: bot.do_api_request(item.method.lower(), api_kwargs=api_kwargs),
+                PRIORITY_CHANNEL,
+            )
+        except Exception as e:
+            if isinstance(e, BadRequest) and NOT_MODIFIED_ERROR in str(e).lower():
+                # Правка уже применена, например до перезапуска процесса
+                self.delivered += 1
+                await self.db.complete_outbox(item.id)
+            else:
+                await self._fail(item, e)
+        else:
+            self.delivered += 1
+            message_id = None
+            if item.source_message_id is not None:
+                message_id = posted_message_id(result)
+            await self.db.complete_outbox(item.id, message_id)
+        self._notify_feeder()
+
+    async def _fail(self, item: OutboxItem, e: Exception) -> None:
+        if self.on_channel_error is not None:
+            self.on_channel_error(item.chat_id)
+        # Ошибки вне TelegramError (например, сетевые сбои клиента) считаются временными
+        attempts = item.attempts + 1
+        if isinstance(e, PERMANENT_ERRORS) or attempts >= self.max_attempts:
+            await self._dead_letter(item, e)
+        else:
+            delay = self.backoff(attempts)
+            logger.warning(
+                f"Error sending to channel {item.chat_id}, retry {attempts} "
+                f"in {delay:.0f} s: {str(e)}"
+            )
+            self.retried += 1
+            await self.db.retry_outbox(item.id, time.time() + delay, str(e))
+
+    def _notify_feeder(self) -> None:
+        # Завершение записи открывает доставку следующей записи того же канала,
+        # а срок повтора может оказаться раньше текущего ожидания читателя
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _dead_letter(self, item: OutboxItem, error: Exception) -> None:
+        logger.error(f"Error sending message to channel {item.chat_id}: {str(error)}")
+        self.dead += 1
+        await self.db.dead_letter_outbox(item.id, str(error))
+        self.failures.add(item.user_chat_id, (item.user_chat_id, item.chat_id, str(error)))
+
+    async def _notify(self, failures: List[Tuple[int, str, str]]) -> None:
+        """Одно сводное сообщение пользователю о недоставленных отправках"""
+        assert self._bot is not None
+        bot = self._bot
+        user_chat_id = failures[0][0]
+        # Одна ошибка на канал, даже если в него не дошло несколько запросов
+        errors = {channel: error for _, channel, error in failures}
+        details = "\n".join(f"{channel}: {error}" for channel, error in errors.items())
+        text = (
+            f"Не удалось отправить сообщение в каналы ({len(errors)}). "
+            f"Проверьте права бота и существование каналов.\n"
+            f"{details}"
+        )
+        await self.sender.send(
+            user_chat_id, lambda: bot.send_message(user_chat_id, text), PRIORITY_REPLY
+        )
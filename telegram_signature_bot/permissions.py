@@ -0,0 +1,117 @@
+"""
+Проверка права бота публиковать сообщения в канале.
+
+Вместо отправки и удаления тестового сообщения бот запрашивает чат (getChat) и свое
+участие в нем (getChatMember). Успешные проверки кэшируются для канала на ttl секунд,
+поэтому повторные проверки канала, общего для многих пользователей, не обращаются к
+Bot API. Одновременные проверки одного канала выполняются одним запросом. Канал,
+отправка в который не удалась, удаляется из кэша и проверяется заново при следующем
+обращении.
+"""
+import asyncio
+import time
+from typing import Callable, Dict
+
+from telegram import Bot, Chat, ChatMember
+from telegram.error import TelegramError
+
+from .metrics import REGISTRY
+
+DEFAULT_ACCESS_TTL = 600.0
+
+ACCESS_CHECKS = REGISTRY.counter(
+    "signature_bot_channel_access_checks_total",
+    "Проверки доступа бота к каналам по результату",
+    ["result"],
+)
+
+
+class ChannelAccessError(TelegramError):
+    """У бота нет права публиковать сообщения в канале"""
+
+
+def can_post(chat: Chat, member: ChatMember) -> bool:
+    """Может ли участник с таким статусом публиковать сообщения в чате"""
+    if member.status == ChatMember.OWNER:
+        return True
+    if chat.type == Chat.CHANNEL:
+        # В канале публикуют только администраторы с правом can_post_messages
+        return member.status == ChatMember.ADMINISTRATOR and bool(
+            getattr(member, "can_post_messages", False)
+        )
+    if member.status == ChatMember.RESTRICTED:
+        return bool(getattr(member, "is_member", False)) and bool(
+            getattr(member, "can_send_messages", False)
+        )
+    return member.status in (ChatMember.ADMINISTRATOR, ChatMember.MEMBER)
+
+
+class ChannelAccessCache:
+    """Кэш результатов проверки доступа к каналам"""
+
+    def __init__(
+        self, ttl: float = DEFAULT_ACCESS_TTL, clock: Callable[[], float] = time.monotonic
+    ):
+        self.ttl = ttl
+        self._clock = clock
+        # Канал -> время истечения успешной проверки
+        self._verified: Dict[str, float] = {}
+        self._checks: Dict[str, "asyncio.Future[None]"] = {}
+        self._hits = ACCESS_CHECKS.labels("hit")
+        self._allowed = ACCESS_CHECKS.labels("allowed")
+        self._denied = ACCESS_CHECKS.labels("denied")
+
+    def __len__(self) -> int:
+        return len(self._verified)
+
+    def is_verified(self, channel_id: str) -> bool:
+        expires_at = self._verified.get(channel_id)
+        if expires_at is None:
+            return False
+        if expires_at <= self._clock():
+            del self._verified[channel_id]
+            return False
+        return True
+
+    def invalidate(self, channel_id: str) -> None:
+        """Удаление канала из кэша, например после неудачной отправки"""
+        self._verified.pop(str(channel_id), None)
+
+    async def check(self, bot: Bot, channel_id: str) -> None:
+        """Проверка доступа, при его отсутствии бросает TelegramError"""
+        if self.is_verified(channel_id):
+            self._hits.inc()
+            return
+        check = self._checks.get(channel_id)
+        if check is None:
+            check = asyncio.ensure_future(self._check(bot, channel_id))
+            self._checks[channel_id] = check
+            check.add_done_callback(lambda future: self._finished(channel_id, future))
+        else:
+            self._hits.inc()
+        # Отмена ожидающего не прерывает проверку для остальных
+        await asyncio.shield(check)
+
+    def _finished(self, channel_id: str, check: "asyncio.Future[None]") -> None:
+        self._checks.pop(channel_id, None)
+        # Ошибка уже передана ожидавшим; если их не осталось, она не попадет в лог asyncio
+        if not check.cancelled():
+            check.exception()
+
+    async def _check(self, bot: Bot, channel_id: str) -> None:
+        try:
+            chat = await bot.get_chat(channel_id)
+            # В личный чат бот может писать, если пользователь его запустил
+            member = (
+                None if chat.type == Chat.PRIVATE else await bot.get_chat_member(chat.id, bot.id)
+            )
+        except TelegramError:
+            ACCESS_CHECKS.labels("error").inc()
+            raise
+        if member is not None and not can_post(chat, member):
+            self._denied.inc()
+            raise ChannelAccessError(
+                f"Бот не может публиковать сообщения в {channel_id}: статус {member.status}"
+            )
+        self._allowed.inc()
+        self._verified[channel_id] = self._clock() + self.ttl
@@ -0,0 +1,171 @@
+"""
+HTTP транспорт Bot API с учетом длительности и результата каждого запроса.
+
+Long polling getUpdates и исходящие отправки используют отдельные пулы соединений со
+своими параметрами (RequestProfile), поэтому долгий запрос обновлений не занимает
+соединения отправок, а всплеск отправок не задерживает получение обновлений.
+"""
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import httpx
+from telegram._utils.defaultvalue import DEFAULT_NONE
+from telegram._utils.types import ODVInput
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest, RequestData
+
+from .metrics import REGISTRY
+from .profiler import trace_phase
+
+TELEGRAM_REQUEST_SECONDS = REGISTRY.histogram(
+    "signature_bot_telegram_request_seconds",
+    "Длительность запросов к Bot API по методам",
+    ["method"],
+)
+TELEGRAM_REQUESTS = REGISTRY.counter(
+    "signature_bot_telegram_requests_total",
+    "Запросы к Bot API по методам и HTTP статусу ответа",
+    ["method", "status"],
+)
+
+
+@dataclass(frozen=True)
+class RequestProfile:
+    """Параметры пула соединений и таймауты транспорта Bot API"""
+
+    pool_size: int = 1
+    # Соединения, остающиеся открытыми между запросами; None - все соединения пула
+    keepalive: Optional[int] = None
+    # Время простоя, после которого открытое соединение закрывается, в секундах
+    keepalive_expiry: float = 5.0
+    # "1.1" или "2"; HTTP/2 требует python-telegram-bot[http2]
+    http_version: str = "1.1"
+    connect_timeout: float = 5.0
+    read_timeout: float = 5.0
+    write_timeout: float = 5.0
+    # Ожидание свободного соединения пула
+    pool_timeout: float = 1.0
+
+
+# Значения по умолчанию как у транспортов PTB
+UPDATES_PROFILE = RequestProfile()
+SEND_PROFILE = RequestProfile(pool_size=256)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest с параметрами RequestProfile, записывающий метрики запросов к Bot API.
+
+    Для оценки загрузки пула учитываются выполняемые запросы, их максимум, запросы,
+    начатые при занятых соединениях, и отказы по таймауту ожидания соединения.
+    """
+
+    def __init__(self, profile: RequestProfile = UPDATES_PROFILE, pool: str = "default"):
+        self.profile = profile
+        self.pool = pool
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.waits = 0
+        self.pool_timeouts = 0
+        super().__init__(
+            connection_pool_size=profile.pool_size,
+            read_timeout=profile.read_timeout,
+            write_timeout=profile.write_timeout,
+            connect_timeout=profile.connect_timeout,
+            pool_timeout=profile.pool_timeout,
+            http_version=profile.http_version,  # type: ignore[arg-type]
+        )
+
+    def _build_client(self) -> httpx.AsyncClient:
+        # PTB 20.8 не позволяет задать keep-alive пула через параметры HTTPXRequest, поэтому
+        # клиент строится здесь целиком по профилю; версия PTB закреплена в pyproject.toml,
+        # так как _build_client не входит в его публичный API
+        profile = self.profile
+        keepalive = profile.pool_size if profile.keepalive is None else profile.keepalive
+        http1 = profile.http_version == "1.1"
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                connect=profile.connect_timeout,
+                read=profile.read_timeout,
+                write=profile.write_timeout,
+                pool=profile.pool_timeout,
+            ),
+            limits=httpx.Limits(
+                max_connections=profile.pool_size,
+                max_keepalive_connections=keepalive,
+                keepalive_expiry=profile.keepalive_expiry,
+            ),
+            http1=http1,
+            http2=not http1,
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """Загрузка пула соединений"""
+        return {
+            "pool_size": self.profile.pool_size,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "waits": self.waits,
+            "pool_timeouts": self.pool_timeouts,
+        }
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout: ODVInput[float] = DEFAULT_NONE,
+        write_timeout: ODVInput[float] = DEFAULT_NONE,
+        connect_timeout: ODVInput[float] = DEFAULT_NONE,
+        pool_timeout: ODVInput[float] = DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        # Сетевые ошибки и таймауты не имеют HTTP статуса
+        status = "error"
+        if self.in_flight >= self.profile.pool_size:
+            # Все соединения заняты, запрос ждет освобождения
+            self.waits += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            with trace_phase(f"api:{endpoint}"):
+                code, payload = await super().do_request(
+                    url,
+                    method,
+                    request_data,
+                    read_timeout=read_timeout,
+                    write_timeout=write_timeout,
+                    connect_timeout=connect_timeout,
+                    pool_timeout=pool_timeout,
+                )
+            status = str(code)
+            return code, payload
+        except TimedOut as e:
+            if isinstance(e.__cause__, httpx.PoolTimeout):
+                self.pool_timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            TELEGRAM_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+            TELEGRAM_REQUESTS.labels(endpoint, status).inc()
+
+
+class SharedRequest(InstrumentedRequest):
+    """Транспорт, общий для нескольких ботов одного процесса.
+
+    Application инициализирует и закрывает свой транспорт при запуске и остановке,
+    поэтому для общего эти вызовы пропускаются: его открывает и закрывает владелец.
+    """
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def open(self) -> None:
+        await super().initialize()
+
+    async def close(self) -> None:
+        await super().shutdown()
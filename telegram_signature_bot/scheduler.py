@@ -0,0 +1,239 @@
+"""
+Планировщик исходящих запросов к Bot API с учетом ограничений Telegram.
+
+Каждая отправка сначала ждет токен в ведре своего чата (в задаче вызывающего, чтобы
+медленный чат не задерживал остальных), затем попадает в общую очередь с приоритетами,
+из которой диспетчер выпускает запросы со скоростью общего ведра. Ответы пользователям
+имеют приоритет над публикациями в каналах. При RetryAfter чат приостанавливается
+на указанное Telegram время, и отправка повторяется.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple, TypeVar, Union, cast
+
+from telegram.error import RetryAfter
+
+from .profiler import bind_trace, current_trace
+
+T = TypeVar("T")
+ChatId = Union[int, str]
+
+# Приоритеты: меньшее значение отправляется раньше
+PRIORITY_REPLY = 0
+PRIORITY_CHANNEL = 10
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ведро токенов с резервированием: каждый вызов занимает токен и получает задержку.
+
+    Резервирование в долг сохраняет порядок вызовов и не требует очереди ожидающих.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def _refill(self) -> float:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def delay(self) -> float:
+        """Время до появления свободного токена без его резервирования"""
+        now = self._refill()
+        wait = max(0.0, (1 - self._tokens) / self.rate)
+        return max(wait, self._paused_until - now)
+
+    def reserve(self) -> float:
+        """Резервирование токена, возвращает время, которое нужно подождать перед отправкой"""
+        wait = self.delay()
+        self._tokens -= 1
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Приостановка выдачи токенов на заданное время"""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def is_idle(self) -> bool:
+        """Ведро полное и не приостановлено, его можно удалить без потери состояния"""
+        now = self._refill()
+        return self._tokens >= self.capacity and self._paused_until <= now
+
+
+class _Job:
+    __slots__ = ("chat_id", "factory", "priority", "future", "attempt", "trace")
+
+    def __init__(
+        self,
+        chat_id: ChatId,
+        factory: Callable[[], Awaitable[Any]],
+        priority: int,
+        future: "asyncio.Future[Any]",
+    ):
+        self.chat_id = chat_id
+        self.factory = factory
+        self.priority = priority
+        self.future = future
+        self.attempt = 0
+        # Запрос выполняется в задаче диспетчера, но учитывается в фазах обработчика
+        self.trace = current_trace()
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Пауза из RetryAfter в секундах"""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+def is_private_chat(chat_id: ChatId) -> bool:
+    """Личные чаты имеют положительный числовой идентификатор"""
+    return isinstance(chat_id, int) and chat_id > 0
+
+
+class SendScheduler:
+    """Единая точка отправки запросов к Bot API"""
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        private_chat_rate: float = 1.0,
+        private_chat_burst: float = 3.0,
+        channel_rate: float = 20 / 60,
+        channel_burst: float = 3.0,
+        max_retries: int = 5,
+        max_idle_buckets: int = 10_000,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_chat_rate = private_chat_rate
+        self.private_chat_burst = private_chat_burst
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.max_retries = max_retries
+        self.max_idle_buckets = max_idle_buckets
+
+        self._buckets: Dict[ChatId, TokenBucket] = {}
+        self._sequence = itertools.count()
+        self._queue: Optional["asyncio.PriorityQueue[Tuple[int, int, _Job]]"] = None
+        self._dispatcher: Optional["asyncio.Task[None]"] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        # Результаты еще не выполненных запросов, отменяются при остановке
+        self._pending: Set["asyncio.Future[Any]"] = set()
+        self.retries = 0
+
+    def chat_bucket(self, chat_id: ChatId) -> TokenBucket:
+        """Ведро токенов чата, создается при первом обращении"""
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_idle_buckets:
+                self._prune_buckets()
+            if is_private_chat(chat_id):
+                bucket = TokenBucket(self.private_chat_rate, self.private_chat_burst)
+            else:
+                bucket = TokenBucket(self.channel_rate, self.channel_burst)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def send(
+        self,
+        chat_id: ChatId,
+        factory: Callable[[], Awaitable[T]],
+        priority: int = PRIORITY_CHANNEL,
+    ) -> T:
+        """Отправка запроса в чат с соблюдением ограничений, возвращает результат запроса"""
+        self._ensure_dispatcher()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        job = _Job(chat_id, factory, priority, future)
+        await self._enqueue(job)
+        return cast(T, await job.future)
+
+    async def close(self) -> None:
+        """Остановка диспетчера.
+
+        Запросы в очереди и выполняемые запросы отменяются: вызывающие send получают
+        CancelledError, а не ждут результата бесконечно.
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+            self._queue = None
+        for task in list(self._tasks):
+            task.cancel()
+        for future in list(self._pending):
+            future.cancel()
+
+    def _ensure_dispatcher(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._queue = asyncio.PriorityQueue()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _enqueue(self, job: _Job) -> None:
+        delay = self.chat_bucket(job.chat_id).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if job.future.done():
+            # Планировщик остановлен, пока запрос ждал токен чата
+            return
+        assert self._queue is not None
+        self._queue.put_nowait((job.priority, next(self._sequence), job))
+
+    async def _dispatch(self) -> None:
+        assert self._queue is not None
+        while True:
+            # Сначала ждем общий токен, затем берем самую приоритетную задачу на этот момент
+            delay = self.global_bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            _, _, job = await self._queue.get()
+            self.global_bucket.reserve()
+            task = asyncio.create_task(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, job: _Job) -> None:
+        if job.future.done():
+            return
+        bind_trace(job.trace)
+        try:
+            result = await job.factory()
+        except RetryAfter as e:
+            job.attempt += 1
+            if job.attempt > self.max_retries:
+                job.future.set_exception(e)
+                return
+            seconds = retry_after_seconds(e)
+            self.retries += 1
+            logger.warning(f"Flood limit for chat {job.chat_id}, retry in {seconds} s")
+            self.chat_bucket(job.chat_id).pause(seconds)
+            await self._enqueue(job)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _prune_buckets(self) -> None:
+        for chat_id in [chat_id for chat_id, b in self._buckets.items() if b.is_idle()]:
+            del self._buckets[chat_id]
@@ -0,0 +1,277 @@
+"""
+Хранилище, распределяющее пользователей по нескольким файлам SQLite.
+
+Пользователь вместе с его отправками в очереди всегда находится в сегменте
+shard_index(user_id, shards). У каждого сегмента свое соединение для записи, поэтому
+изменения разных пользователей не ждут одной блокировки файла. Номер сегмента и их
+число записаны в таблице meta каждого файла: если число сегментов изменилось, хранилище
+не откроется, пока данные не перераспределены командой signature-db rebalance.
+
+Идентификатор записи очереди включает номер сегмента: id = local_id * shards + index.
+"""
+import asyncio
+import logging
+import shutil
+import zlib
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from telegram import MessageEntity
+
+from .cache import ProfileCache, UserProfile
+from .database import Database, OutboxEntry, OutboxItem, PostedMessage, ProfileRecord
+from .template import SignatureTemplate
+from .writebatch import DEFAULT_WRITE_WINDOW
+
+DEFAULT_SHARDS = 4
+# Читателей на сегмент меньше, чем у одиночной базы: у каждого соединения свой поток
+SHARD_POOL_SIZE = 2
+SHARD_FILE = "shard-{index}.db"
+SHARD_META_KEY = "shard"
+REBALANCE_BATCH_SIZE = 50_000
+
+logger = logging.getLogger(__name__)
+
+
+def shard_index(user_id: int, shards: int) -> int:
+    """Сегмент пользователя; crc32 не зависит от запуска процесса в отличие от hash()"""
+    return zlib.crc32(user_id.to_bytes(8, "big", signed=True)) % shards
+
+
+def shard_files(directory: Union[str, Path]) -> List[Path]:
+    """Существующие файлы сегментов в каталоге"""
+    return sorted(Path(directory).glob(SHARD_FILE.format(index="*")))
+
+
+class ShardedStorage:
+    """Реализация Storage поверх нескольких Database"""
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        shards: int = DEFAULT_SHARDS,
+        cache: Optional[ProfileCache] = None,
+        pool_size: int = SHARD_POOL_SIZE,
+        write_window: float = DEFAULT_WRITE_WINDOW,
+    ):
+        if shards < 1:
+            raise ValueError("Число сегментов должно быть положительным")
+        self.directory = Path(directory)
+        # Кэш общий: идентификаторы пользователей разных сегментов не пересекаются
+        self.cache = cache if cache is not None else ProfileCache()
+        self.shards = [
+            Database(
+                str(self.directory / SHARD_FILE.format(index=index)),
+                pool_size,
+                cache=self.cache,
+                write_window=write_window,
+            )
+            for index in range(shards)
+        ]
+        self._next_claim = 0
+
+    def shard(self, user_id: int) -> Database:
+        return self.shards[shard_index(user_id, len(self.shards))]
+
+    def _locate(self, item_id: int) -> Tuple[Database, int]:
+        local_id, index = divmod(item_id, len(self.shards))
+        return self.shards[index], local_id
+
+    async def connect(self) -> None:
+        """Открытие сегментов с проверкой, что они созданы для того же числа сегментов"""
+        count = len(self.shards)
+        existing = len(shard_files(self.directory))
+        if existing and existing != count:
+            raise ValueError(
+                f"В {self.directory} {existing} сегментов вместо {count}, "
+                f"выполните signature-db rebalance --shards {count}"
+            )
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            await asyncio.gather(*(shard.connect() for shard in self.shards))
+            for index, shard in enumerate(self.shards):
+                expected = f"{index}/{count}"
+                value = await shard.get_meta(SHARD_META_KEY)
+                if value is None:
+                    await shard.set_meta(SHARD_META_KEY, expected)
+                elif value != expected:
+                    raise ValueError(f"Файл {shard.db_name} - сегмент {value}, ожидался {expected}")
+        except BaseException:
+            await self.close()
+            raise
+
+    async def close(self) -> None:
+        await asyncio.gather(*(shard.close() for shard in self.shards))
+
+    async def get_meta(self, key: str) -> Optional[str]:
+        """Общие параметры хранилища находятся в первом сегменте"""
+        return await self.shards[0].get_meta(key)
+
+    async def set_meta(self, key: str, value: str) -> None:
+        await self.shards[0].set_meta(key, value)
+
+    async def set_signature(
+        self, user_id: int, signature: str, entities: Optional[List[MessageEntity]] = None
+    ) -> SignatureTemplate:
+        return await self.shard(user_id).set_signature(user_id, signature, entities)
+
+    async def get_signature(self, user_id: int) -> Tuple[Optional[str], Optional[List[dict]]]:
+        return await self.shard(user_id).get_signature(user_id)
+
+    async def remove_signature(self, user_id: int) -> None:
+        await self.shard(user_id).remove_signature(user_id)
+
+    async def add_channel(self, user_id: int, channel_id: str) -> None:
+        await self.shard(user_id).add_channel(user_id, channel_id)
+
+    async def set_channel(self, user_id: int, channel_id: str) -> None:
+        await self.shard(user_id).set_channel(user_id, channel_id)
+
+    async def get_channels(self, user_id: int) -> List[str]:
+        return await self.shard(user_id).get_channels(user_id)
+
+    async def remove_channel(self, user_id: int, channel_id: Optional[str] = None) -> int:
+        return await self.shard(user_id).remove_channel(user_id, channel_id)
+
+    async def get_profile(self, user_id: int) -> UserProfile:
+        return await self.shard(user_id).get_profile(user_id)
+
+    async def enqueue_outbox(self, items: Sequence[OutboxEntry]) -> None:
+        groups: Dict[int, List[OutboxEntry]] = {}
+        for entry in items:
+            groups.setdefault(shard_index(entry.user_id, len(self.shards)), []).append(entry)
+        await asyncio.gather(
+            *(self.shards[index].enqueue_outbox(entries) for index, entries in groups.items())
+        )
+
+    async def claim_outbox(self, limit: int, now: float) -> List[OutboxItem]:
+        """Выборка из сегментов по очереди, начиная каждый раз со следующего"""
+        count = len(self.shards)
+        start, self._next_claim = self._next_claim, (self._next_claim + 1) % count
+        items: List[OutboxItem] = []
+        for offset in range(count):
+            index = (start + offset) % count
+            claimed = await self.shards[index].claim_outbox(limit - len(items), now)
+            items.extend(item._replace(id=item.id * count + index) for item in claimed)
+            if len(items) >= limit:
+                break
+        return items
+
+    async def next_outbox_attempt(self) -> Optional[float]:
+        attempts = await asyncio.gather(*(shard.next_outbox_attempt() for shard in self.shards))
+        return min((at for at in attempts if at is not None), default=None)
+
+    async def complete_outbox(self, item_id: int, message_id: Optional[int] = None) -> None:
+        shard, local_id = self._locate(item_id)
+        await shard.complete_outbox(local_id, message_id)
+
+    async def retry_outbox(self, item_id: int, next_attempt_at: float, error: str) -> None:
+        shard, local_id = self._locate(item_id)
+        await shard.retry_outbox(local_id, next_attempt_at, error)
+
+    async def dead_letter_outbox(self, item_id: int, error: str) -> None:
+        shard, local_id = self._locate(item_id)
+        await shard.dead_letter_outbox(local_id, error)
+
+    async def recover_outbox(self) -> int:
+        return sum(await asyncio.gather(*(shard.recover_outbox() for shard in self.shards)))
+
+    async def get_posts(
+        self, user_id: int, user_chat_id: int, source_message_id: int
+    ) -> List[PostedMessage]:
+        # Публикации записываются в сегмент пользователя вместе с его записями очереди
+        return await self.shard(user_id).get_posts(user_id, user_chat_id, source_message_id)
+
+    async def prune_posts(self, before: float) -> int:
+        return sum(await asyncio.gather(*(shard.prune_posts(before) for shard in self.shards)))
+
+    async def outbox_stats(self) -> Dict[str, int]:
+        stats: Dict[str, int] = {}
+        for shard_stats in await asyncio.gather(*(shard.outbox_stats() for shard in self.shards)):
+            for status, count in shard_stats.items():
+                stats[status] = stats.get(status, 0) + count
+        return stats
+
+    async def export_profiles(self) -> AsyncIterator[ProfileRecord]:
+        """Профили сегментов по очереди, внутри сегмента по возрастанию user_id"""
+        for shard in self.shards:
+            async for record in shard.export_profiles():
+                yield record
+
+    async def import_profiles(
+        self, records: Sequence[ProfileRecord], replace: bool = False
+    ) -> None:
+        """Загрузка пачки: каждый сегмент получает свою часть одной транзакцией"""
+        groups: Dict[int, List[ProfileRecord]] = {}
+        for record in records:
+            groups.setdefault(shard_index(record.user_id, len(self.shards)), []).append(record)
+        await asyncio.gather(
+            *(self.shards[index].import_profiles(group, replace) for index, group in groups.items())
+        )
+
+
+async def rebalance(
+    directory: Union[str, Path],
+    shards: int,
+    batch_size: int = REBALANCE_BATCH_SIZE,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Перераспределение профилей по новому числу сегментов, возвращает число профилей.
+
+    Данные записываются в соседний каталог, после чего прежний каталог переименовывается
+    в резервную копию <каталог>.<N>-shards.bak. Бот должен быть остановлен, а очередь
+    отправок - пуста: недоставленные записи (dead) и сведения о публикациях для
+    исправления сообщений остаются только в резервной копии.
+    """
+    directory = Path(directory)
+    current = len(shard_files(directory))
+    if not current:
+        raise ValueError(f"В каталоге {directory} нет сегментов")
+    if current == shards:
+        return 0
+
+    target_dir = directory.with_name(f"{directory.name}.rebalance")
+    backup_dir = directory.with_name(f"{directory.name}.{current}-shards.bak")
+    if backup_dir.exists():
+        raise ValueError(f"Резервная копия {backup_dir} уже существует")
+    if target_dir.exists():
+        # Остаток прерванного перераспределения
+        shutil.rmtree(target_dir)
+
+    # Без кэша: каждый профиль читается и записывается один раз
+    source = ShardedStorage(directory, current, cache=ProfileCache(max_entries=0))
+    target = ShardedStorage(target_dir, shards, cache=ProfileCache(max_entries=0))
+    moved = 0
+    try:
+        await source.connect()
+        stats = await source.outbox_stats()
+        unfinished = stats.get("pending", 0) + stats.get("inflight", 0)
+        if unfinished:
+            raise ValueError(
+                f"В очереди {unfinished} неотправленных записей, "
+                "остановите бота после доставки очереди"
+            )
+        if stats.get("dead"):
+            logger.warning(f"{stats['dead']} недоставленных записей останутся в {backup_dir}")
+
+        await target.connect()
+        batch: List[ProfileRecord] = []
+        async for record in source.export_profiles():
+            batch.append(record)
+            if len(batch) >= batch_size:
+                await target.import_profiles(batch)
+                moved += len(batch)
+                batch = []
+                if progress is not None:
+                    progress(moved)
+        if batch:
+            await target.import_profiles(batch)
+            moved += len(batch)
+    finally:
+        await source.close()
+        await target.close()
+
+    directory.rename(backup_dir)
+    target_dir.rename(directory)
+    logger.info(f"Профили перераспределены по {shards} сегментам, прежние данные в {backup_dir}")
+    return moved
@@ -0,0 +1,132 @@
+"""
+Снимок профилей активных пользователей для быстрого старта после перезапуска.
+
+При штатной остановке бот записывает последние использованные профили из кэша в
+компактный двоичный файл, а при запуске читает его через mmap и заполняет кэш до начала
+получения обновлений, поэтому первые сообщения после деплоя не идут в базу данных.
+
+Снимок используется один раз и удаляется после загрузки. Он отбрасывается, если файлы
+базы данных изменялись после его записи (например, импортом или работой бота, который
+не остановился штатно).
+
+Формат (little-endian): заголовок MAGIC, число записей u32, время записи f64; затем
+записи: user_id i64, длина подписи в UTF-16 i32 (-1 без подписи), длины текста,
+entities в JSON и каналов через перевод строки u32, после них сами байты UTF-8.
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Optional, Union, cast
+
+from .cache import ProfileCache, UserProfile
+from .database import CHANNEL_SEPARATOR
+from .template import load_template
+
+MAGIC = b"SIGSNAP1"
+HEADER = struct.Struct("<8sId")
+RECORD = struct.Struct("<qiIII")
+DEFAULT_SNAPSHOT_SIZE = 50_000
+
+logger = logging.getLogger(__name__)
+
+
+def data_mtime(path: Union[str, Path]) -> Optional[float]:
+    """Время последнего изменения файла базы (с журналом WAL) или файлов каталога сегментов"""
+    path = Path(path)
+    if path.is_dir():
+        files = [file for file in path.iterdir() if file.is_file()]
+    else:
+        files = [path, path.with_name(path.name + "-wal")]
+    mtimes = [file.stat().st_mtime for file in files if file.exists()]
+    return max(mtimes) if mtimes else None
+
+
+def write_snapshot(cache: ProfileCache, path: Union[str, Path], limit: int) -> int:
+    """Запись до limit последних профилей кэша, возвращает число записей"""
+    path = Path(path)
+    profiles = cache.recent(limit)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(profiles), time.time()))
+        for user_id, profile in profiles:
+            template = profile.template
+            text = template.text.encode() if template is not None else b""
+            entities = (template.entities_json() or "").encode() if template is not None else b""
+            channels = CHANNEL_SEPARATOR.join(profile.channels).encode()
+            utf16_length = template.utf16_length if template is not None else -1
+            file.write(RECORD.pack(user_id, utf16_length, len(text), len(entities), len(channels)))
+            file.write(text)
+            file.write(entities)
+            file.write(channels)
+    # Замена одним переименованием: прерванная запись не портит прежний снимок
+    os.replace(tmp_path, path)
+    return len(profiles)
+
+
+def load_snapshot(
+    cache: ProfileCache, path: Union[str, Path], data_path: Optional[Union[str, Path]] = None
+) -> int:
+    """Заполнение кэша из снимка, возвращает число загруженных профилей.
+
+    data_path - файл базы данных или каталог сегментов для проверки актуальности снимка.
+    """
+    path = Path(path)
+    if not path.exists():
+        return 0
+    try:
+        modified = data_mtime(data_path) if data_path is not None else None
+        if modified is not None and modified > path.stat().st_mtime:
+            logger.info(f"Snapshot {path} is older than the database, skipping")
+            return 0
+        return _read(cache, path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"Error loading snapshot {path}: {str(e)}")
+        return 0
+    finally:
+        # Снимок одноразовый: после работы бота данные в базе могут измениться
+        path.unlink(missing_ok=True)
+
+
+def _read(cache: ProfileCache, path: Path) -> int:
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size < HEADER.size:
+            raise ValueError("snapshot is truncated")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, count, _ = HEADER.unpack_from(data, 0)
+            if magic != MAGIC:
+                raise ValueError("not a profile snapshot")
+            view = memoryview(data)
+            try:
+                offset = HEADER.size
+                for _ in range(count):
+                    (
+                        user_id,
+                        utf16_length,
+                        text_len,
+                        entities_len,
+                        channels_len,
+                    ) = RECORD.unpack_from(view, offset)
+                    offset += RECORD.size
+                    text = str(view[offset : offset + text_len], "utf-8")
+                    offset += text_len
+                    entities = str(view[offset : offset + entities_len], "utf-8")
+                    offset += entities_len
+                    channels = str(view[offset : offset + channels_len], "utf-8")
+                    offset += channels_len
+                    if offset > len(view):
+                        raise ValueError("snapshot is truncated")
+                    template = (
+                        load_template(text, utf16_length, entities or None)
+                        if utf16_length >= 0
+                        else None
+                    )
+                    profile = UserProfile(
+                        template, tuple(channels.split(CHANNEL_SEPARATOR)) if channels else ()
+                    )
+                    cache.put(user_id, profile)
+            finally:
+                view.release()
+    return cast(int, count)
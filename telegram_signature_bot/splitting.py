@@ -0,0 +1,140 @@
+"""
+Проверка длины сообщений до отправки и разбиение длинных сообщений на части.
+
+Telegram отклоняет текст длиннее 4096 и caption длиннее 1024 кодовых единиц UTF-16.
+Вместо неудачного запроса текст с подписью заранее делится на части: граница ищется на
+переводе строки или пробеле во второй половине допустимой длины и сдвигается к началу
+entity, которое она разрезала бы. Entity длиннее части делится между частями. Подпись
+добавляется к последней части, а caption медиафайла продолжается отдельными текстовыми
+сообщениями.
+
+Разбиение выполняется за один проход по тексту и entities.
+"""
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Optional, Tuple
+
+from telegram import MessageEntity
+
+from .profiler import phase
+from .template import SignatureTemplate, utf16_len
+
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+Part = Tuple[str, List[MessageEntity]]
+
+
+def clip_entity(entity: MessageEntity, offset: int, length: int) -> MessageEntity:
+    """Копия entity с другими смещением и длиной"""
+    return MessageEntity(
+        type=entity.type,
+        offset=offset,
+        length=length,
+        url=entity.url,
+        user=entity.user,
+        language=entity.language,
+        custom_emoji_id=entity.custom_emoji_id,
+    )
+
+
+def _boundary(text: str, start: int, end: int) -> int:
+    """Позиция разреза не дальше end: после перевода строки, после пробела или end"""
+    half = start + (end - start) // 2
+    for separator in ("\n", " "):
+        index = text.rfind(separator, half, end)
+        if index >= 0:
+            return index + 1
+    return end
+
+
+@phase("split_message")
+def split_message(
+    text: str,
+    entities: Iterable[MessageEntity] = (),
+    template: Optional[SignatureTemplate] = None,
+    first_limit: int = TEXT_LIMIT,
+    limit: int = TEXT_LIMIT,
+) -> List[Part]:
+    """Части сообщения с подписью в последней: первая не длиннее first_limit, остальные limit.
+
+    Если текст с подписью помещается в first_limit, возвращается одна часть.
+    """
+    # Подпись отделяется от текста пустой строкой
+    reserve = template.utf16_length + 2 if template is not None else 0
+    if utf16_len(text) + reserve <= first_limit:
+        return [_sign(text, list(entities), template)]
+
+    # Смещения символов в UTF-16: prefix[i] - начало символа i
+    prefix = [0]
+    for char in text:
+        prefix.append(prefix[-1] + (2 if ord(char) > 0xFFFF else 1))
+    size = len(text)
+    # Entities в индексах символов, по возрастанию начала
+    spans = sorted(
+        (
+            bisect_left(prefix, entity.offset),
+            bisect_left(prefix, entity.offset + entity.length),
+            entity,
+        )
+        for entity in entities
+    )
+
+    parts: List[Part] = []
+    # Entities, начавшиеся в предыдущих частях и продолжающиеся дальше
+    carried: List[Tuple[int, int, MessageEntity]] = []
+    next_span = 0
+    start = 0
+    part_limit = first_limit
+    while True:
+        remaining = prefix[size] - prefix[start]
+        if remaining + reserve <= part_limit:
+            cut = size
+        else:
+            end = bisect_right(prefix, prefix[start] + part_limit) - 1
+            cut = _boundary(text, start, end) if end < size else size
+            # Entities, начинающиеся до предполагаемого разреза
+            window = next_span
+            while window < len(spans) and spans[window][0] < cut:
+                window += 1
+            candidates = carried + spans[next_span:window]
+            # Разрез переносится к началу разрезаемого entity, если оно не начало части
+            moved = True
+            while moved:
+                moved = False
+                for span_start, span_end, _ in candidates:
+                    if start < span_start < cut < span_end:
+                        cut = span_start
+                        moved = True
+
+        part_spans = carried
+        while next_span < len(spans) and spans[next_span][0] < cut:
+            part_spans.append(spans[next_span])
+            next_span += 1
+        part_entities = []
+        carried = []
+        for span_start, span_end, entity in part_spans:
+            left, right = max(span_start, start), min(span_end, cut)
+            if right > left:
+                part_entities.append(
+                    clip_entity(entity, prefix[left] - prefix[start], prefix[right] - prefix[left])
+                )
+            if span_end > cut:
+                carried.append((span_start, span_end, entity))
+
+        part_text = text[start:cut]
+        if cut == size and remaining + reserve <= part_limit:
+            parts.append(_sign(part_text, part_entities, template))
+            return parts
+        parts.append((part_text, part_entities))
+        if cut == size:
+            # Текст закончился, подпись не помещается в последнюю часть: отдельным сообщением
+            parts.append(_sign("", [], template))
+            return parts
+        start = cut
+        part_limit = limit
+
+
+def _sign(text: str, entities: List[MessageEntity], template: Optional[SignatureTemplate]) -> Part:
+    if template is None:
+        return text, entities
+    return template.apply(text, entities)
@@ -0,0 +1,129 @@
+"""
+Интерфейс хранилища профилей и очереди отправок.
+
+Бот и очередь отправок работают с хранилищем через протокол Storage. Реализации:
+- sqlite: один файл SQLite (Database);
+- memory: словари в памяти процесса для тестов и бенчмарков (MemoryStorage);
+- sharded: пользователи распределены по нескольким файлам SQLite по хэшу user_id,
+  чтобы записи не ждали единственной блокировки файла (ShardedStorage).
+"""
+from typing import AsyncIterator, Dict, List, Optional, Protocol, Sequence, Tuple
+
+from telegram import MessageEntity
+
+from .cache import ProfileCache, UserProfile
+from .database import Database, OutboxEntry, OutboxItem, PostedMessage, ProfileRecord
+from .memory import MemoryStorage
+from .sharding import DEFAULT_SHARDS, ShardedStorage
+from .template import SignatureTemplate
+from .writebatch import DEFAULT_WRITE_WINDOW
+
+BACKENDS = ("sqlite", "memory", "sharded")
+
+
+class Storage(Protocol):
+    """Хранилище подписей, каналов и очереди отправок"""
+
+    cache: ProfileCache
+
+    async def connect(self) -> None:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+    async def get_meta(self, key: str) -> Optional[str]:
+        ...
+
+    async def set_meta(self, key: str, value: str) -> None:
+        ...
+
+    async def set_signature(
+        self, user_id: int, signature: str, entities: Optional[List[MessageEntity]] = None
+    ) -> SignatureTemplate:
+        ...
+
+    async def get_signature(self, user_id: int) -> Tuple[Optional[str], Optional[List[dict]]]:
+        ...
+
+    async def remove_signature(self, user_id: int) -> None:
+        ...
+
+    async def add_channel(self, user_id: int, channel_id: str) -> None:
+        ...
+
+    async def set_channel(self, user_id: int, channel_id: str) -> None:
+        ...
+
+    async def get_channels(self, user_id: int) -> List[str]:
+        ...
+
+    async def remove_channel(self, user_id: int, channel_id: Optional[str] = None) -> int:
+        ...
+
+    async def get_profile(self, user_id: int) -> UserProfile:
+        ...
+
+    async def enqueue_outbox(self, items: Sequence[OutboxEntry]) -> None:
+        ...
+
+    async def claim_outbox(self, limit: int, now: float) -> List[OutboxItem]:
+        ...
+
+    async def next_outbox_attempt(self) -> Optional[float]:
+        ...
+
+    async def complete_outbox(self, item_id: int, message_id: Optional[int] = None) -> None:
+        ...
+
+    async def retry_outbox(self, item_id: int, next_attempt_at: float, error: str) -> None:
+        ...
+
+    async def dead_letter_outbox(self, item_id: int, error: str) -> None:
+        ...
+
+    async def recover_outbox(self) -> int:
+        ...
+
+    async def get_posts(
+        self, user_id: int, user_chat_id: int, source_message_id: int
+    ) -> List[PostedMessage]:
+        ...
+
+    async def prune_posts(self, before: float) -> int:
+        ...
+
+    async def outbox_stats(self) -> Dict[str, int]:
+        ...
+
+    def export_profiles(self) -> AsyncIterator[ProfileRecord]:
+        ...
+
+    async def import_profiles(
+        self, records: Sequence[ProfileRecord], replace: bool = False
+    ) -> None:
+        ...
+
+
+def create_storage(
+    backend: str = "sqlite",
+    path: str = "signatures.db",
+    shards: int = DEFAULT_SHARDS,
+    cache: Optional[ProfileCache] = None,
+    write_window: float = DEFAULT_WRITE_WINDOW,
+    bot_id: int = 0,
+) -> Storage:
+    """Хранилище по имени реализации.
+
+    Для sqlite path - файл базы данных, для sharded - каталог с файлами сегментов,
+    memory путь не использует. Данные нескольких ботов (bot_id) разделяет только sqlite.
+    """
+    if backend == "sqlite":
+        return Database(path, cache=cache, write_window=write_window, bot_id=bot_id)
+    if bot_id:
+        raise ValueError(f"Хранилище {backend} поддерживает только одного бота")
+    if backend == "memory":
+        return MemoryStorage(cache=cache)
+    if backend == "sharded":
+        return ShardedStorage(path, shards, cache=cache, write_window=write_window)
+    raise ValueError(f"Неизвестное хранилище {backend}, доступны: {', '.join(BACKENDS)}")
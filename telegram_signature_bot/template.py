@@ -0,0 +1,87 @@
+"""
+Предварительно скомпилированные шаблоны подписей.
+
+Telegram считает смещения и длины entities в кодовых единицах UTF-16, поэтому длина
+подписи вычисляется один раз при сохранении, а при отправке сообщения entities подписи
+только сдвигаются на длину текста перед ней.
+"""
+import json
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from telegram import MessageEntity, User
+
+
+def utf16_len(text: str) -> int:
+    """Длина строки в кодовых единицах UTF-16"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def shift_entity(entity: MessageEntity, delta: int) -> MessageEntity:
+    """Копия entity со смещением, сдвинутым на delta"""
+    return MessageEntity(
+        type=entity.type,
+        offset=entity.offset + delta,
+        length=entity.length,
+        url=entity.url,
+        user=entity.user,
+        language=entity.language,
+        custom_emoji_id=entity.custom_emoji_id,
+    )
+
+
+class SignatureTemplate(NamedTuple):
+    """Неизменяемый шаблон подписи: текст, его длина в UTF-16 и готовые entities"""
+
+    text: str
+    utf16_length: int
+    entities: Tuple[MessageEntity, ...]
+
+    def shifted_entities(self, base: int) -> Tuple[MessageEntity, ...]:
+        """Entities подписи, расположенной в тексте начиная с позиции base"""
+        if not base:
+            return self.entities
+        return tuple(shift_entity(entity, base) for entity in self.entities)
+
+    def apply(
+        self, text: str, entities: Iterable[MessageEntity] = ()
+    ) -> Tuple[str, List[MessageEntity]]:
+        """Добавление подписи к тексту через пустую строку вместе с форматированием"""
+        combined = list(entities)
+        if not text:
+            combined.extend(self.entities)
+            return self.text, combined
+        # Подпись сдвигается на длину текста и "\n\n"
+        combined.extend(self.shifted_entities(utf16_len(text) + 2))
+        return f"{text}\n\n{self.text}", combined
+
+    def entities_json(self) -> Optional[str]:
+        """Сериализация entities для хранения в базе данных"""
+        if not self.entities:
+            return None
+        return json.dumps([entity.to_dict() for entity in self.entities])
+
+
+def load_entity(data: Dict[str, Any]) -> MessageEntity:
+    """MessageEntity из словаря to_dict, в том числе с пользователем text_mention"""
+    if "user" in data:
+        data = {**data, "user": User(**data["user"])}
+    return MessageEntity(**data)
+
+
+def compile_signature(
+    text: str, entities: Optional[Iterable[MessageEntity]] = None
+) -> SignatureTemplate:
+    """Компиляция подписи в шаблон, смещения entities отсчитываются от начала подписи"""
+    return SignatureTemplate(text, utf16_len(text), tuple(entities or ()))
+
+
+def load_template(
+    text: str, utf16_length: Optional[int], entities_json: Optional[str]
+) -> SignatureTemplate:
+    """Восстановление шаблона из строки базы данных"""
+    entities: Sequence[Dict[str, Any]] = json.loads(entities_json) if entities_json else ()
+    return SignatureTemplate(
+        text,
+        utf16_length if utf16_length is not None else utf16_len(text),
+        tuple(load_entity(entity) for entity in entities),
+    )
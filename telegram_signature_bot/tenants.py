@@ -0,0 +1,267 @@
+"""
+Несколько ботов в одном процессе.
+
+Каждый токен из файла конфигурации обслуживается своим SignatureBot со своим Application,
+обработчиками и ограничениями скорости отправки, но все боты работают в одном цикле
+событий и разделяют:
+- файл SQLite и пул соединений к нему; данные ботов разделены колонкой bot_id, равной
+  числовому идентификатору бота из токена;
+- пул HTTP соединений для отправок (long polling getUpdates у каждого бота свой);
+- реестр метрик и эндпоинт /metrics, метрики ботов различаются меткой bot.
+
+Боты добавляются и удаляются без перезапуска процесса: файл конфигурации
+перечитывается по сигналу SIGHUP.
+"""
+import asyncio
+import json
+import logging
+import signal
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from .bot import SignatureBot, wait_for_stop_signal
+from .cache import ProfileCache
+from .database import ConnectionPool, Database
+from .metrics import REGISTRY, MetricsServer
+from .migrations import migrate
+from .request import SEND_PROFILE, RequestProfile, SharedRequest
+from .writebatch import DEFAULT_WRITE_WINDOW
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TenantConfig:
+    """Бот процесса: имя для логов и метрик и токен"""
+
+    name: str
+    token: str
+
+    @property
+    def bot_id(self) -> int:
+        """Идентификатор бота - числовая часть токена до двоеточия"""
+        return int(self.token.split(":", 1)[0])
+
+
+def load_tenants(path: Union[str, Path]) -> List[TenantConfig]:
+    """Боты из JSON файла вида {"bots": [{"name": "news", "token": "123:ABC"}]}"""
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    tenants = [TenantConfig(str(item["name"]), str(item["token"])) for item in data["bots"]]
+    names = [tenant.name for tenant in tenants]
+    if len(set(names)) != len(names):
+        raise ValueError("Имена ботов в конфигурации должны быть уникальными")
+    bot_ids = [tenant.bot_id for tenant in tenants]
+    if len(set(bot_ids)) != len(bot_ids):
+        raise ValueError("Токен каждого бота должен быть указан один раз")
+    return tenants
+
+
+# Создание бота по конфигурации, его хранилищу и общему транспорту отправок
+BotFactory = Callable[[TenantConfig, Database, SharedRequest], SignatureBot]
+
+
+def default_bot_factory(
+    config: TenantConfig, storage: Database, send_request: SharedRequest
+) -> SignatureBot:
+    return SignatureBot(config.token, storage.db_name, storage=storage, send_request=send_request)
+
+
+class TenantRunner:
+    """Запуск, добавление и остановка ботов с общими базой, транспортом и метриками"""
+
+    def __init__(
+        self,
+        db_path: str,
+        bot_factory: BotFactory = default_bot_factory,
+        send_profile: RequestProfile = SEND_PROFILE,
+        pool_size: int = 4,
+        cache_factory: Callable[[], ProfileCache] = ProfileCache,
+        write_window: float = DEFAULT_WRITE_WINDOW,
+        metrics_port: Optional[int] = None,
+        metrics_host: str = "127.0.0.1",
+    ):
+        self.db_path = db_path
+        self.bot_factory = bot_factory
+        self.cache_factory = cache_factory
+        self.write_window = write_window
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.send_request = SharedRequest(send_profile, "send")
+        self.metrics = (
+            MetricsServer(metrics_host, metrics_port) if metrics_port is not None else None
+        )
+        self.bots: Dict[str, Tuple[TenantConfig, SignatureBot]] = {}
+        # Добавления и удаления выполняются по одному
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def start(self) -> None:
+        """Открытие общих базы, транспорта и эндпоинта метрик"""
+        self._lock = asyncio.Lock()
+        await self.pool.open()
+        async with self.pool.writer() as conn:
+            await migrate(conn)
+        await self.send_request.open()
+        if self.metrics is not None:
+            self.register_metrics()
+            await self.metrics.start()
+
+    async def stop(self) -> None:
+        """Остановка всех ботов и закрытие общих ресурсов"""
+        await self.apply([])
+        if self.metrics is not None:
+            await self.metrics.stop()
+        await self.send_request.close()
+        await self.pool.close()
+
+    async def add(self, config: TenantConfig) -> SignatureBot:
+        """Запуск бота; сообщения, накопленные за время его отсутствия, будут получены"""
+        assert self._lock is not None, "TenantRunner не запущен"
+        async with self._lock:
+            return await self._add(config)
+
+    async def remove(self, name: str) -> None:
+        """Остановка бота с доставкой накопленных альбомов и сохранением очереди отправок"""
+        assert self._lock is not None, "TenantRunner не запущен"
+        async with self._lock:
+            await self._remove(name)
+
+    async def apply(self, configs: Sequence[TenantConfig]) -> None:
+        """Приведение запущенных ботов к конфигурации.
+
+        Удаленные и изменившиеся боты останавливаются, новые запускаются. Ошибка запуска
+        одного бота записывается в лог и не мешает остальным.
+        """
+        assert self._lock is not None, "TenantRunner не запущен"
+        wanted = {config.name: config for config in configs}
+        async with self._lock:
+            for name, (config, _) in list(self.bots.items()):
+                if wanted.get(name) != config:
+                    await self._remove(name)
+            for name, config in wanted.items():
+                if name in self.bots:
+                    continue
+                try:
+                    await self._add(config)
+                except Exception as e:
+                    logger.error(f"Error starting bot {name}: {str(e)}")
+
+    async def _add(self, config: TenantConfig) -> SignatureBot:
+        if config.name in self.bots:
+            raise ValueError(f"Бот {config.name} уже запущен")
+        storage = Database(
+            self.db_path,
+            cache=self.cache_factory(),
+            write_window=self.write_window,
+            bot_id=config.bot_id,
+            pool=self.pool,
+        )
+        bot = self.bot_factory(config, storage, self.send_request)
+        application = bot.application
+        assert application.updater is not None
+        await application.initialize()
+        try:
+            await bot.post_init(application)
+            await application.start()
+            await application.updater.start_polling()
+        except BaseException:
+            if application.running:
+                await application.stop()
+            await bot.post_stop(application)
+            await application.shutdown()
+            await bot.post_shutdown(application)
+            raise
+        self.bots[config.name] = (config, bot)
+        logger.info(f"Bot {config.name} ({config.bot_id}) started")
+        return bot
+
+    async def _remove(self, name: str) -> None:
+        _, bot = self.bots.pop(name)
+        application = bot.application
+        assert application.updater is not None
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        await bot.post_stop(application)
+        await application.shutdown()
+        await bot.post_shutdown(application)
+        logger.info(f"Bot {name} stopped")
+
+    async def reload(self, path: Union[str, Path]) -> None:
+        """Перечитывание файла конфигурации; при ошибке в файле боты не меняются"""
+        try:
+            configs = load_tenants(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Error loading bots from {path}: {str(e)}")
+            return
+        await self.apply(configs)
+
+    async def run(self, config_path: Union[str, Path]) -> None:
+        """Работа до сигнала остановки; SIGHUP перечитывает файл конфигурации"""
+        await self.start()
+        loop = asyncio.get_running_loop()
+        reloads: List["asyncio.Task[None]"] = []
+        loop.add_signal_handler(
+            signal.SIGHUP, lambda: reloads.append(asyncio.create_task(self.reload(config_path)))
+        )
+        try:
+            await self.reload(config_path)
+            logger.info(f"Started {len(self.bots)} bots from {config_path}")
+            await wait_for_stop_signal()
+        finally:
+            loop.remove_signal_handler(signal.SIGHUP)
+            await asyncio.gather(*reloads, return_exceptions=True)
+            await self.stop()
+
+    def register_metrics(self) -> None:
+        """Метрики ботов процесса с меткой bot и загрузка общего пула отправок"""
+
+        def per_bot(value: Callable[[SignatureBot], float]) -> Dict[Tuple[str, ...], float]:
+            return {(name,): value(bot) for name, (_, bot) in self.bots.items()}
+
+        REGISTRY.callback("signature_bot_tenants", "Запущенные боты", lambda: len(self.bots))
+        REGISTRY.callback(
+            "signature_bot_update_queue_size",
+            "Обновления, ожидающие обработки",
+            lambda: per_bot(lambda bot: bot.application.update_queue.qsize()),
+            ["bot"],
+        )
+        REGISTRY.callback(
+            "signature_bot_send_queue_size",
+            "Запросы в очереди планировщика отправки",
+            lambda: per_bot(lambda bot: bot.sender.queue_size),
+            ["bot"],
+        )
+        REGISTRY.callback(
+            "signature_bot_profile_cache_entries",
+            "Записей в кэше профилей",
+            lambda: per_bot(lambda bot: len(bot.db.cache)),
+            ["bot"],
+        )
+        REGISTRY.callback(
+            "signature_bot_outbox_items",
+            "Записи очереди отправок в каналы по статусам",
+            self.outbox_items,
+            ["bot", "status"],
+        )
+        REGISTRY.callback(
+            "signature_bot_telegram_pool_in_flight",
+            "Выполняемые запросы к Bot API по пулам соединений",
+            lambda: {("send",): self.send_request.in_flight},
+            ["pool"],
+        )
+        REGISTRY.callback(
+            "signature_bot_telegram_pool_waits_total",
+            "Запросы к Bot API, начатые при занятых соединениях пула",
+            lambda: {("send",): self.send_request.waits},
+            ["pool"],
+            "counter",
+        )
+
+    async def outbox_items(self) -> Dict[Tuple[str, ...], float]:
+        samples: Dict[Tuple[str, ...], float] = {}
+        for name, (_, bot) in list(self.bots.items()):
+            stats = await bot.db.outbox_stats()
+            for status in ("pending", "inflight", "dead"):
+                samples[(name, status)] = stats.get(status, 0)
+        return samples
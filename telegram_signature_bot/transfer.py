@@ -0,0 +1,345 @@
+"""
+Перенос подписей и каналов между базами через файлы JSONL и CSV.
+
+Экспорт читает профили курсором, импорт загружает их пачками через executemany, так что
+память не зависит от размера файла, а миллионы строк загружаются за секунды.
+
+Формат JSONL, одна строка на пользователя:
+    {"user_id": 1, "signature": "...", "entities": [...], "channels": ["@channel"]}
+Формат CSV: колонки user_id, signature, entities (JSON), channels (через пробел).
+
+Команда rebalance перераспределяет профили хранилища sharded по новому числу сегментов.
+Профили одного из ботов start-bots выбираются через --bot-id, по умолчанию база
+по-прежнему - база start-bot с bot_id 0.
+
+Запуск:
+    poetry run signature-db export --env production -o profiles.jsonl
+    poetry run signature-db import --env development -i profiles.jsonl
+    poetry run signature-db rebalance --env production --shards 8
+    poetry run signature-db export --env production --bot-id 123456 -o news.jsonl
+"""
+import argparse
+import asyncio
+import csv
+import inspect
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from telegram import MessageEntity, User
+
+from .database import ProfileRecord
+from .main import database_path, storage_path
+from .sharding import DEFAULT_SHARDS, rebalance
+from .storage import BACKENDS, Storage, create_storage
+
+FORMATS = ("jsonl", "csv")
+CSV_FIELDS = ["user_id", "signature", "entities", "channels"]
+DEFAULT_BATCH_SIZE = 50_000
+PROGRESS_EVERY = 100_000
+
+# Поле CSV может содержать длинную подпись с форматированием
+csv.field_size_limit(2**31 - 1)
+
+
+def detect_format(path: str, explicit: Optional[str]) -> str:
+    """Формат файла: явно указанный или по расширению"""
+    if explicit:
+        return explicit
+    suffix = Path(path).suffix.lower().lstrip(".")
+    if suffix in ("jsonl", "ndjson"):
+        return "jsonl"
+    if suffix == "csv":
+        return "csv"
+    raise ValueError(f"Не удалось определить формат файла {path}, укажите --format")
+
+
+def record_to_dict(record: ProfileRecord) -> Dict[str, Any]:
+    return {
+        "user_id": record.user_id,
+        "signature": record.signature,
+        "entities": record.entities,
+        "channels": list(record.channels),
+    }
+
+
+def constructor_fields(cls: type) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """Все и обязательные поля объекта Telegram по параметрам его конструктора"""
+    parameters = inspect.signature(cls).parameters
+    fields = frozenset(parameters) - {"api_kwargs"}
+    required = frozenset(
+        name for name in fields if parameters[name].default is inspect.Parameter.empty
+    )
+    return fields, required
+
+
+# Поля, с которыми load_entity восстанавливает MessageEntity и пользователя text_mention
+ENTITY_FIELDS = constructor_fields(MessageEntity)
+USER_FIELDS = constructor_fields(User)
+
+
+def check_fields(data: Any, fields: Tuple[FrozenSet[str], FrozenSet[str]], name: str) -> None:
+    """Проверка словаря: есть все обязательные поля и нет неизвестных"""
+    if not isinstance(data, dict):
+        raise ValueError(f"{name} должен быть объектом")
+    allowed, required = fields
+    missing = required - data.keys()
+    if missing:
+        raise ValueError(f"В {name} нет полей: {', '.join(sorted(missing))}")
+    unknown = data.keys() - allowed
+    if unknown:
+        raise ValueError(f"Неизвестные поля {name}: {', '.join(sorted(unknown))}")
+
+
+def check_entities(entities: Any) -> Optional[List[dict]]:
+    """Проверка entities из файла: список объектов MessageEntity в формате Bot API"""
+    if not entities:
+        return None
+    if not isinstance(entities, list):
+        raise ValueError("entities должны быть списком объектов MessageEntity")
+    for entity in entities:
+        check_fields(entity, ENTITY_FIELDS, "entity")
+        if entity.get("user") is not None:
+            check_fields(entity["user"], USER_FIELDS, "user")
+    return entities
+
+
+def record_from_dict(data: Dict[str, Any]) -> ProfileRecord:
+    return ProfileRecord(
+        int(data["user_id"]),
+        data.get("signature"),
+        check_entities(data.get("entities")),
+        tuple(data.get("channels") or ()),
+    )
+
+
+class RecordWriter:
+    """Запись профилей в файл выбранного формата"""
+
+    def __init__(self, output: IO[str], fmt: str):
+        self.output = output
+        self.fmt = fmt
+        if fmt == "csv":
+            self._csv = csv.writer(output)
+            self._csv.writerow(CSV_FIELDS)
+
+    def write(self, record: ProfileRecord) -> None:
+        if self.fmt == "jsonl":
+            self.output.write(json.dumps(record_to_dict(record), ensure_ascii=False) + "\n")
+            return
+        self._csv.writerow(
+            [
+                record.user_id,
+                "" if record.signature is None else record.signature,
+                json.dumps(record.entities, ensure_ascii=False) if record.entities else "",
+                " ".join(record.channels),
+            ]
+        )
+
+
+def read_records(source: IO[str], fmt: str) -> Iterator[ProfileRecord]:
+    """Построчное чтение профилей из файла"""
+    if fmt == "jsonl":
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield record_from_dict(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"Строка {line_number}: {str(e)}") from e
+    else:
+        for line_number, row in enumerate(csv.DictReader(source), start=2):
+            try:
+                yield ProfileRecord(
+                    int(row["user_id"]),
+                    row["signature"] or None,
+                    check_entities(json.loads(row["entities"]) if row["entities"] else None),
+                    tuple(row["channels"].split()),
+                )
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"Строка {line_number}: {str(e)}") from e
+
+
+class Progress:
+    """Вывод числа обработанных профилей и скорости в stderr"""
+
+    def __init__(self, action: str, every: int = PROGRESS_EVERY, quiet: bool = False):
+        self.action = action
+        self.every = every
+        self.quiet = quiet
+        self.count = 0
+        self.started = time.perf_counter()
+        self._next = every
+
+    def advance(self, count: int = 1) -> None:
+        self.count += count
+        if self.count >= self._next:
+            self._next = self.count + self.every
+            self.report()
+
+    def report(self, final: bool = False) -> None:
+        if self.quiet:
+            return
+        elapsed = time.perf_counter() - self.started
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        status = "Готово" if final else self.action
+        print(f"{status}: {self.count} профилей за {elapsed:.1f} с ({rate:.0f}/с)", file=sys.stderr)
+
+
+@contextmanager
+def open_file(path: str, mode: str) -> Iterator[IO[str]]:
+    """Открытие файла или stdin/stdout для пути '-'"""
+    if path == "-":
+        yield sys.stdin if "r" in mode else sys.stdout
+        return
+    # newline="" нужен модулю csv и не мешает JSONL
+    with open(path, mode, encoding="utf-8", newline="") as file:
+        yield file
+
+
+async def export_profiles(db: Storage, output: IO[str], fmt: str, progress: Progress) -> int:
+    """Экспорт всех профилей в файл, возвращает число записей"""
+    writer = RecordWriter(output, fmt)
+    async for record in db.export_profiles():
+        writer.write(record)
+        progress.advance()
+    output.flush()
+    return progress.count
+
+
+async def import_profiles(
+    db: Storage,
+    records: Iterable[ProfileRecord],
+    progress: Progress,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    replace: bool = False,
+) -> int:
+    """Импорт профилей пачками, каждая пачка загружается одной транзакцией"""
+    batch: List[ProfileRecord] = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            await db.import_profiles(batch, replace)
+            progress.advance(len(batch))
+            batch = []
+    if batch:
+        await db.import_profiles(batch, replace)
+        progress.advance(len(batch))
+    return progress.count
+
+
+async def run(args: argparse.Namespace) -> int:
+    if args.db:
+        db_path = args.db
+    elif args.bot_id:
+        # Боты start-bots хранят данные в общей базе окружения
+        db_path = database_path(f"{args.env}-tenants")
+    else:
+        db_path = storage_path(args.env, args.backend)
+    if args.command == "rebalance":
+        progress = Progress("Перенесено", quiet=args.quiet)
+        await rebalance(
+            db_path, args.shards, progress=lambda moved: progress.advance(moved - progress.count)
+        )
+        progress.report(final=True)
+        return progress.count
+
+    path = args.output if args.command == "export" else args.input
+    fmt = detect_format(path, args.format)
+    # При выводе в stdout прогресс не смешивается с данными, он идет в stderr
+    db = create_storage(args.backend, db_path, args.shards, bot_id=args.bot_id)
+    try:
+        await db.connect()
+        if args.command == "export":
+            progress = Progress("Экспортировано", quiet=args.quiet)
+            with open_file(path, "w") as output:
+                await export_profiles(db, output, fmt, progress)
+        else:
+            progress = Progress("Импортировано", quiet=args.quiet)
+            with open_file(path, "r") as source:
+                await import_profiles(
+                    db, read_records(source, fmt), progress, args.batch_size, args.replace
+                )
+        progress.report(final=True)
+    finally:
+        await db.close()
+    return progress.count
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="signature-db", description="Импорт и экспорт подписей и каналов"
+    )
+    target = argparse.ArgumentParser(add_help=False)
+    group = target.add_mutually_exclusive_group()
+    group.add_argument("--db", help="путь к файлу базы данных или каталогу сегментов")
+    group.add_argument(
+        "--env",
+        default=os.getenv("ENVIRONMENT", "development"),
+        help="окружение, база берется из каталога данных бота (по умолчанию ENVIRONMENT)",
+    )
+    target.add_argument(
+        "--backend",
+        choices=[backend for backend in BACKENDS if backend != "memory"],
+        default=os.getenv("STORAGE_BACKEND", "sqlite"),
+        help="хранилище (по умолчанию STORAGE_BACKEND)",
+    )
+    target.add_argument(
+        "--shards",
+        type=int,
+        default=int(os.getenv("STORAGE_SHARDS", str(DEFAULT_SHARDS))),
+        help="число сегментов хранилища sharded (по умолчанию STORAGE_SHARDS)",
+    )
+    target.add_argument(
+        "--bot-id",
+        type=int,
+        default=0,
+        help="идентификатор бота из токена для базы start-bots (по умолчанию 0 - база start-bot)",
+    )
+    target.add_argument("-q", "--quiet", action="store_true", help="без вывода прогресса")
+    files = argparse.ArgumentParser(add_help=False)
+    files.add_argument("--format", choices=FORMATS, help="формат файла, по умолчанию по расширению")
+
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", parents=[target, files], help="выгрузка профилей в файл")
+    export.add_argument("-o", "--output", required=True, help="файл или '-' для stdout")
+
+    load = commands.add_parser("import", parents=[target, files], help="загрузка профилей из файла")
+    load.add_argument("-i", "--input", required=True, help="файл или '-' для stdin")
+    load.add_argument(
+        "--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="профилей в одной транзакции"
+    )
+    load.add_argument(
+        "--replace",
+        action="store_true",
+        help="запись полностью заменяет профиль, иначе каналы добавляются к существующим",
+    )
+    commands.add_parser(
+        "rebalance",
+        parents=[target],
+        help="перераспределение хранилища sharded по --shards сегментам",
+    )
+    args = parser.parse_args(argv)
+    if args.command == "rebalance":
+        if args.bot_id:
+            parser.error("rebalance не поддерживает --bot-id")
+        args.backend = "sharded"
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Точка входа signature-db"""
+    args = parse_args(argv)
+    try:
+        asyncio.run(run(args))
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Прием обновлений через вебхук как альтернатива long polling.
+"""
+import asyncio
+import hmac
+import json
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from telegram import Bot, Update
+
+from .httpserver import HttpRequest, HttpResponse, HttpServer
+
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WebhookConfig:
+    """Параметры вебхука"""
+
+    # Публичный адрес, который регистрируется в Telegram, например https://example.com
+    url: str
+    listen: str = "0.0.0.0"
+    port: int = 8443
+    path: str = "/webhook"
+    secret_token: Optional[str] = None
+    max_connections: int = 40
+
+    @property
+    def webhook_url(self) -> str:
+        return self.url.rstrip("/") + self.path
+
+
+class WebhookServer:
+    """HTTP сервер, принимающий обновления от Telegram и передающий их в очередь приложения"""
+
+    def __init__(self, config: WebhookConfig, bot: Bot, update_queue: "asyncio.Queue[object]"):
+        self.config = config
+        self.bot = bot
+        self.update_queue = update_queue
+        self.http = HttpServer(
+            self.handle_request, config.listen, config.port, config.max_connections
+        )
+
+    async def start(self) -> None:
+        await self.http.start()
+        logger.info(f"Webhook server listening on {self.config.listen}:{self.http.port}")
+
+    async def stop(self) -> None:
+        await self.http.stop()
+
+    async def handle_request(self, request: HttpRequest) -> HttpResponse:
+        """Проверка запроса и постановка обновления в очередь"""
+        if request.path != self.config.path:
+            return HttpResponse(404, b"Not Found")
+        if request.method != "POST":
+            return HttpResponse(405, b"Method Not Allowed")
+        if self.config.secret_token is not None and not hmac.compare_digest(
+            request.headers.get(SECRET_TOKEN_HEADER, ""), self.config.secret_token
+        ):
+            return HttpResponse(403, b"Forbidden")
+
+        try:
+            update = Update.de_json(json.loads(request.body), self.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Invalid webhook payload: {str(e)}")
+            return HttpResponse(400, b"Bad Request")
+
+        if update is not None:
+            await self.update_queue.put(update)
+        return HttpResponse(200)
@@ -0,0 +1,192 @@
+"""
+Групповая фиксация изменений настроек пользователей.
+
+Записи подписей и каналов собираются в очередь и выполняются одной транзакцией: одна
+синхронизация с диском на пачку вместо одной на каждое изменение. Пачка записывается
+через window секунд после первого изменения или при накоплении max_size изменений.
+С нулевым окном пачка записывается на следующей итерации цикла событий, а изменения,
+пришедшие во время записи, попадают в следующую пачку. Окно в несколько миллисекунд
+увеличивает пачки на медленных дисках ценой задержки одиночных изменений.
+
+Вызов возвращается только после фиксации пачки, поэтому последующие чтения видят
+записанное.
+
+Запись с ключом объединения заменяет еще не записанную запись с тем же ключом
+(побеждает последняя), оба вызова дожидаются одной фиксации.
+"""
+import asyncio
+import logging
+from typing import (
+    Any,
+    AsyncContextManager,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import aiosqlite
+
+from .metrics import REGISTRY
+
+# Выражение SQL с параметрами
+Statement = Tuple[str, Sequence[Any]]
+
+DEFAULT_WRITE_WINDOW = 0.0
+DEFAULT_WRITE_BATCH_SIZE = 256
+
+WRITE_BATCH_SIZE = REGISTRY.histogram(
+    "signature_bot_db_write_batch_size",
+    "Число изменений настроек в одной транзакции",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+WRITES_COALESCED = REGISTRY.counter(
+    "signature_bot_db_writes_coalesced_total",
+    "Изменения настроек, замененные более поздними до записи",
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _Write:
+    __slots__ = ("statements", "waiters")
+
+    def __init__(self, statements: Sequence[Statement], waiter: "asyncio.Future[int]"):
+        self.statements = statements
+        self.waiters = [waiter]
+
+    def resolve(self, result: int) -> None:
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(result)
+
+    def fail(self, error: BaseException) -> None:
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
+
+
+class WriteBatcher:
+    """Очередь записей с фиксацией пачками"""
+
+    def __init__(
+        self,
+        writer: Callable[[], AsyncContextManager[aiosqlite.Connection]],
+        window: float = DEFAULT_WRITE_WINDOW,
+        max_size: int = DEFAULT_WRITE_BATCH_SIZE,
+    ):
+        self._writer = writer
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._pending: List[_Write] = []
+        self._latest: Dict[Hashable, _Write] = {}
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def submit(
+        self,
+        statements: Sequence[Statement],
+        key: Optional[Hashable] = None,
+        coalesce: bool = False,
+    ) -> int:
+        """Выполнение выражений в ближайшей пачке, возвращает rowcount последнего.
+
+        При coalesce запись заменяет ожидающую запись с тем же ключом. Запись с тем же
+        ключом без coalesce выполняется по порядку и запрещает объединение с предыдущими.
+        """
+        waiter: "asyncio.Future[int]" = asyncio.get_running_loop().create_future()
+        write = self._latest.get(key) if coalesce else None
+        if write is not None:
+            write.statements = statements
+            write.waiters.append(waiter)
+            WRITES_COALESCED.inc()
+        else:
+            write = _Write(statements, waiter)
+            self._pending.append(write)
+            if key is not None:
+                if coalesce:
+                    self._latest[key] = write
+                else:
+                    self._latest.pop(key, None)
+        self._schedule()
+        return await waiter
+
+    async def close(self) -> None:
+        """Запись накопленных изменений"""
+        if self._task is not None:
+            assert self._full is not None
+            self._full.set()
+            await self._task
+
+    def _schedule(self) -> None:
+        if self._full is None:
+            self._full = asyncio.Event()
+        if len(self._pending) >= self.max_size:
+            self._full.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        assert self._full is not None
+        if self.window > 0 and not self._full.is_set():
+            try:
+                await asyncio.wait_for(self._full.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+        # Изменения, пришедшие во время записи, уже подождали и пишутся следующей пачкой
+        while self._pending:
+            batch, self._pending, self._latest = self._pending, [], {}
+            self._full.clear()
+            await self._flush(batch)
+        self._task = None
+
+    async def _flush(self, batch: List[_Write]) -> None:
+        WRITE_BATCH_SIZE.observe(len(batch))
+        try:
+            async with self._writer() as conn:
+                try:
+                    results = [await self._execute(conn, write) for write in batch]
+                    await conn.commit()
+                except Exception as e:
+                    await conn.rollback()
+                    if len(batch) == 1:
+                        batch[0].fail(e)
+                        return
+                    logger.warning(f"Batch of {len(batch)} writes failed, retrying one by one")
+                    await self._flush_each(conn, batch)
+                    return
+        except Exception as e:
+            # Не удалось получить соединение: ошибка передается всем ожидающим
+            for write in batch:
+                write.fail(e)
+            return
+        for write, result in zip(batch, results):
+            write.resolve(result)
+
+    async def _flush_each(self, conn: aiosqlite.Connection, batch: List[_Write]) -> None:
+        """Запись по одной, чтобы ошибка одного изменения не отменяла остальные"""
+        for write in batch:
+            try:
+                result = await self._execute(conn, write)
+                await conn.commit()
+            except Exception as e:
+                await conn.rollback()
+                write.fail(e)
+            else:
+                write.resolve(result)
+
+    @staticmethod
+    async def _execute(conn: aiosqlite.Connection, write: _Write) -> int:
+        rowcount = 0
+        for sql, params in write.statements:
+            cursor = await conn.execute(sql, params)
+            rowcount = cursor.rowcount
+            await cursor.close()
+        return rowcount
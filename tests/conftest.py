@@ -0,0 +1,71 @@
+"""Общие фикстуры и вспомогательные объекты тестов"""
+import pytest
+from telegram.ext import Application
+
+from telegram_signature_bot.bot import SignatureBot
+from telegram_signature_bot.database import Database
+
+
+class FakeClock:
+    """Часы, которые идут только при изменении now"""
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def start_application(application: Application) -> None:
+    """Запуск как в run_polling: хуки вызываются те, что заданы в ApplicationBuilder"""
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+
+
+async def stop_application(application: Application) -> None:
+    """Остановка в порядке run_polling: post_stop до shutdown, post_shutdown после"""
+    if application.updater.running:
+        await application.updater.stop()
+    if application.running:
+        await application.stop()
+    if application.post_stop:
+        await application.post_stop(application)
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+@pytest.fixture
+async def test_db(tmp_path):
+    """Фикстура для создания тестовой базы данных"""
+    db = Database(str(tmp_path / "test_signatures.db"))
+    await db.connect()
+    yield db
+    await db.close()
+
+
+@pytest.fixture
+async def make_bot(tmp_path):
+    """Фикстура создания ботов без запуска Application; созданные боты закрываются"""
+    bots = []
+
+    async def make(**kwargs) -> SignatureBot:
+        bot = SignatureBot("test_token", str(tmp_path / "test_signatures.db"), **kwargs)
+        await bot.db.connect()
+        bots.append(bot)
+        return bot
+
+    yield make
+    for bot in bots:
+        await bot.outbox.stop()
+        await bot.sender.close()
+        await bot.db.close()
+
+
+@pytest.fixture
+async def bot(make_bot):
+    """Фикстура для создания экземпляра бота"""
+    return await make_bot()
@@ -0,0 +1,101 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from telegram import InputMediaPhoto, InputMediaVideo, MessageEntity
+
+from telegram_signature_bot.albums import AlbumCollector
+
+
+@pytest.fixture
+async def bot(make_bot):
+    """Фикстура бота с коротким окном сборки альбомов"""
+    return await make_bot(album_window=0.05)
+
+
+def album_update(message_id, caption=None, video=False):
+    """Мок обновления с элементом альбома"""
+    update = MagicMock()
+    update.effective_user.id = 12345
+    message = update.message
+    message.chat_id = 12345
+    message.message_id = message_id
+    message.media_group_id = "album"
+    message.caption = caption
+    message.caption_entities = []
+    if video:
+        message.photo = []
+        message.video.file_id = f"video-{message_id}"
+    else:
+        message.photo = [
+            MagicMock(file_id=f"small-{message_id}"),
+            MagicMock(file_id=f"photo-{message_id}"),
+        ]
+    message.reply_text = AsyncMock()
+    return update
+
+
+async def test_collector_waits_for_quiet_window():
+    """Тест обработки альбома после паузы в поступлении элементов"""
+    flushed = []
+
+    async def flush(items):
+        flushed.append(items)
+
+    collector = AlbumCollector(flush, window=0.05)
+    collector.add("a", 1)
+    await asyncio.sleep(0.03)
+    collector.add("a", 2)
+    collector.add("b", 3)
+    await asyncio.sleep(0.03)
+    # Окно альбома "a" продлено вторым элементом
+    assert flushed == []
+    await asyncio.sleep(0.05)
+    assert sorted(flushed) == [[1, 2], [3]]
+    assert len(collector) == 0
+
+
+async def test_collector_close_flushes_pending():
+    """Тест отправки накопленных альбомов при остановке"""
+    flushed = []
+
+    async def flush(items):
+        flushed.append(items)
+
+    collector = AlbumCollector(flush, window=10)
+    collector.add("a", 1)
+    await collector.close()
+    assert flushed == [[1]]
+
+
+async def test_album_sent_as_single_media_group(bot):
+    """Тест отправки альбома одним вызовом на каждого адресата"""
+    await bot.db.set_signature(12345, "Подпись", [MessageEntity(MessageEntity.BOLD, 0, 7)])
+    await bot.db.add_channel(12345, "@first")
+    await bot.db.add_channel(12345, "@second")
+    context = MagicMock()
+    context.bot = AsyncMock()
+
+    await bot.outbox.start(context.bot)
+
+    # Элементы альбома могут прийти не по порядку
+    for update in (album_update(2, video=True), album_update(1, caption="Отпуск"), album_update(3)):
+        await bot.handle_media(update, context)
+    await asyncio.sleep(0.2)
+    assert await bot.outbox.drain(1)
+
+    context.bot.send_media_group.assert_called_once()
+    media = context.bot.send_media_group.call_args.args[1]
+    posts = context.bot.do_api_request.call_args_list
+    assert {call.args[0] for call in posts} == {"sendmediagroup"}
+    assert {call.kwargs["api_kwargs"]["chat_id"] for call in posts} == {"@first", "@second"}
+    # Bot.do_api_request принимает элементы альбома только объектами InputMedia
+    sent = posts[0].kwargs["api_kwargs"]["media"]
+    assert [item.to_dict() for item in sent] == [item.to_dict() for item in media]
+
+    assert [type(item) for item in media] == [InputMediaPhoto, InputMediaVideo, InputMediaPhoto]
+    assert media[0].media == "photo-1"
+    assert media[0].caption == "Отпуск\n\nПодпись"
+    assert media[0].caption_entities[0].offset == 8
+    assert media[1].caption is None and media[2].caption is None
+    context.bot.send_photo.assert_not_called()
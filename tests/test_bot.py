@@ -1,10 +1,28 @@
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
-from telegram import Update
+from telegram import Chat, ChatMemberAdministrator, Update, User
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
-from telegram_signature_bot.bot import SignatureBot
+BOT_ID = 42
+CHANNEL_CHAT_ID = -1001234567890
+
+
+def administrator(can_post_messages):
+    return ChatMemberAdministrator(
+        User(BOT_ID, "Bot", True),
+        can_be_edited=False,
+        is_anonymous=False,
+        can_manage_chat=True,
+        can_delete_messages=True,
+        can_manage_video_chats=False,
+        can_restrict_members=False,
+        can_promote_members=False,
+        can_change_info=False,
+        can_invite_users=False,
+        can_post_messages=can_post_messages,
+    )
 
 
 @pytest.fixture
@@ -14,6 +32,8 @@ def mock_update():
     update.effective_user = MagicMock()
     update.effective_user.id = 12345
     update.message = AsyncMock()
+    update.message.chat_id = 12345
+    update.message.message_id = 1
     return update
 
 
@@ -25,12 +45,6 @@ def mock_context():
     return context
 
 
-@pytest.fixture
-def bot():
-    """Фикстура для создания экземпляра бота"""
-    return SignatureBot("test_token", "test_signatures.db")
-
-
 @pytest.mark.asyncio
 async def test_start_command(bot, mock_update, mock_context):
     """Тест команды /start"""
@@ -47,14 +61,15 @@ async def test_set_signature_command(bot, mock_update, mock_context):
     # Тест без аргументов
     mock_context.args = []
     await bot.set_signature(mock_update, mock_context)
-    mock_update.message.reply_text.assert_called_with(
-        "Пожалуйста, укажите подпись после команды.\n" "Пример: /set_signature С уважением, Иван"
-    )
+    call_args = mock_update.message.reply_text.call_args[0][0]
+    assert call_args.startswith("Пожалуйста, укажите подпись после команды.")
 
     # Тест с подписью
     mock_context.args = ["Тестовая", "подпись"]
+    mock_update.message.text = "/set_signature Тестовая подпись"
+    mock_update.message.entities = []
     await bot.set_signature(mock_update, mock_context)
-    assert bot.db.get_signature(mock_update.effective_user.id) == "Тестовая подпись"
+    assert await bot.db.get_signature(mock_update.effective_user.id) == ("Тестовая подпись", None)
 
 
 @pytest.mark.asyncio
@@ -63,14 +78,17 @@ async def test_handle_message(bot, mock_update, mock_context):
     # Установка тестовой подписи
     user_id = mock_update.effective_user.id
     test_signature = "Тестовая подпись"
-    bot.db.set_signature(user_id, test_signature)
+    await bot.db.set_signature(user_id, test_signature)
 
     # Тестовое сообщение
     mock_update.message.text = "Тестовое сообщение"
+    mock_update.message.entities = []
 
     # Проверяем отправку сообщения с подписью
     await bot.handle_message(mock_update, mock_context)
-    mock_update.message.reply_text.assert_called_with(f"Тестовое сообщение\n\n{test_signature}")
+    mock_update.message.reply_text.assert_called_with(
+        f"Тестовое сообщение\n\n{test_signature}", entities=[]
+    )
 
 
 @pytest.mark.asyncio
@@ -79,19 +97,38 @@ async def test_set_channel_command(bot, mock_update, mock_context):
     test_channel = "@test_channel"
     mock_context.args = [test_channel]
 
-    # Мокаем успешную отправку тестового сообщения
-    test_message = MagicMock()
-    test_message.message_id = 1
-    mock_context.bot.send_message.return_value = test_message
+    # Бот - администратор канала с правом публикации
+    mock_context.bot.id = BOT_ID
+    mock_context.bot.get_chat.return_value = Chat(CHANNEL_CHAT_ID, Chat.CHANNEL)
+    mock_context.bot.get_chat_member.return_value = administrator(can_post_messages=True)
 
     await bot.set_channel(mock_update, mock_context)
 
     # Проверяем, что канал был установлен
-    assert bot.db.get_channel(mock_update.effective_user.id) == test_channel
+    assert await bot.db.get_channels(mock_update.effective_user.id) == [test_channel]
+
+    # Права проверяются запросами, в канал ничего не отправляется
+    mock_context.bot.get_chat.assert_called_once_with(test_channel)
+    mock_context.bot.get_chat_member.assert_called_once_with(CHANNEL_CHAT_ID, BOT_ID)
+    mock_context.bot.send_message.assert_not_called()
+
+    # Повторная проверка того же канала берется из кэша
+    await bot.add_channel(mock_update, mock_context)
+    mock_context.bot.get_chat.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_set_channel_without_post_rights(bot, mock_update, mock_context):
+    """Тест отказа в установке канала без права публикации"""
+    mock_context.args = ["@test_channel"]
+    mock_context.bot.get_chat.return_value = Chat(CHANNEL_CHAT_ID, Chat.CHANNEL)
+    mock_context.bot.get_chat_member.return_value = administrator(can_post_messages=False)
+
+    await bot.set_channel(mock_update, mock_context)
 
-    # Проверяем, что было отправлено и удалено тестовое сообщение
-    mock_context.bot.send_message.assert_called_with(test_channel, "Тестовое сообщение")
-    mock_context.bot.delete_message.assert_called_with(test_channel, test_message.message_id)
+    assert await bot.db.get_channels(mock_update.effective_user.id) == []
+    reply = mock_update.message.reply_text.call_args[0][0]
+    assert reply.startswith("Ошибка при установке канала.")
 
 
 @pytest.mark.asyncio
@@ -110,7 +147,46 @@ async def test_remove_signature_command(bot, mock_update, mock_context):
     mock_update.message.reply_text.reset_mock()
 
     # Тест удаления существующей подписи
-    bot.db.set_signature(user_id, "Тест")
+    await bot.db.set_signature(user_id, "Тест")
     await bot.remove_signature(mock_update, mock_context)
     mock_update.message.reply_text.assert_called_once_with("Подпись удалена.")
-    assert bot.db.get_signature(user_id) is None
+    assert await bot.db.get_signature(user_id) == (None, None)
+
+
+@pytest.mark.asyncio
+async def test_handle_message_fan_out(bot, mock_update, mock_context):
+    """Тест отправки сообщения во все каналы через очередь с одной сводкой ошибок"""
+    user_id = mock_update.effective_user.id
+    await bot.db.set_signature(user_id, "Подпись")
+    for channel in ("@ok", "@broken", "@missing"):
+        await bot.db.add_channel(user_id, channel)
+
+    async def do_api_request(method, api_kwargs):
+        if api_kwargs["chat_id"] != "@ok":
+            raise BadRequest(f"{api_kwargs['chat_id']} недоступен")
+
+    mock_context.bot.do_api_request.side_effect = do_api_request
+    mock_update.message.text = "Сообщение"
+    mock_update.message.entities = []
+
+    await bot.outbox.start(mock_context.bot)
+    await bot.handle_message(mock_update, mock_context)
+    # Ответ пользователю не ждет доставки в каналы
+    mock_update.message.reply_text.assert_called_once()
+
+    assert await bot.outbox.drain(1)
+    await bot.outbox.stop()
+
+    calls = mock_context.bot.do_api_request.call_args_list
+    assert {call.args[0] for call in calls} == {"sendmessage"}
+    assert {call.kwargs["api_kwargs"]["chat_id"] for call in calls} == {
+        "@ok",
+        "@broken",
+        "@missing",
+    }
+    assert all(call.kwargs["api_kwargs"]["text"] == "Сообщение\n\nПодпись" for call in calls)
+    # Одно сводное сообщение об ошибках
+    mock_context.bot.send_message.assert_called_once()
+    chat_id, summary = mock_context.bot.send_message.call_args.args
+    assert chat_id == 12345
+    assert "@broken" in summary and "@missing" in summary and "@ok" not in summary
@@ -0,0 +1,81 @@
+from telegram_signature_bot.cache import ProfileCache, UserProfile
+from telegram_signature_bot.template import compile_signature
+
+from .conftest import FakeClock
+
+
+def test_lru_eviction():
+    """Тест вытеснения давно не использованных записей"""
+    cache = ProfileCache(max_entries=2)
+    cache.put(1, UserProfile(compile_signature("one")))
+    cache.put(2, UserProfile(compile_signature("two")))
+    assert cache.get(1).signature == "one"
+
+    cache.put(3, UserProfile(compile_signature("three")))
+    assert 2 not in cache
+    assert 1 in cache and 3 in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiration():
+    """Тест устаревания записей"""
+    clock = FakeClock()
+    cache = ProfileCache(ttl=10, clock=clock)
+    cache.put(1, UserProfile(compile_signature("one")))
+
+    clock.now = 5
+    assert cache.get(1) is not None
+    clock.now = 11
+    assert cache.get(1) is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_memory_cap():
+    """Тест ограничения кэша по объему памяти"""
+    one_entry = ProfileCache()
+    one_entry.put(1, UserProfile(compile_signature("x" * 100)))
+    cache = ProfileCache(max_bytes=one_entry.size_bytes * 3)
+
+    for user_id in range(10):
+        cache.put(user_id, UserProfile(compile_signature("x" * 100)))
+    assert len(cache) == 3
+    assert cache.size_bytes <= cache.max_bytes
+
+
+def test_stale_put_is_ignored():
+    """Тест защиты от записи устаревших данных после инвалидации"""
+    cache = ProfileCache()
+    generation = cache.generation
+    cache.invalidate(1)
+    cache.put(1, UserProfile(compile_signature("stale")), generation)
+    assert 1 not in cache
+
+
+async def test_read_through_and_invalidation(test_db):
+    """Тест чтения через кэш и сброса записи при изменении данных"""
+    user_id = 12345
+    await test_db.set_signature(user_id, "Signature")
+    await test_db.set_channel(user_id, "@channel")
+
+    profile = await test_db.get_profile(user_id)
+    assert profile == UserProfile(compile_signature("Signature"), ("@channel",))
+    assert await test_db.get_profile(user_id) is profile
+    assert test_db.cache.hits == 1
+
+    await test_db.remove_channel(user_id)
+    assert (await test_db.get_profile(user_id)).channels == ()
+
+    await test_db.set_signature(user_id, "New signature")
+    assert (await test_db.get_profile(user_id)).signature == "New signature"
+
+    await test_db.remove_signature(user_id)
+    assert (await test_db.get_profile(user_id)).signature is None
+
+
+async def test_missing_profile_is_cached(test_db):
+    """Тест кэширования отсутствующего профиля"""
+    assert await test_db.get_profile(1) == UserProfile()
+    assert await test_db.get_profile(1) == UserProfile()
+    assert test_db.cache.stats()["hits"] == 1
@@ -1,66 +1,65 @@
-import os
-
-import pytest
-
 from telegram_signature_bot.database import Database
 
 
-@pytest.fixture
-def test_db():
-    """Фикстура для создания тестовой базы данных"""
-    db_name = "test_signatures.db"
-    db = Database(db_name)
-    yield db
-    # Очищаем после тестов
-    if os.path.exists(db_name):
-        os.remove(db_name)
-
-
-def test_signature_operations(test_db):
+async def test_signature_operations(test_db):
     """Тест операций с подписями"""
     user_id = 12345
     signature = "Test Signature"
 
     # Проверяем, что изначально подписи нет
-    assert test_db.get_signature(user_id) is None
+    assert await test_db.get_signature(user_id) == (None, None)
 
     # Добавляем подпись
-    test_db.set_signature(user_id, signature)
-    assert test_db.get_signature(user_id) == signature
+    await test_db.set_signature(user_id, signature)
+    assert await test_db.get_signature(user_id) == (signature, None)
 
     # Обновляем подпись
     new_signature = "Updated Signature"
-    test_db.set_signature(user_id, new_signature)
-    assert test_db.get_signature(user_id) == new_signature
+    await test_db.set_signature(user_id, new_signature)
+    assert await test_db.get_signature(user_id) == (new_signature, None)
 
     # Удаляем подпись
-    test_db.remove_signature(user_id)
-    assert test_db.get_signature(user_id) is None
+    await test_db.remove_signature(user_id)
+    assert await test_db.get_signature(user_id) == (None, None)
 
 
-def test_channel_operations(test_db):
+async def test_channel_operations(test_db):
     """Тест операций с каналами"""
     user_id = 12345
     channel_id = "@test_channel"
 
     # Проверяем, что изначально канала нет
-    assert test_db.get_channel(user_id) is None
+    assert await test_db.get_channels(user_id) == []
 
     # Добавляем канал
-    test_db.set_channel(user_id, channel_id)
-    assert test_db.get_channel(user_id) == channel_id
+    await test_db.set_channel(user_id, channel_id)
+    assert await test_db.get_channels(user_id) == [channel_id]
 
     # Обновляем канал
     new_channel = "@new_channel"
-    test_db.set_channel(user_id, new_channel)
-    assert test_db.get_channel(user_id) == new_channel
+    await test_db.set_channel(user_id, new_channel)
+    assert await test_db.get_channels(user_id) == [new_channel]
 
     # Удаляем канал
-    test_db.remove_channel(user_id)
-    assert test_db.get_channel(user_id) is None
+    assert await test_db.remove_channel(user_id) == 1
+    assert await test_db.get_channels(user_id) == []
+
+
+async def test_multiple_channels(test_db):
+    """Тест нескольких каналов одного пользователя"""
+    user_id = 12345
+    await test_db.add_channel(user_id, "@first")
+    await test_db.add_channel(user_id, "@second")
+    await test_db.add_channel(user_id, "@second")
+    assert sorted(await test_db.get_channels(user_id)) == ["@first", "@second"]
+    assert sorted((await test_db.get_profile(user_id)).channels) == ["@first", "@second"]
+
+    assert await test_db.remove_channel(user_id, "@first") == 1
+    assert await test_db.remove_channel(user_id, "@missing") == 0
+    assert (await test_db.get_profile(user_id)).channels == ("@second",)
 
 
-def test_multiple_users(test_db):
+async def test_multiple_users(test_db):
     """Тест работы с несколькими пользователями"""
     user1_id = 111
     user2_id = 222
@@ -70,13 +69,34 @@ def test_multiple_users(test_db):
     channel2 = "@channel2"
 
     # Добавляем данные для обоих пользователей
-    test_db.set_signature(user1_id, signature1)
-    test_db.set_signature(user2_id, signature2)
-    test_db.set_channel(user1_id, channel1)
-    test_db.set_channel(user2_id, channel2)
+    await test_db.set_signature(user1_id, signature1)
+    await test_db.set_signature(user2_id, signature2)
+    await test_db.set_channel(user1_id, channel1)
+    await test_db.set_channel(user2_id, channel2)
 
     # Проверяем, что данные не перемешиваются
-    assert test_db.get_signature(user1_id) == signature1
-    assert test_db.get_signature(user2_id) == signature2
-    assert test_db.get_channel(user1_id) == channel1
-    assert test_db.get_channel(user2_id) == channel2
+    assert await test_db.get_signature(user1_id) == (signature1, None)
+    assert await test_db.get_signature(user2_id) == (signature2, None)
+    assert await test_db.get_channels(user1_id) == [channel1]
+    assert await test_db.get_channels(user2_id) == [channel2]
+
+
+async def test_wal_and_pool(test_db):
+    """Тест режима WAL и переиспользования соединений пула"""
+    async with test_db.pool.writer() as conn:
+        async with conn.execute("PRAGMA journal_mode") as cursor:
+            assert (await cursor.fetchone())[0] == "wal"
+
+    # Параллельные чтения не открывают новых соединений
+    await test_db.set_signature(1, "Signature")
+    results = [await test_db.get_signature(1) for _ in range(10)]
+    assert all(result == ("Signature", None) for result in results)
+    assert len(test_db.pool._all_readers) == test_db.pool.size
+
+
+async def test_memory_database():
+    """Тест работы базы данных в памяти"""
+    db = Database(":memory:")
+    await db.set_signature(1, "Signature")
+    assert await db.get_signature(1) == ("Signature", None)
+    await db.close()
@@ -0,0 +1,172 @@
+import asyncio
+
+from telegram import Update
+
+from telegram_signature_bot.bot import SignatureBot
+from telegram_signature_bot.dedup import HIGH_WATER_TTL, MISSING_UPDATE_TIMEOUT, UpdateDeduplicator
+from telegram_signature_bot.fake_api import FakeTelegramServer, text_update
+from telegram_signature_bot.lanes import LaneUpdateProcessor
+
+from .conftest import FakeClock, stop_application
+
+USER_ID = 12345
+
+
+def update(update_id, message_id=None, edited=False):
+    data = text_update(update_id, USER_ID, "text")
+    data["message"]["message_id"] = message_id or update_id
+    if edited:
+        data["edited_message"] = data.pop("message")
+    return Update.de_json(data, None)
+
+
+def test_duplicates_dropped():
+    """Тест повторов по update_id и по сообщению; исправления сообщений не отбрасываются"""
+    dedup = UpdateDeduplicator()
+    assert dedup.begin(update(1))
+    assert not dedup.begin(update(1))
+    # Тот же message_id в новом обновлении - повтор после перезапуска
+    assert not dedup.begin(update(2, message_id=1))
+    assert dedup.begin(update(3, message_id=1, edited=True))
+    assert dedup.begin("custom update")
+
+
+def test_capacity_bounds_memory():
+    """Тест ограничения числа запоминаемых ключей"""
+    dedup = UpdateDeduplicator(capacity=4)
+    for update_id in range(1, 11):
+        assert dedup.begin(update(update_id))
+        dedup.finish(update(update_id))
+    assert len(dedup) == 4
+    assert dedup.watermark() == 10
+
+
+def test_watermark_waits_for_unfinished_updates():
+    """Тест границы: обновление в обработке и все после него не считаются обработанными"""
+    dedup = UpdateDeduplicator()
+    for update_id in (1, 2, 3):
+        dedup.begin(update(update_id))
+    dedup.finish(update(1))
+    dedup.finish(update(3))
+    assert dedup.watermark() == 1
+    dedup.finish(update(2))
+    assert dedup.watermark() == 3
+
+
+def test_out_of_order_updates_not_dropped():
+    """Тест обновлений не по порядку update_id, как при вебхуке с несколькими соединениями"""
+    dedup = UpdateDeduplicator()
+    assert dedup.begin(update(101))
+    assert dedup.begin(update(100))
+    dedup.finish(update(101))
+    assert dedup.watermark() == 99
+    assert dedup.begin(update(103))
+    dedup.finish(update(103))
+    assert dedup.begin(update(102))
+    for update_id in (100, 102):
+        dedup.finish(update(update_id))
+    assert dedup.watermark() == 103
+    assert not dedup.begin(update(102))
+
+
+def test_late_update_survives_restart():
+    """Тест границы: обновление, пришедшее позже следующих, не теряется после перезапуска"""
+    clock = FakeClock(1_000_000.0)
+    dedup = UpdateDeduplicator(clock=clock)
+    for update_id in (101, 102, 104, 105):
+        dedup.begin(update(update_id))
+        dedup.finish(update(update_id))
+    assert dedup.watermark() == 102
+
+    restarted = UpdateDeduplicator(clock=clock)
+    restarted.restore(dedup.dump())
+    assert not restarted.begin(update(102))
+    assert restarted.begin(update(103))
+    restarted.finish(update(103))
+    assert restarted.watermark() == 103
+
+
+def test_missing_update_skipped_after_timeout():
+    """Тест пропуска в ряду update_id: граница не останавливается навсегда"""
+    clock = FakeClock(1_000_000.0)
+    dedup = UpdateDeduplicator(clock=clock)
+    for update_id in (1, 3):
+        dedup.begin(update(update_id))
+        dedup.finish(update(update_id))
+    assert dedup.watermark() == 1
+    clock.now += MISSING_UPDATE_TIMEOUT
+    assert dedup.watermark() == 3
+
+
+def test_held_update_finished_on_release():
+    """Тест удержания: элемент альбома не считается обработанным до публикации альбома"""
+    dedup = UpdateDeduplicator()
+    for update_id in (1, 2):
+        dedup.begin(update(update_id))
+    dedup.hold(update(1))
+    dedup.finish(update(1))
+    dedup.finish(update(2))
+    assert dedup.watermark() == 0
+    dedup.release(update(1))
+    assert dedup.watermark() == 2
+
+
+def test_restore_high_water():
+    """Тест восстановления границы и игнорирования устаревшей"""
+    clock = FakeClock(1_000_000.0)
+    dedup = UpdateDeduplicator(clock=clock)
+    dedup.restore(f"10 {clock.now - 60}")
+    assert not dedup.begin(update(10))
+    assert dedup.begin(update(11))
+
+    stale = UpdateDeduplicator(clock=clock)
+    stale.restore(f"10 {clock.now - HIGH_WATER_TTL}")
+    assert stale.begin(update(5))
+
+
+async def test_processor_skips_duplicate():
+    """Тест обработчика обновлений: повтор не выполняется"""
+    processor = LaneUpdateProcessor(deduplicator=UpdateDeduplicator())
+    handled = []
+
+    async def handle(name):
+        handled.append(name)
+
+    await processor.process_update(update(1), handle("first"))
+    await processor.process_update(update(1), handle("again"))
+    assert handled == ["first"]
+    assert processor.deduplicator.watermark() == 1
+
+
+async def test_redelivered_update_posted_once(tmp_path):
+    """Тест сквозной обработки: повтор обновления, в том числе после перезапуска"""
+    server = FakeTelegramServer(seed=1)
+    await server.start()
+    db_path = str(tmp_path / "signatures.db")
+
+    async def run_bot(*updates):
+        bot = SignatureBot("123:test_token", db_path, base_url=server.base_url)
+        application = bot.application
+        await application.initialize()
+        await bot.post_init(application)
+        await bot.db.set_signature(USER_ID, "Подпись")
+        await bot.db.set_channel(USER_ID, "@channel")
+        for data in updates:
+            await server.inject(data)
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        await asyncio.sleep(0.3)
+        await stop_application(application)
+        return bot
+
+    first = text_update(1, USER_ID, "Текст")
+    bot = await run_bot(first, first)
+    assert len(server.requests("sendMessage")) == 2
+    assert bot.deduplicator.watermark() == 1
+
+    bot = await run_bot(first)
+    await server.stop()
+    # Канал и копия пользователю только от первого обновления
+    assert len(server.requests("sendMessage")) == 2
+    # Повтор отброшен по границе, восстановленной из базы
+    assert bot.deduplicator.high_water == 1
@@ -0,0 +1,214 @@
+import asyncio
+
+import httpx
+import pytest
+from telegram.warnings import PTBDeprecationWarning
+
+from telegram_signature_bot.bot import SignatureBot
+from telegram_signature_bot.fake_api import FakeTelegramServer, text_update
+
+from .conftest import start_application, stop_application
+
+USER_ID = 12345
+
+
+async def wait_for(condition, timeout=5.0):
+    """Ожидание выполнения условия"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "condition was not met in time"
+        await asyncio.sleep(0.01)
+
+
+async def inject_album_photo(server, index):
+    """Добавление фото альбома пользователя, возвращает update_id"""
+    update_id = server.next_update_id()
+    update = text_update(update_id, USER_ID, "")
+    message = update["message"]
+    del message["text"]
+    message["media_group_id"] = "album"
+    message["photo"] = [
+        {"file_id": f"photo{index}", "file_unique_id": f"p{index}", "width": 1, "height": 1}
+    ]
+    await server.inject(update)
+    return update_id
+
+
+@pytest.fixture
+async def server():
+    """Фикстура локального сервера Bot API"""
+    server = FakeTelegramServer(seed=1)
+    await server.start()
+    yield server
+    await server.stop()
+
+
+@pytest.fixture
+async def running_bot(server, tmp_path):
+    """Фикстура бота, получающего обновления от локального сервера через long polling"""
+    bot = SignatureBot(
+        "123:test_token", str(tmp_path / "test_signatures.db"), base_url=server.base_url
+    )
+    await start_application(bot.application)
+    yield bot
+    await stop_application(bot.application)
+
+
+async def test_get_updates_and_send_message(server):
+    """Тест выдачи обновлений с учетом offset и записи отправленных сообщений"""
+    await server.inject_text(USER_ID, "Привет")
+    async with httpx.AsyncClient(base_url=server.base_url + "123:token") as client:
+        response = await client.post("/getUpdates", data={"timeout": "0"})
+        updates = response.json()["result"]
+        assert [update["message"]["text"] for update in updates] == ["Привет"]
+
+        response = await client.post(
+            "/getUpdates", data={"offset": str(updates[-1]["update_id"] + 1), "timeout": "0"}
+        )
+        assert response.json()["result"] == []
+
+        response = await client.post(
+            "/sendMessage", data={"chat_id": "@channel", "text": "Текст", "entities": "[]"}
+        )
+        message = response.json()["result"]
+        assert message["chat"]["type"] == "channel" and message["text"] == "Текст"
+    assert server.requests("sendMessage")[0].params == {
+        "chat_id": "@channel",
+        "text": "Текст",
+        "entities": [],
+    }
+
+
+async def test_flood_response(server):
+    """Тест ответа 429 с параметром retry_after"""
+    server.flood_rate = 1.0
+    async with httpx.AsyncClient(base_url=server.base_url + "123:token") as client:
+        response = await client.post("/sendMessage", data={"chat_id": "1", "text": "x"})
+    assert response.status_code == 429
+    assert response.json()["parameters"] == {"retry_after": 1}
+    assert server.flood_responses == 1 and server.sent == []
+
+
+async def test_end_to_end_message(server, running_bot, recwarn):
+    """Тест полного пути: getUpdates, обработчик, ответ пользователю и публикация в канал"""
+    await running_bot.db.set_signature(USER_ID, "Подпись")
+    await running_bot.db.add_channel(USER_ID, "@channel")
+
+    await server.inject_text(USER_ID, "Сообщение")
+    await wait_for(lambda: len(server.requests("sendMessage")) == 2)
+
+    sent = {str(r.params["chat_id"]): r.params["text"] for r in server.requests("sendMessage")}
+    assert sent == {str(USER_ID): "Сообщение\n\nПодпись", "@channel": "Сообщение\n\nПодпись"}
+    # Доставка из очереди не вызывает предупреждений PTB об устаревших вызовах
+    assert not [w for w in recwarn if issubclass(w.category, PTBDeprecationWarning)]
+
+
+async def test_end_to_end_add_channel(server, running_bot):
+    """Тест проверки прав при добавлении канала без отправки сообщений в канал"""
+    await server.inject_text(USER_ID, "/add_channel @channel")
+    await wait_for(lambda: len(server.requests("sendMessage")) == 1)
+
+    assert server.requests("sendMessage")[0].params["text"] == "Канал @channel добавлен."
+    assert [r.params["chat_id"] for r in server.requests("getChat")] == ["@channel"]
+    assert len(server.requests("getChatMember")) == 1
+    assert await running_bot.db.get_channels(USER_ID) == ["@channel"]
+
+
+async def test_end_to_end_edit(server, running_bot):
+    """Тест исправления опубликованного сообщения на месте после правки исходного"""
+    await running_bot.db.set_signature(USER_ID, "Подпись")
+    await running_bot.db.add_channel(USER_ID, "@channel")
+
+    update_id = await server.inject_text(USER_ID, "Сообщение")
+    await wait_for(lambda: len(server.requests("sendMessage")) == 2)
+    assert await running_bot.outbox.drain(1)
+    (post,) = await running_bot.db.get_posts(USER_ID, USER_ID, update_id)
+
+    await server.inject_edit(USER_ID, update_id, "Исправленное сообщение")
+    await wait_for(lambda: len(server.requests("editMessageText")) == 1)
+    assert server.requests("editMessageText")[0].params == {
+        "chat_id": "@channel",
+        "message_id": str(post.message_id),
+        "text": "Исправленное сообщение\n\nПодпись",
+    }
+    # Правка не публикуется новым сообщением
+    assert len(server.requests("sendMessage")) == 2
+
+
+async def test_end_to_end_profile(server, running_bot, tmp_path):
+    """Тест команды /profile: только для администратора, фазы включают запросы к Bot API"""
+    await server.inject_text(USER_ID, "/profile 1")
+    await wait_for(lambda: len(server.requests("sendMessage")) == 1)
+    assert "только администраторам" in server.requests("sendMessage")[0].params["text"]
+
+    running_bot.admin_ids = frozenset({USER_ID})
+    running_bot.profile_dir = str(tmp_path / "profiles")
+    await running_bot.db.set_signature(USER_ID, "Подпись")
+    await server.inject_text(USER_ID, "/profile 0.5")
+    await wait_for(lambda: len(server.requests("sendMessage")) == 2)
+    await server.inject_text(USER_ID, "Сообщение")
+    await wait_for(lambda: len(server.requests("sendMessage")) == 4)
+
+    report = server.requests("sendMessage")[3].params["text"]
+    assert report.startswith(f"Профиль записан в {tmp_path / 'profiles'}")
+    (summary,) = (tmp_path / "profiles").glob("profile-*.txt")
+    assert "handle_message" in summary.read_text()
+    assert "api:sendMessage" in summary.read_text()
+
+
+async def test_end_to_end_album_before_next_message(server, running_bot):
+    """Тест порядка: альбом публикуется раньше отправленного после него сообщения"""
+    await running_bot.db.set_signature(USER_ID, "Подпись")
+    await running_bot.db.add_channel(USER_ID, "@channel")
+    # Окно сборки дольше теста: альбом публикуется по следующему сообщению
+    running_bot.albums.window = 30.0
+
+    album_ids = [await inject_album_photo(server, index) for index in range(2)]
+    await server.inject_text(USER_ID, "Сообщение")
+
+    def channel_methods():
+        return [r.method for r in server.sent if r.params.get("chat_id") == "@channel"]
+
+    await wait_for(lambda: len(channel_methods()) == 2)
+    assert channel_methods() == ["sendmediagroup", "sendmessage"]
+    # Элементы альбома считаются обработанными только после его публикации
+    assert running_bot.deduplicator.watermark() >= album_ids[-1]
+
+
+async def test_clean_shutdown_delivers_pending_outbox(server, tmp_path):
+    """Тест остановки: очередь доставляется до закрытия HTTP клиента бота, без повторов"""
+    bot = SignatureBot(
+        "123:test_token", str(tmp_path / "test_signatures.db"), base_url=server.base_url
+    )
+    await start_application(bot.application)
+    await bot.db.set_signature(USER_ID, "Подпись")
+    await bot.db.add_channel(USER_ID, "@channel")
+    # Отправка в канал еще выполняется, когда начинается остановка
+    server.latency = 0.2
+    await server.inject_text(USER_ID, "Сообщение")
+    await wait_for(lambda: server.updates_served == 1)
+    await stop_application(bot.application)
+
+    channel = [r for r in server.requests("sendMessage") if r.params["chat_id"] == "@channel"]
+    assert [r.params["text"] for r in channel] == ["Сообщение\n\nПодпись"]
+    assert (bot.outbox.delivered, bot.outbox.retried, bot.outbox.dead) == (1, 0, 0)
+
+
+async def test_clean_shutdown_flushes_pending_album(server, tmp_path):
+    """Тест остановки: собираемый альбом публикуется до закрытия HTTP клиента бота"""
+    bot = SignatureBot(
+        "123:test_token", str(tmp_path / "test_signatures.db"), base_url=server.base_url
+    )
+    await start_application(bot.application)
+    await bot.db.set_signature(USER_ID, "Подпись")
+    await bot.db.add_channel(USER_ID, "@channel")
+    bot.albums.window = 30.0
+    for index in range(2):
+        await inject_album_photo(server, index)
+    await wait_for(lambda: len(bot.albums) == 1)
+    await stop_application(bot.application)
+
+    chats = sorted(str(r.params["chat_id"]) for r in server.requests("sendMediaGroup"))
+    assert chats == sorted([str(USER_ID), "@channel"])
+    assert bot.outbox.retried == 0
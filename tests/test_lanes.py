@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from telegram import Update
+
+from telegram_signature_bot.fake_api import text_update
+from telegram_signature_bot.lanes import Lanes, LaneUpdateProcessor, lane_key
+
+
+def update(update_id, user_id):
+    return Update.de_json(text_update(update_id, user_id, "text"), None)
+
+
+async def test_lanes_keep_order_per_key():
+    """Тест порядка внутри ключа и параллельности разных ключей"""
+    lanes = Lanes()
+    events = []
+    release = asyncio.Event()
+
+    async def work(key, name):
+        async with lanes.hold(key):
+            events.append(f"start {name}")
+            if name == "a1":
+                await release.wait()
+            events.append(f"end {name}")
+
+    tasks = [asyncio.create_task(work(key, name)) for key, name in [(1, "a1"), (1, "a2"), (2, "b")]]
+    await asyncio.sleep(0)
+    # Обновление ключа 2 уже обработано, второе обновление ключа 1 ждет первого
+    assert lanes.stats() == {"lanes": 1, "waiting": 1, "max_depth": 2}
+    await asyncio.sleep(0.01)
+    # Обновление другого ключа не ждет медленного первого
+    assert events == ["start a1", "start b", "end b"]
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert events[3:] == ["end a1", "start a2", "end a2"]
+    assert len(lanes) == 0 and lanes.stats()["max_depth"] == 0
+
+
+async def test_cancelled_waiter_keeps_order():
+    """Тест отмены ожидающего: следующий все равно ждет выполняющегося"""
+    lanes = Lanes()
+    release = asyncio.Event()
+    events = []
+
+    async def work(name, wait=False):
+        async with lanes.hold(1):
+            events.append(name)
+            if wait:
+                await release.wait()
+
+    first = asyncio.create_task(work("first", wait=True))
+    second = asyncio.create_task(work("second"))
+    third = asyncio.create_task(work("third"))
+    await asyncio.sleep(0)
+    second.cancel()
+    await asyncio.sleep(0.01)
+    assert events == ["first"]
+
+    release.set()
+    await asyncio.gather(first, third)
+    assert events == ["first", "third"]
+    assert second.cancelled()
+
+
+def test_lane_key():
+    """Тест выбора очереди обновления"""
+    assert lane_key(update(1, 42)) == 42
+    assert lane_key(Update(2)) is None
+    assert lane_key("custom update") is None
+
+
+async def test_processor_limits_running_updates():
+    """Тест ограничения одновременно выполняемых обновлений без учета ожидающих очереди"""
+    processor = LaneUpdateProcessor(max_running_updates=2, max_pending_updates=100)
+    await processor.initialize()
+    assert processor.max_concurrent_updates == 100
+    release = asyncio.Event()
+    running = []
+
+    async def handle(name):
+        running.append(name)
+        await release.wait()
+
+    # Пять обновлений одного пользователя не занимают лимит, пока ждут очереди
+    tasks = [
+        asyncio.create_task(processor.process_update(update(i, 1), handle(f"user1-{i}")))
+        for i in range(5)
+    ]
+    tasks += [
+        asyncio.create_task(processor.process_update(update(10 + i, 2 + i), handle(f"user{2 + i}")))
+        for i in range(2)
+    ]
+    await asyncio.sleep(0.01)
+    assert running == ["user1-0", "user2"]
+    assert processor.stats() == {"running": 2, "lanes": 3, "waiting": 4, "max_depth": 5}
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert running[2:] == ["user3", "user1-1", "user1-2", "user1-3", "user1-4"]
+    assert processor.stats()["lanes"] == 0
+
+
+def test_processor_rejects_zero_concurrency():
+    with pytest.raises(ValueError):
+        LaneUpdateProcessor(0)
@@ -0,0 +1,138 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from telegram import MessageEntity, Update
+
+from telegram_signature_bot.media import MEDIA_FILTER, media_kind
+
+USER_ID = 12345
+
+
+@pytest.fixture
+async def bot(make_bot):
+    """Фикстура бота с подписью и каналом"""
+    bot = await make_bot()
+    await bot.db.set_signature(USER_ID, "Подпись", [MessageEntity(MessageEntity.BOLD, 0, 7)])
+    await bot.db.add_channel(USER_ID, "@channel")
+    return bot
+
+
+@pytest.fixture
+def context():
+    """Фикстура контекста с моком Bot"""
+    context = MagicMock()
+    context.bot = AsyncMock()
+    context.bot.defaults = None
+    return context
+
+
+async def publish(bot, context, update):
+    """Обработка медиафайла и доставка отправок в канал из очереди"""
+    await bot.outbox.start(context.bot)
+    await bot.handle_media(update, context)
+    assert await bot.outbox.drain(1)
+    return [call.kwargs["api_kwargs"] for call in context.bot.do_api_request.call_args_list]
+
+
+def media_update(context, media, **extra):
+    """Обновление с медиафайлом в формате Bot API"""
+    data = {
+        "update_id": 1,
+        "message": {
+            "message_id": 10,
+            "date": 1700000000,
+            "chat": {"id": USER_ID, "type": "private"},
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "Test"},
+            **media,
+            **extra,
+        },
+    }
+    return Update.de_json(data, context.bot)
+
+
+PHOTO = {"photo": [{"file_id": "small", "file_unique_id": "s", "width": 90, "height": 90}]}
+DOCUMENT = {"document": {"file_id": "doc", "file_unique_id": "d"}}
+ANIMATION = {
+    "animation": {
+        "file_id": "gif",
+        "file_unique_id": "g",
+        "width": 1,
+        "height": 1,
+        "duration": 1,
+    },
+    "document": {"file_id": "gif", "file_unique_id": "g"},
+}
+STICKER = {
+    "sticker": {
+        "file_id": "sticker",
+        "file_unique_id": "st",
+        "type": "regular",
+        "width": 512,
+        "height": 512,
+        "is_animated": False,
+        "is_video": False,
+    }
+}
+
+
+@pytest.mark.parametrize(
+    "media, attribute",
+    [(PHOTO, "photo"), (DOCUMENT, "document"), (ANIMATION, "animation"), (STICKER, "sticker")],
+)
+def test_media_kind(context, media, attribute):
+    """Тест определения типа медиафайла и единого фильтра"""
+    update = media_update(context, media)
+    assert media_kind(update.message).attribute == attribute
+    assert MEDIA_FILTER.check_update(update)
+
+
+async def test_media_is_copied_with_signature(bot, context):
+    """Тест копирования медиафайла с заменой caption"""
+    update = media_update(context, DOCUMENT, caption="Отчет")
+    posts = await publish(bot, context, update)
+
+    call = context.bot.copy_message.call_args
+    assert call.args == (USER_ID, USER_ID, 10)
+    assert call.kwargs["caption"] == "Отчет\n\nПодпись"
+    assert call.kwargs["caption_entities"][0].offset == 7
+
+    assert context.bot.do_api_request.call_args.args[0] == "copymessage"
+    assert posts == [
+        {
+            "chat_id": "@channel",
+            "from_chat_id": USER_ID,
+            "message_id": 10,
+            "caption": "Отчет\n\nПодпись",
+            "caption_entities": [{"type": "bold", "offset": 7, "length": 7}],
+        }
+    ]
+    context.bot.send_document.assert_not_called()
+
+
+async def test_sticker_gets_signature_message(bot, context):
+    """Тест отправки подписи отдельным сообщением для типов без caption"""
+    posts = await publish(bot, context, media_update(context, STICKER))
+
+    assert "caption" not in context.bot.copy_message.call_args.kwargs
+    assert context.bot.send_message.call_args.args == (USER_ID, "Подпись")
+    methods = sorted(call.args[0] for call in context.bot.do_api_request.call_args_list)
+    assert methods == ["copymessage", "sendmessage"]
+    assert all("caption" not in post for post in posts)
+    assert {
+        "chat_id": "@channel",
+        "text": "Подпись",
+        "entities": [{"type": "bold", "offset": 0, "length": 7}],
+    } in posts
+
+
+async def test_protected_content_fallback(bot, context):
+    """Тест отправки по file_id, если копирование запрещено"""
+    update = media_update(context, PHOTO, has_protected_content=True)
+    posts = await publish(bot, context, update)
+
+    context.bot.copy_message.assert_not_called()
+    call = context.bot.send_photo.call_args
+    assert call.args == (USER_ID, "small")
+    assert call.kwargs["caption"] == "Подпись"
+    assert context.bot.do_api_request.call_args.args[0] == "sendphoto"
+    assert posts[0]["photo"] == "small" and posts[0]["caption"] == "Подпись"
@@ -0,0 +1,102 @@
+import asyncio
+
+import httpx
+import pytest
+
+from telegram_signature_bot.bot import SignatureBot
+from telegram_signature_bot.fake_api import FakeTelegramServer
+from telegram_signature_bot.metrics import MetricsServer, Registry, timed
+
+from .conftest import start_application, stop_application
+
+
+async def test_counter_and_histogram_format():
+    """Тест текстового формата счетчиков и гистограмм"""
+    registry = Registry()
+    requests = registry.counter("requests_total", "Запросы", ["method"])
+    seconds = registry.histogram("request_seconds", "Длительность", buckets=(0.1, 1.0))
+    requests.labels("sendMessage").inc()
+    requests.labels("sendMessage").inc(2)
+    for value in (0.05, 0.5, 5):
+        seconds.observe(value)
+
+    text = await registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{method="sendMessage"} 3' in text
+    assert 'request_seconds_bucket{le="0.1"} 1' in text
+    assert 'request_seconds_bucket{le="1"} 2' in text
+    assert 'request_seconds_bucket{le="+Inf"} 3' in text
+    assert "request_seconds_sum 5.55" in text
+    assert "request_seconds_count 3" in text
+
+
+async def test_timed_and_callbacks():
+    """Тест учета ошибок декоратором и асинхронных метрик с обратным вызовом"""
+    registry = Registry()
+    seconds = registry.histogram("handler_seconds", "Длительность", ["handler"])
+    errors = registry.counter("handler_errors_total", "Ошибки", ["handler"])
+
+    @timed(seconds, errors, "broken")
+    async def broken():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await broken()
+
+    async def depth():
+        return {("pending",): 2}
+
+    registry.callback("queue_items", "Очередь", depth, ["status"])
+    text = await registry.render()
+    assert 'handler_seconds_count{handler="broken"} 1' in text
+    assert 'handler_errors_total{handler="broken"} 1' in text
+    assert 'queue_items{status="pending"} 2' in text
+    assert broken.__name__ == "broken"
+
+
+async def test_metrics_endpoint(tmp_path):
+    """Тест /metrics работающего бота: обработчики, запросы к Bot API и очереди"""
+    server = FakeTelegramServer()
+    await server.start()
+    bot = SignatureBot(
+        "123:test_token",
+        str(tmp_path / "test_signatures.db"),
+        base_url=server.base_url,
+        metrics_port=0,
+    )
+    await start_application(bot.application)
+    try:
+        await bot.db.set_signature(1, "Подпись")
+        await server.inject_text(1, "Сообщение")
+        for _ in range(500):
+            if server.requests("sendMessage"):
+                break
+            await asyncio.sleep(0.01)
+
+        async with httpx.AsyncClient(base_url=bot.metrics.http.url) as client:
+            response = await client.get("/metrics")
+            assert (await client.get("/other")).status_code == 404
+    finally:
+        await stop_application(bot.application)
+        await server.stop()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'signature_bot_handler_seconds_count{handler="handle_message"}' in text
+    assert 'signature_bot_telegram_requests_total{method="sendMessage",status="200"}' in text
+    assert 'signature_bot_db_query_seconds_count{query="get_profile"}' in text
+    assert 'signature_bot_profile_cache_requests_total{result="miss"}' in text
+    assert 'signature_bot_outbox_items{status="pending"} 0' in text
+    assert "signature_bot_update_queue_size 0" in text
+
+
+async def test_metrics_server_rejects_post():
+    """Тест отклонения запросов с другим методом"""
+    server = MetricsServer(port=0, registry=Registry())
+    await server.start()
+    try:
+        async with httpx.AsyncClient(base_url=server.http.url) as client:
+            assert (await client.post("/metrics")).status_code == 405
+    finally:
+        await server.stop()
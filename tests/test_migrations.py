@@ -0,0 +1,93 @@
+import sqlite3
+
+from telegram import MessageEntity
+
+from telegram_signature_bot.cache import UserProfile
+from telegram_signature_bot.database import Database
+from telegram_signature_bot.migrations import SCHEMA_VERSION
+from telegram_signature_bot.template import compile_signature
+
+
+def create_legacy_db(db_path):
+    """Создание базы в формате до появления миграций"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "CREATE TABLE signatures (user_id INTEGER PRIMARY KEY, signature TEXT NOT NULL, "
+            "entities TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE channels (user_id INTEGER PRIMARY KEY, channel_id TEXT NOT NULL)"
+        )
+        conn.execute(
+            "INSERT INTO signatures VALUES (1, 'Подпись', ?)",
+            ('[{"type": "bold", "offset": 0, "length": 7, "url": null}]',),
+        )
+        conn.execute("INSERT INTO signatures VALUES (2, 'Только подпись', NULL)")
+        conn.execute("INSERT INTO channels VALUES (1, '@channel')")
+        conn.execute("INSERT INTO channels VALUES (3, '@only_channel')")
+
+
+def table_names(db_path):
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+    return {row[0] for row in rows}
+
+
+async def test_migrate_legacy_database(tmp_path):
+    """Тест переноса данных из раздельных таблиц в профили"""
+    db_path = str(tmp_path / "development.db")
+    create_legacy_db(db_path)
+
+    db = Database(db_path)
+    await db.connect()
+    try:
+        profile = await db.get_profile(1)
+        assert profile.channels == ("@channel",)
+        assert profile.template == compile_signature(
+            "Подпись", [MessageEntity(MessageEntity.BOLD, 0, 7)]
+        )
+        assert await db.get_profile(2) == UserProfile(compile_signature("Только подпись"))
+        assert await db.get_profile(3) == UserProfile(None, ("@only_channel",))
+        assert await db.get_profile(4) == UserProfile()
+    finally:
+        await db.close()
+
+    assert table_names(db_path) == {
+        "profiles",
+        "profile_channels",
+        "outbox",
+        "meta",
+        "message_map",
+    }
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        # Данные единственного бота процесса
+        assert conn.execute("SELECT DISTINCT bot_id FROM profiles").fetchall() == [(0,)]
+
+
+async def test_migrations_are_applied_once(tmp_path):
+    """Тест повторного открытия базы с актуальной схемой"""
+    db_path = str(tmp_path / "production.db")
+    db = Database(db_path)
+    await db.set_signature(1, "Подпись")
+    await db.close()
+
+    db = Database(db_path)
+    await db.connect()
+    assert await db.get_signature(1) == ("Подпись", None)
+    await db.close()
+
+
+async def test_empty_profile_is_removed(tmp_path):
+    """Тест удаления профиля и каналов"""
+    db_path = str(tmp_path / "test.db")
+    db = Database(db_path)
+    await db.set_signature(1, "Подпись")
+    await db.set_channel(1, "@channel")
+    await db.remove_signature(1)
+    await db.remove_channel(1)
+    await db.close()
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM profile_channels").fetchone()[0] == 0
@@ -0,0 +1,157 @@
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+from telegram import MessageEntity
+from telegram.error import BadRequest, Forbidden, TimedOut
+
+from telegram_signature_bot.outbox import Outbox, OutboxRequest, api_method
+from telegram_signature_bot.scheduler import SendScheduler
+
+USER_ID = 1
+USER_CHAT_ID = 100
+
+
+@pytest.fixture
+async def outbox(test_db):
+    """Фикстура очереди с короткими задержками повторов"""
+    sender = SendScheduler(channel_rate=1000, channel_burst=1000)
+    outbox = Outbox(test_db, sender, workers=2, max_attempts=3, base_delay=0.01, notify_window=0.01)
+    yield outbox
+    await outbox.stop()
+    await sender.close()
+
+
+def message_request(text="Текст"):
+    return OutboxRequest(
+        "sendMessage", {"text": text, "entities": [MessageEntity(MessageEntity.BOLD, 0, 5)]}
+    )
+
+
+def test_api_method():
+    """Тест преобразования имени метода Bot в имя метода Bot API"""
+    assert api_method("send_photo") == "sendPhoto"
+    assert api_method("send_video_note") == "sendVideoNote"
+
+
+async def test_delivery_to_all_channels(test_db, outbox):
+    """Тест доставки и удаления записей из очереди"""
+    bot = AsyncMock()
+    await outbox.start(bot)
+    await outbox.enqueue(USER_ID, USER_CHAT_ID, ["@a", "@b"], [message_request()])
+    assert await outbox.drain(1)
+
+    calls = bot.do_api_request.call_args_list
+    assert {call.kwargs["api_kwargs"]["chat_id"] for call in calls} == {"@a", "@b"}
+    assert calls[0].kwargs["api_kwargs"]["entities"] == [{"type": "bold", "offset": 0, "length": 5}]
+    assert await test_db.outbox_stats() == {}
+    assert outbox.delivered == 2
+
+
+async def test_pending_items_recovered_on_start(test_db, outbox):
+    """Тест доставки записей, сохраненных до запуска и прерванных остановкой"""
+    await outbox.enqueue(USER_ID, USER_CHAT_ID, ["@a", "@b"], [message_request()])
+    # Одна запись выбрана, но процесс остановился до ее доставки
+    await test_db.claim_outbox(1, float("inf"))
+    assert await test_db.outbox_stats() == {"pending": 1, "inflight": 1}
+
+    bot = AsyncMock()
+    await outbox.start(bot)
+    assert await outbox.drain(1)
+    assert bot.do_api_request.call_count == 2
+
+
+async def test_transient_error_is_retried(test_db, outbox):
+    """Тест повтора с задержкой после временной ошибки"""
+    bot = AsyncMock()
+    bot.do_api_request.side_effect = [TimedOut(), True]
+    await outbox.start(bot)
+    await outbox.enqueue(USER_ID, USER_CHAT_ID, ["@a"], [message_request()])
+    assert await outbox.drain(1)
+
+    assert bot.do_api_request.call_count == 2
+    assert outbox.retried == 1 and outbox.delivered == 1
+    bot.send_message.assert_not_called()
+
+
+async def test_dead_letter_after_attempts(test_db, outbox):
+    """Тест перевода в недоставленные после исчерпания попыток и одного уведомления"""
+    bot = AsyncMock()
+    bot.do_api_request.side_effect = TimedOut()
+    await outbox.start(bot)
+    await outbox.enqueue(USER_ID, USER_CHAT_ID, ["@a"], [message_request()])
+    assert await outbox.drain(1)
+    await outbox.stop()
+
+    assert bot.do_api_request.call_count == 3
+    assert await test_db.outbox_stats() == {"dead": 1}
+    bot.send_message.assert_called_once()
+    chat_id, text = bot.send_message.call_args.args
+    assert chat_id == USER_CHAT_ID and "@a" in text
+
+
+async def test_permanent_error_is_not_retried(test_db, outbox):
+    """Тест недоставленных без повторов при отсутствии прав и сводки по каналам"""
+    bot = AsyncMock()
+    bot.do_api_request.side_effect = Forbidden("bot is not a member")
+    await outbox.start(bot)
+    requests = [message_request("Раз"), message_request("Два")]
+    await outbox.enqueue(USER_ID, USER_CHAT_ID, ["@a", "@b"], requests)
+    assert await outbox.drain(1)
+    await outbox.stop()
+
+    assert bot.do_api_request.call_count == 4
+    assert outbox.retried == 0 and outbox.dead == 4
+    bot.send_message.assert_called_once()
+    text = bot.send_message.call_args.args[1]
+    assert "(2)" in text and "@a: bot is not a member" in text
+
+
+async def test_posted_message_is_recorded(test_db, outbox):
+    """Тест записи опубликованного сообщения и правки без изменений как успешной"""
+    bot = AsyncMock()
+    bot.do_api_request.side_effect = [
+        {"message_id": 42},
+        BadRequest("Message is not modified: specified new message content is the same"),
+    ]
+    await outbox.start(bot)
+    await outbox.enqueue(
+        USER_ID, USER_CHAT_ID, ["@a"], [message_request()], source="100:7", source_message_id=7
+    )
+    assert await outbox.drain(1)
+    assert await test_db.get_posts(USER_ID, USER_CHAT_ID, 7) == [("@a", 0, 42)]
+
+    edit = OutboxRequest("editMessageText", {"message_id": 42, "text": "Текст"})
+    await outbox.enqueue(USER_ID, USER_CHAT_ID, ["@a"], [edit])
+    assert await outbox.drain(1)
+    assert outbox.delivered == 2 and outbox.dead == 0
+
+
+async def test_failed_channel_is_reported(test_db):
+    """Тест вызова on_channel_error для канала с неудачной отправкой"""
+    failed = []
+    sender = SendScheduler(channel_rate=1000, channel_burst=1000)
+    outbox = Outbox(test_db, sender, notify_window=0.01, on_channel_error=failed.append)
+    bot = AsyncMock()
+    bot.do_api_request.side_effect = Forbidden("bot is not a member")
+    await outbox.start(bot)
+    await outbox.enqueue(USER_ID, USER_CHAT_ID, ["@a"], [message_request()])
+    assert await outbox.drain(1)
+    await outbox.stop()
+    await sender.close()
+    assert failed == ["@a"]
+
+
+def test_backoff_is_exponential_and_bounded(test_db):
+    """Тест экспоненциальной задержки с ограничением сверху"""
+    outbox = Outbox(test_db, SendScheduler(), base_delay=1, max_delay=10)
+    assert [outbox.backoff(n) for n in range(1, 6)] == [1, 2, 4, 8, 10]
+
+
+async def test_payload_is_stored_as_json(test_db, outbox):
+    """Тест сохранения запроса без пустых параметров"""
+    request = OutboxRequest("copyMessage", {"from_chat_id": 5, "message_id": 7, "caption": None})
+    await outbox.enqueue(USER_ID, USER_CHAT_ID, ["@a"], [request])
+    (item,) = await test_db.claim_outbox(10, float("inf"))
+    assert item.method == "copyMessage"
+    assert json.loads(item.payload) == {"from_chat_id": 5, "message_id": 7}
@@ -0,0 +1,100 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+from telegram import Chat, ChatMember, ChatMemberAdministrator, ChatMemberMember, User
+from telegram.error import BadRequest
+
+from telegram_signature_bot.permissions import ChannelAccessCache, ChannelAccessError, can_post
+
+from .conftest import FakeClock
+
+BOT_USER = User(42, "Bot", True)
+CHANNEL = Chat(-1001, Chat.CHANNEL)
+GROUP = Chat(-1002, Chat.SUPERGROUP)
+
+
+def administrator(can_post_messages=True):
+    return ChatMemberAdministrator(
+        BOT_USER,
+        can_be_edited=False,
+        is_anonymous=False,
+        can_manage_chat=True,
+        can_delete_messages=True,
+        can_manage_video_chats=False,
+        can_restrict_members=False,
+        can_promote_members=False,
+        can_change_info=False,
+        can_invite_users=False,
+        can_post_messages=can_post_messages,
+    )
+
+
+@pytest.fixture
+def bot():
+    """Фикстура бота, который администрирует канал с правом публикации"""
+    bot = AsyncMock()
+    bot.id = BOT_USER.id
+    bot.get_chat.return_value = CHANNEL
+    bot.get_chat_member.return_value = administrator()
+    return bot
+
+
+def test_can_post():
+    """Тест прав публикации по статусу бота"""
+    member = ChatMemberMember(BOT_USER)
+    assert can_post(CHANNEL, administrator())
+    assert not can_post(CHANNEL, administrator(can_post_messages=False))
+    assert not can_post(CHANNEL, member)
+    assert can_post(GROUP, member)
+    assert can_post(GROUP, administrator(can_post_messages=None))
+    assert not can_post(GROUP, ChatMember(BOT_USER, ChatMember.LEFT))
+
+
+async def test_check_is_cached_until_ttl(bot):
+    """Тест повторной проверки канала только после истечения ttl"""
+    clock = FakeClock()
+    access = ChannelAccessCache(ttl=60, clock=clock)
+    await access.check(bot, "@channel")
+    await access.check(bot, "@channel")
+    bot.get_chat.assert_called_once_with("@channel")
+    bot.get_chat_member.assert_called_once_with(CHANNEL.id, BOT_USER.id)
+
+    clock.now = 61
+    await access.check(bot, "@channel")
+    assert bot.get_chat.call_count == 2
+
+
+async def test_concurrent_checks_share_request(bot):
+    """Тест одного запроса для одновременных проверок канала"""
+    access = ChannelAccessCache()
+    await asyncio.gather(*(access.check(bot, "@channel") for _ in range(10)))
+    bot.get_chat.assert_called_once()
+
+
+async def test_invalidate(bot):
+    """Тест повторной проверки канала после неудачной отправки"""
+    access = ChannelAccessCache()
+    await access.check(bot, "@channel")
+    access.invalidate("@channel")
+    assert len(access) == 0
+    await access.check(bot, "@channel")
+    assert bot.get_chat.call_count == 2
+
+
+async def test_failures_are_not_cached(bot):
+    """Тест ошибок проверки: отсутствие прав и несуществующий канал"""
+    access = ChannelAccessCache()
+    bot.get_chat_member.return_value = administrator(can_post_messages=False)
+    with pytest.raises(ChannelAccessError):
+        await access.check(bot, "@channel")
+
+    bot.get_chat.side_effect = BadRequest("Chat not found")
+    with pytest.raises(BadRequest):
+        await access.check(bot, "@missing")
+
+    # После исправления прав канал проверяется заново
+    bot.get_chat.side_effect = None
+    bot.get_chat_member.return_value = administrator()
+    await access.check(bot, "@channel")
+    assert bot.get_chat.call_count == 3
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from telegram_signature_bot.profiler import Profiler, phase, trace_phase
+
+
+def busy_loop(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+@phase("db:lookup")
+async def lookup():
+    await asyncio.sleep(0.01)
+
+
+async def test_profile_report(tmp_path):
+    """Тест записи стеков в формате collapsed и сводки обработчиков с фазами"""
+    profiler = Profiler(interval=0.001)
+
+    @profiler.traced("handle_message")
+    async def handler():
+        await lookup()
+        with trace_phase("split_message"):
+            busy_loop(0.05)
+
+    profiling = asyncio.create_task(profiler.run(0.3, tmp_path))
+    await asyncio.sleep(0.01)
+    await asyncio.gather(handler(), handler())
+    report = await profiling
+
+    assert not profiler.running
+    stacks = report.collapsed_path.read_text().splitlines()
+    assert any("test_profiler:busy_loop" in line for line in stacks)
+    assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in stacks)
+    summary = report.summary_path.read_text()
+    assert summary == report.summary
+    assert "вызовов обработчиков 2" in summary
+    assert "handle_message: db:lookup" in summary and "split_message 5" in summary
+
+
+async def test_tracing_disabled():
+    """Тест отсутствия записей, пока профилирование не запущено"""
+    profiler = Profiler()
+    handler = profiler.traced("handler")(lookup)
+    await handler()
+    profiler.start()
+    result = profiler.stop()
+    assert result.handlers == 0 and result.slowest == []
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+from telegram.error import TimedOut
+
+from telegram_signature_bot.fake_api import FakeTelegramServer
+from telegram_signature_bot.request import InstrumentedRequest, RequestProfile
+
+
+@pytest.fixture
+async def server():
+    server = FakeTelegramServer(latency=0.1)
+    await server.start()
+    yield server
+    await server.stop()
+
+
+async def test_pool_stats(server):
+    """Тест учета загрузки пула: запросы сверх размера пула ждут соединения"""
+    request = InstrumentedRequest(RequestProfile(pool_size=2, keepalive=1), "send")
+    await request.initialize()
+    url = f"{server.base_url}123:test/getMe"
+    results = await asyncio.gather(*(request.post(url) for _ in range(5)))
+    await request.shutdown()
+
+    assert all(result["is_bot"] for result in results)
+    assert request.stats() == {
+        "pool_size": 2,
+        "in_flight": 0,
+        "max_in_flight": 5,
+        "waits": 3,
+        "pool_timeouts": 0,
+    }
+
+
+async def test_pool_timeout_counted(server):
+    """Тест отказа по таймауту ожидания свободного соединения"""
+    request = InstrumentedRequest(RequestProfile(pool_size=1, pool_timeout=0.01), "send")
+    await request.initialize()
+    url = f"{server.base_url}123:test/getMe"
+    results = await asyncio.gather(request.post(url), request.post(url), return_exceptions=True)
+    await request.shutdown()
+
+    assert isinstance(results[1], TimedOut)
+    assert request.pool_timeouts == 1
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from telegram.error import BadRequest, RetryAfter
+
+from telegram_signature_bot.scheduler import (
+    PRIORITY_CHANNEL,
+    PRIORITY_REPLY,
+    SendScheduler,
+    TokenBucket,
+)
+
+from .conftest import FakeClock
+
+
+@pytest.fixture
+async def scheduler():
+    """Фикстура планировщика без заметных ограничений по скорости"""
+    scheduler = SendScheduler(global_rate=1000, private_chat_burst=100, channel_burst=100)
+    yield scheduler
+    await scheduler.close()
+
+
+def test_token_bucket():
+    """Тест выдачи токенов с резервированием в долг"""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+    clock.now = 10
+    assert bucket.is_idle()
+    bucket.pause(3)
+    assert bucket.delay() == pytest.approx(3)
+    assert not bucket.is_idle()
+
+
+async def test_send_returns_result(scheduler):
+    """Тест возврата результата и ошибки запроса"""
+
+    async def ok():
+        return 42
+
+    async def broken():
+        raise BadRequest("Chat not found")
+
+    assert await scheduler.send(1, ok) == 42
+    with pytest.raises(BadRequest):
+        await scheduler.send("@channel", broken)
+
+
+async def test_retry_after_is_honored(scheduler):
+    """Тест повтора отправки после RetryAfter"""
+    calls = []
+
+    async def flaky():
+        calls.append(asyncio.get_running_loop().time())
+        if len(calls) == 1:
+            raise RetryAfter(0.05)
+        return "sent"
+
+    assert await scheduler.send("@channel", flaky) == "sent"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.05
+    assert scheduler.retries == 1
+
+
+async def test_retry_limit(scheduler):
+    """Тест отказа после исчерпания повторов"""
+    scheduler.max_retries = 1
+
+    async def flood():
+        raise RetryAfter(0)
+
+    with pytest.raises(RetryAfter):
+        await scheduler.send("@channel", flood)
+
+
+async def test_replies_have_priority(scheduler):
+    """Тест приоритета ответов пользователям над публикациями в каналы"""
+    order = []
+
+    def record(name):
+        async def send():
+            order.append(name)
+
+        return send
+
+    # Пока общее ведро приостановлено, оба запроса успевают попасть в очередь
+    scheduler.global_bucket.pause(0.05)
+    await asyncio.gather(
+        scheduler.send("@channel", record("channel"), PRIORITY_CHANNEL),
+        scheduler.send(1, record("reply"), PRIORITY_REPLY),
+    )
+    assert order == ["reply", "channel"]
+
+
+async def test_close_cancels_pending_requests():
+    """Тест отмены выполняемого, ждущего в очереди и ждущего токен чата запросов"""
+    scheduler = SendScheduler(global_rate=1, private_chat_burst=1)
+    never = asyncio.Event()
+    sends = [
+        asyncio.create_task(scheduler.send(1, never.wait)),
+        asyncio.create_task(scheduler.send(2, never.wait)),
+        asyncio.create_task(scheduler.send(1, never.wait)),
+    ]
+    await asyncio.sleep(0.05)
+    await scheduler.close()
+
+    results = await asyncio.wait_for(asyncio.gather(*sends, return_exceptions=True), 1)
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
@@ -0,0 +1,113 @@
+import pytest
+
+from telegram_signature_bot.database import OutboxEntry
+from telegram_signature_bot.sharding import ShardedStorage, rebalance, shard_files, shard_index
+from telegram_signature_bot.transfer import main
+
+
+async def fill(directory, shards, users=200):
+    storage = ShardedStorage(directory, shards)
+    await storage.connect()
+    for user_id in range(1, users + 1):
+        await storage.set_signature(user_id, f"Подпись {user_id}")
+        await storage.add_channel(user_id, f"@channel{user_id % 7}")
+    return storage
+
+
+def test_users_are_spread_across_shards():
+    """Тест распределения пользователей по всем сегментам"""
+    counts = [0] * 4
+    for user_id in range(1, 10001):
+        counts[shard_index(user_id, 4)] += 1
+    assert min(counts) > 2000
+
+
+async def test_outbox_ids_identify_shard(tmp_path):
+    """Тест адресации записей очереди разных сегментов"""
+    storage = await fill(tmp_path / "shards", 3, users=0)
+    await storage.enqueue_outbox(
+        [
+            OutboxEntry(user_id, user_id, f"@channel{user_id}", "sendMessage", "{}")
+            for user_id in range(9)
+        ]
+    )
+    items = await storage.claim_outbox(100, float("inf"))
+    assert len({item.id for item in items}) == 9
+    for item in items:
+        await storage.complete_outbox(item.id)
+    assert await storage.outbox_stats() == {}
+    await storage.close()
+
+
+async def test_shard_count_mismatch(tmp_path):
+    """Тест отказа открыть хранилище с другим числом сегментов"""
+    directory = tmp_path / "shards"
+    await (await fill(directory, 2, users=1)).close()
+    with pytest.raises(ValueError, match="rebalance"):
+        await ShardedStorage(directory, 3).connect()
+
+
+async def test_rebalance(tmp_path):
+    """Тест перераспределения профилей по новому числу сегментов"""
+    directory = tmp_path / "shards"
+    storage = await fill(directory, 2)
+    before = sorted([record async for record in storage.export_profiles()])
+    await storage.close()
+
+    assert await rebalance(directory, 5, batch_size=64) == 200
+    assert len(shard_files(directory)) == 5
+    assert len(shard_files(tmp_path / "shards.2-shards.bak")) == 2
+
+    storage = ShardedStorage(directory, 5)
+    await storage.connect()
+    assert sorted([record async for record in storage.export_profiles()]) == before
+    assert await storage.get_signature(42) == ("Подпись 42", None)
+    await storage.close()
+
+
+async def test_rebalance_requires_empty_outbox(tmp_path):
+    """Тест отказа перераспределять хранилище с неотправленной очередью"""
+    directory = tmp_path / "shards"
+    storage = await fill(directory, 2, users=1)
+    await storage.enqueue_outbox([OutboxEntry(1, 1, "@channel", "sendMessage", "{}")])
+    await storage.close()
+    with pytest.raises(ValueError, match="очереди"):
+        await rebalance(directory, 3)
+    assert len(shard_files(directory)) == 2
+
+
+def test_rebalance_command(tmp_path):
+    """Тест команды signature-db rebalance и импорта в хранилище sharded"""
+    directory = str(tmp_path / "shards")
+    dump = tmp_path / "profiles.jsonl"
+    dump.write_text('{"user_id": 1, "signature": "Подпись", "channels": ["@a"]}\n')
+    main(
+        [
+            "import",
+            "--backend",
+            "sharded",
+            "--shards",
+            "2",
+            "--db",
+            directory,
+            "-i",
+            str(dump),
+            "-q",
+        ]
+    )
+    main(["rebalance", "--shards", "4", "--db", directory, "-q"])
+    main(
+        [
+            "export",
+            "--backend",
+            "sharded",
+            "--shards",
+            "4",
+            "--db",
+            directory,
+            "-o",
+            str(tmp_path / "out.jsonl"),
+            "-q",
+        ]
+    )
+    assert (tmp_path / "out.jsonl").read_text().count("Подпись") == 1
@@ -0,0 +1,98 @@
+import os
+import time
+
+from telegram import MessageEntity
+
+from telegram_signature_bot.bot import SignatureBot
+from telegram_signature_bot.cache import ProfileCache, UserProfile
+from telegram_signature_bot.snapshot import load_snapshot, write_snapshot
+from telegram_signature_bot.template import compile_signature
+
+
+def make_cache():
+    cache = ProfileCache()
+    entities = [MessageEntity(MessageEntity.BOLD, 0, 2)]
+    cache.put(1, UserProfile(compile_signature("Подпись 👍", entities), ("@one",)))
+    cache.put(2, UserProfile())
+    cache.put(3, UserProfile(compile_signature("three"), ("-100", "@three")))
+    return cache
+
+
+def test_round_trip(tmp_path):
+    """Тест сохранения и загрузки профилей, включая отсутствующие"""
+    path = tmp_path / "profiles.snapshot"
+    cache = make_cache()
+    assert write_snapshot(cache, path, 100) == 3
+
+    loaded = ProfileCache()
+    assert load_snapshot(loaded, path) == 3
+    for user_id in (1, 2, 3):
+        assert loaded.get(user_id) == cache.get(user_id)
+    template = loaded.get(1).template
+    assert template.utf16_length == cache.get(1).template.utf16_length
+    assert template.entities[0].type == MessageEntity.BOLD
+    assert not path.exists()
+
+
+def test_keeps_recent_profiles(tmp_path):
+    """Тест ограничения размера: сохраняются последние использованные профили"""
+    path = tmp_path / "profiles.snapshot"
+    cache = make_cache()
+    cache.get(1)
+    assert write_snapshot(cache, path, 2) == 2
+
+    loaded = ProfileCache(max_entries=2)
+    load_snapshot(loaded, path)
+    assert 2 not in loaded
+    # Порядок LRU восстановлен: при вытеснении первым уходит профиль 3
+    loaded.put(4, UserProfile())
+    assert 3 not in loaded and 1 in loaded
+
+
+def test_stale_snapshot_skipped(tmp_path):
+    """Тест пропуска снимка, записанного раньше изменения базы"""
+    path = tmp_path / "profiles.snapshot"
+    db_path = tmp_path / "signatures.db"
+    write_snapshot(make_cache(), path, 100)
+    db_path.write_bytes(b"")
+    modified = time.time() + 10
+    os.utime(db_path, (modified, modified))
+
+    loaded = ProfileCache()
+    assert load_snapshot(loaded, path, db_path) == 0
+    assert len(loaded) == 0
+    assert not path.exists()
+
+
+def test_corrupt_snapshot_ignored(tmp_path):
+    """Тест загрузки поврежденного и обрезанного снимка"""
+    path = tmp_path / "profiles.snapshot"
+    path.write_bytes(b"garbage")
+    assert load_snapshot(ProfileCache(), path) == 0
+
+    write_snapshot(make_cache(), path, 100)
+    path.write_bytes(path.read_bytes()[:-5])
+    assert load_snapshot(ProfileCache(), path) == 0
+    assert not path.exists()
+
+
+async def test_bot_restart_uses_snapshot(tmp_path):
+    """Тест перезапуска бота: профили из снимка читаются без запросов к базе"""
+    db_path = str(tmp_path / "signatures.db")
+    snapshot_path = str(tmp_path / "signatures.db.snapshot")
+
+    bot = SignatureBot("test_token", db_path, snapshot_path=snapshot_path)
+    await bot.post_init(bot.application)
+    await bot.db.set_signature(1, "one")
+    await bot.db.get_profile(1)
+    await bot.post_stop(bot.application)
+    await bot.post_shutdown(bot.application)
+
+    restarted = SignatureBot("test_token", db_path, snapshot_path=snapshot_path)
+    await restarted.post_init(restarted.application)
+    try:
+        assert (await restarted.db.get_profile(1)).signature == "one"
+        assert restarted.db.cache.stats()["hits"] == 1
+    finally:
+        await restarted.post_stop(restarted.application)
+        await restarted.post_shutdown(restarted.application)
@@ -0,0 +1,98 @@
+from unittest.mock import AsyncMock, MagicMock
+
+from telegram import MessageEntity
+
+from telegram_signature_bot.splitting import CAPTION_LIMIT, TEXT_LIMIT, split_message
+from telegram_signature_bot.template import compile_signature, utf16_len
+
+SIGNATURE = compile_signature("Иван", [MessageEntity(MessageEntity.BOLD, 0, 4)])
+
+
+def entity_texts(text, entities):
+    """Тексты entities по смещениям UTF-16"""
+    encoded = text.encode("utf-16-le")
+    return [
+        encoded[entity.offset * 2 : (entity.offset + entity.length) * 2].decode("utf-16-le")
+        for entity in entities
+    ]
+
+
+def test_short_text_single_part():
+    """Тест текста, помещающегося в лимит: подпись добавляется как обычно"""
+    assert split_message("Привет", (), SIGNATURE) == [SIGNATURE.apply("Привет")]
+
+
+def test_split_on_line_boundary():
+    """Тест разбиения по переводам строк с подписью в последней части"""
+    line = "слово " * 99 + "конец\n"
+    text = line * 20
+    parts = split_message(text, (), SIGNATURE)
+    assert len(parts) == 4
+    # По шесть строк по 600 кодовых единиц в каждой части, кроме последней
+    assert [utf16_len(part) for part, _ in parts[:-1]] == [3600, 3600, 3600]
+    assert all(utf16_len(part) <= TEXT_LIMIT for part, _ in parts)
+    assert all(part.endswith("\n") for part, _ in parts[:-1])
+    assert "".join(part for part, _ in parts[:-1]) + parts[-1][0][: -len("\n\nИван")] == text
+    assert parts[-1][0].endswith("\n\nИван")
+    assert entity_texts(*parts[-1]) == ["Иван"]
+
+
+def test_entities_not_cut():
+    """Тест сдвига границы к началу entity и смещений entities в частях"""
+    text = "👋 " + "а" * 4000 + " ссылка " + "б" * 200
+    start = utf16_len("👋 " + "а" * 4000 + " ")
+    link = MessageEntity(MessageEntity.TEXT_LINK, start, 6 + 1 + 100, url="https://example.com")
+    emoji = MessageEntity(MessageEntity.BOLD, 0, 2)
+    parts = split_message(text, [emoji, link], SIGNATURE)
+
+    assert len(parts) == 2
+    assert parts[0][0] == "👋 " + "а" * 4000 + " "
+    assert entity_texts(*parts[0]) == ["👋"]
+    assert entity_texts(*parts[1]) == ["ссылка " + "б" * 100, "Иван"]
+    assert parts[1][1][0].url == "https://example.com"
+
+
+def test_long_entity_divided():
+    """Тест entity длиннее части: делится между частями без потери форматирования"""
+    text = "x" * 10000
+    parts = split_message(text, [MessageEntity(MessageEntity.CODE, 0, 10000)], SIGNATURE)
+    assert [utf16_len(part) for part, _ in parts[:-1]] == [TEXT_LIMIT, TEXT_LIMIT]
+    assert [entities[0].length for _, entities in parts] == [TEXT_LIMIT, TEXT_LIMIT, 1808]
+
+
+def test_caption_overflow():
+    """Тест caption: первая часть не длиннее 1024, остаток с подписью текстом"""
+    caption = "слово " * 300
+    parts = split_message(caption, (), SIGNATURE, first_limit=CAPTION_LIMIT)
+    assert len(parts) == 2
+    assert utf16_len(parts[0][0]) <= CAPTION_LIMIT
+    assert parts[1][0].endswith("\n\nИван")
+
+    # Текст помещается в caption, а подпись уже нет
+    parts = split_message("а" * 1020, (), SIGNATURE, first_limit=CAPTION_LIMIT)
+    assert parts == [("а" * 1020, []), SIGNATURE.apply("")]
+
+
+async def test_handle_message_sends_parts(bot):
+    """Тест длинного сообщения: пользователю и в канал уходят части с подписью в конце"""
+    await bot.db.set_signature(1, "Иван")
+    await bot.db.set_channel(1, "@channel")
+    bot.outbox.enqueue = AsyncMock()
+    bot.sender.send = AsyncMock(wraps=bot.sender.send)
+
+    update = MagicMock()
+    update.effective_user.id = 1
+    update.message = AsyncMock()
+    update.message.chat_id = 1
+    update.message.message_id = 7
+    update.message.text = "строка\n" * 1000
+    update.message.entities = []
+
+    await bot.handle_message(update, MagicMock())
+    replies = [call.args[0] for call in update.message.reply_text.call_args_list]
+    assert len(replies) == 2
+    assert replies[-1].endswith("\n\nИван")
+    # Каждая часть - отдельная задача планировщика со своим токеном
+    assert bot.sender.send.await_count == 2
+    requests = bot.outbox.enqueue.call_args[0][3]
+    assert [request.payload["text"] for request in requests] == replies
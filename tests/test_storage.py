@@ -0,0 +1,170 @@
+import json
+import time
+
+import pytest
+from telegram import MessageEntity
+
+from telegram_signature_bot.database import OutboxEntry, ProfileRecord
+from telegram_signature_bot.storage import BACKENDS, create_storage
+
+
+@pytest.fixture(params=BACKENDS)
+async def storage(request, tmp_path):
+    """Фикстура каждой реализации хранилища: все они должны вести себя одинаково"""
+    path = tmp_path / ("shards" if request.param == "sharded" else "test.db")
+    storage = create_storage(request.param, str(path), shards=3)
+    await storage.connect()
+    yield storage
+    await storage.close()
+
+
+async def test_signatures(storage):
+    """Тест установки, чтения и удаления подписи"""
+    entities = [MessageEntity(MessageEntity.BOLD, 0, 7)]
+    assert await storage.get_signature(1) == (None, None)
+    template = await storage.set_signature(1, "Подпись", entities)
+    assert template.utf16_length == 7
+    assert await storage.get_signature(1) == (
+        "Подпись",
+        [{"type": "bold", "offset": 0, "length": 7}],
+    )
+    profile = await storage.get_profile(1)
+    assert profile.template == template
+
+    await storage.remove_signature(1)
+    assert await storage.get_signature(1) == (None, None)
+    assert (await storage.get_profile(1)).template is None
+
+
+async def test_channels(storage):
+    """Тест операций с каналами и порядка их выдачи"""
+    await storage.add_channel(1, "@b")
+    await storage.add_channel(1, "@a")
+    await storage.add_channel(1, "@a")
+    assert await storage.get_channels(1) == ["@a", "@b"]
+    assert (await storage.get_profile(1)).channels == ("@a", "@b")
+
+    assert await storage.remove_channel(1, "@missing") == 0
+    assert await storage.remove_channel(1, "@a") == 1
+    await storage.set_channel(1, "@c")
+    assert await storage.get_channels(1) == ["@c"]
+    assert await storage.remove_channel(1) == 1
+    assert await storage.get_channels(1) == []
+
+
+async def test_outbox_lifecycle(storage):
+    """Тест очереди: выборка, повтор, отказ, восстановление после остановки"""
+    entries = [
+        OutboxEntry(user_id, user_id, f"@channel{user_id}", "sendMessage", "{}")
+        for user_id in range(1, 7)
+    ]
+    await storage.enqueue_outbox(entries)
+    assert await storage.outbox_stats() == {"pending": 6}
+
+    now = time.time() + 1
+    first = await storage.claim_outbox(4, now)
+    second = await storage.claim_outbox(4, now)
+    assert len(first) == 4 and len(second) == 2
+    items = {item.user_id: item for item in first + second}
+    assert sorted(items) == [1, 2, 3, 4, 5, 6]
+    assert items[1].chat_id == "@channel1" and items[1].attempts == 0
+
+    await storage.complete_outbox(items[1].id)
+    await storage.retry_outbox(items[2].id, now + 60, "timeout")
+    await storage.dead_letter_outbox(items[3].id, "forbidden")
+    assert await storage.next_outbox_attempt() == pytest.approx(now + 60)
+    assert await storage.recover_outbox() == 3
+    assert await storage.outbox_stats() == {"pending": 4, "dead": 1}
+
+    (retried,) = [item for item in await storage.claim_outbox(10, now + 61) if item.user_id == 2]
+    assert retried.attempts == 1
+
+
+async def test_outbox_channel_order(storage):
+    """Тест доставки в канал по одной записи в порядке добавления, в том числе при повторе"""
+    await storage.enqueue_outbox(
+        [OutboxEntry(1, 1, "@a", "sendMessage", json.dumps({"n": n})) for n in range(3)]
+        + [OutboxEntry(1, 1, "@b", "sendMessage", "{}")]
+    )
+    now = time.time() + 1
+    first = await storage.claim_outbox(10, now)
+    assert [(item.chat_id, item.payload) for item in first] == [("@a", '{"n": 0}'), ("@b", "{}")]
+    assert await storage.claim_outbox(10, now) == []
+
+    # Следующая запись канала ждет повтора предыдущей
+    await storage.retry_outbox(first[0].id, now + 60, "timeout")
+    assert await storage.claim_outbox(10, now) == []
+    assert await storage.next_outbox_attempt() == pytest.approx(now + 60)
+    (retried,) = await storage.claim_outbox(10, now + 61)
+    assert retried.id == first[0].id
+
+    await storage.dead_letter_outbox(retried.id, "forbidden")
+    (second,) = await storage.claim_outbox(10, now)
+    assert second.payload == '{"n": 1}'
+
+
+async def test_outbox_dedup_key(storage):
+    """Тест идемпотентной постановки в очередь: запись с тем же ключом не добавляется"""
+    entry = OutboxEntry(1, 1, "@a", "sendMessage", "{}", "1:10:@a:0")
+    await storage.enqueue_outbox([entry, entry._replace(key=None)])
+    await storage.enqueue_outbox([entry])
+    assert await storage.outbox_stats() == {"pending": 2}
+
+    first = await storage.claim_outbox(10, time.time() + 1)
+    await storage.complete_outbox(first[0].id)
+    # После доставки ключ освобождается вместе с записью
+    await storage.enqueue_outbox([entry])
+    assert await storage.outbox_stats() == {"pending": 2}
+
+
+async def test_posted_messages(storage):
+    """Тест сведений о публикациях: запись при доставке, чтение и удаление устаревших"""
+    await storage.enqueue_outbox(
+        [
+            OutboxEntry(1, 100, "@a", "sendMessage", "{}", source_message_id=7, part=part)
+            for part in range(2)
+        ]
+        + [OutboxEntry(1, 100, "@b", "sendMessage", "{}")]
+    )
+    now = time.time() + 1
+    for message_id in (50, 51):
+        for item in await storage.claim_outbox(10, now):
+            await storage.complete_outbox(item.id, message_id)
+    assert await storage.get_posts(1, 100, 7) == [("@a", 0, 50), ("@a", 1, 51)]
+    assert await storage.get_posts(1, 100, 8) == []
+
+    assert await storage.prune_posts(time.time() - 60) == 0
+    assert await storage.prune_posts(time.time() + 1) == 2
+    assert await storage.get_posts(1, 100, 7) == []
+
+
+async def test_meta(storage):
+    """Тест служебных параметров хранилища"""
+    assert await storage.get_meta("key") is None
+    await storage.set_meta("key", "value")
+    assert await storage.get_meta("key") == "value"
+
+
+async def test_export_import(storage):
+    """Тест выгрузки и загрузки профилей"""
+    await storage.set_signature(1, "Подпись")
+    await storage.add_channel(1, "@old")
+    await storage.add_channel(2, "@only_channel")
+    await storage.import_profiles(
+        [ProfileRecord(1, None, None, ("@new",)), ProfileRecord(3, "Третья", None, ())]
+    )
+    records = sorted([record async for record in storage.export_profiles()])
+    assert records == [
+        ProfileRecord(1, "Подпись", None, ("@new", "@old")),
+        ProfileRecord(2, None, None, ("@only_channel",)),
+        ProfileRecord(3, "Третья", None, ()),
+    ]
+
+    await storage.import_profiles([ProfileRecord(1, None, None, ("@new",))], replace=True)
+    assert await storage.get_signature(1) == (None, None)
+    assert await storage.get_channels(1) == ["@new"]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_storage("postgres")
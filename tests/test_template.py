@@ -0,0 +1,85 @@
+from unittest.mock import AsyncMock, MagicMock
+
+from telegram import MessageEntity, User
+
+from telegram_signature_bot.template import compile_signature, load_template, utf16_len
+
+
+def test_utf16_len():
+    """Тест подсчета длины в кодовых единицах UTF-16"""
+    assert utf16_len("abc") == 3
+    assert utf16_len("Привет") == 6
+    # Эмодзи вне BMP занимают две кодовые единицы
+    assert utf16_len("👍") == 2
+    assert utf16_len("a👍b") == 4
+
+
+def test_shifted_entities():
+    """Тест сдвига entities шаблона"""
+    template = compile_signature(
+        "Иван 👍 site",
+        [
+            MessageEntity(MessageEntity.BOLD, 0, 4),
+            MessageEntity(MessageEntity.TEXT_LINK, 8, 4, url="https://example.com"),
+        ],
+    )
+    assert template.utf16_length == 12
+    assert template.shifted_entities(0) is template.entities
+
+    shifted = template.shifted_entities(10)
+    assert [entity.offset for entity in shifted] == [10, 18]
+    assert shifted[1].url == "https://example.com"
+    # Исходный шаблон не изменяется
+    assert [entity.offset for entity in template.entities] == [0, 8]
+
+
+def test_template_round_trip():
+    """Тест сериализации шаблона для хранения в базе"""
+    template = compile_signature(
+        "Подпись", [MessageEntity(MessageEntity.CUSTOM_EMOJI, 0, 2, custom_emoji_id="42")]
+    )
+    loaded = load_template(template.text, template.utf16_length, template.entities_json())
+    assert loaded == template
+    assert loaded.entities[0].custom_emoji_id == "42"
+
+
+def test_template_round_trip_text_mention():
+    """Тест восстановления entity с упоминанием пользователя"""
+    user = User(42, "Иван", False)
+    template = compile_signature(
+        "Иван", [MessageEntity(MessageEntity.TEXT_MENTION, 0, 4, user=user)]
+    )
+    loaded = load_template(template.text, template.utf16_length, template.entities_json())
+    assert loaded.entities[0].user == user
+
+
+async def test_stored_template(test_db):
+    """Тест сохранения скомпилированной подписи в профиле"""
+    entities = [MessageEntity(MessageEntity.ITALIC, 2, 4)]
+    await test_db.set_signature(1, "👍 Иван", entities)
+
+    template = (await test_db.get_profile(1)).template
+    assert template.text == "👍 Иван"
+    assert template.utf16_length == 7
+    assert template.entities == tuple(entities)
+
+
+async def test_emoji_message_offsets(bot):
+    """Тест смещений entities подписи после текста с эмодзи"""
+    await bot.db.set_signature(1, "Иван", [MessageEntity(MessageEntity.BOLD, 0, 4)])
+
+    update = MagicMock()
+    update.effective_user.id = 1
+    update.message = AsyncMock()
+    update.message.chat_id = 1
+    update.message.text = "Привет 👋"
+    update.message.entities = []
+    context = MagicMock()
+    context.bot = AsyncMock()
+
+    await bot.handle_message(update, context)
+    text = update.message.reply_text.call_args[0][0]
+    entities = update.message.reply_text.call_args[1]["entities"]
+    assert text == "Привет 👋\n\nИван"
+    # "Привет 👋" занимает 9 кодовых единиц UTF-16, плюс два перевода строки
+    assert entities[0].offset == 11
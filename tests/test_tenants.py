@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+import pytest
+
+from telegram_signature_bot.bot import SignatureBot
+from telegram_signature_bot.database import ConnectionPool, Database, OutboxEntry
+from telegram_signature_bot.fake_api import FakeTelegramServer
+from telegram_signature_bot.migrations import migrate
+from telegram_signature_bot.tenants import TenantConfig, TenantRunner, load_tenants
+
+USER_ID = 12345
+
+
+async def test_bots_share_database(tmp_path):
+    """Тест разделения данных ботов в одной базе с общим пулом соединений"""
+    db_path = str(tmp_path / "tenants.db")
+    pool = ConnectionPool(db_path)
+    await pool.open()
+    async with pool.writer() as conn:
+        await migrate(conn)
+    first = Database(db_path, bot_id=1, pool=pool)
+    second = Database(db_path, bot_id=2, pool=pool)
+
+    await first.set_signature(USER_ID, "Первый")
+    await first.add_channel(USER_ID, "@first")
+    await second.set_signature(USER_ID, "Второй")
+    await first.set_meta("key", "1")
+    assert (await first.get_profile(USER_ID)).template.text == "Первый"
+    assert (await second.get_profile(USER_ID)).channels == ()
+    assert await second.get_meta("key") is None
+
+    entry = OutboxEntry(USER_ID, USER_ID, "@channel", "sendMessage", "{}", key="1:1:@channel:0")
+    await first.enqueue_outbox([entry])
+    await second.enqueue_outbox([entry])
+    assert len(await first.claim_outbox(10, now=1e12)) == 1
+    # Запись второго бота в тот же канал не ждет записи первого
+    assert len(await second.claim_outbox(10, now=1e12)) == 1
+    assert [record.user_id async for record in second.export_profiles()] == [USER_ID]
+
+    # Закрытие хранилища бота не закрывает общий пул
+    await first.close()
+    assert pool.is_open
+    await second.close()
+    await pool.close()
+
+
+def test_load_tenants(tmp_path):
+    """Тест чтения конфигурации и отказа при повторе токена"""
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps({"bots": [{"name": "news", "token": "101:a"}]}))
+    assert load_tenants(path) == [TenantConfig("news", "101:a")]
+    assert load_tenants(path)[0].bot_id == 101
+
+    path.write_text(
+        json.dumps({"bots": [{"name": "a", "token": "101:a"}, {"name": "b", "token": "101:a"}]})
+    )
+    with pytest.raises(ValueError):
+        load_tenants(path)
+
+
+async def test_runner_adds_and_removes_bots(tmp_path):
+    """Тест нескольких ботов в процессе: общие база и транспорт, изменение без перезапуска"""
+    servers = {"a": FakeTelegramServer(seed=1), "b": FakeTelegramServer(seed=2)}
+    for server in servers.values():
+        await server.start()
+
+    def make_bot(config, storage, send_request):
+        return SignatureBot(
+            config.token,
+            storage.db_name,
+            storage=storage,
+            send_request=send_request,
+            base_url=servers[config.name].base_url,
+        )
+
+    runner = TenantRunner(str(tmp_path / "tenants.db"), bot_factory=make_bot)
+    await runner.start()
+    tenants = [TenantConfig("a", "101:a"), TenantConfig("b", "102:b")]
+    await runner.apply(tenants)
+    for name, (_, bot) in runner.bots.items():
+        assert bot.send_request is runner.send_request
+        await bot.db.set_signature(USER_ID, f"Подпись {name}")
+        await servers[name].inject_text(USER_ID, "Текст")
+    await asyncio.sleep(0.3)
+    for name, server in servers.items():
+        assert [sent.params["text"] for sent in server.requests("sendMessage")] == [
+            f"Текст\n\nПодпись {name}"
+        ]
+
+    # Ошибка в файле конфигурации не останавливает ботов
+    config_path = tmp_path / "tenants.json"
+    config_path.write_text("{")
+    await runner.reload(config_path)
+    assert set(runner.bots) == {"a", "b"}
+
+    config_path.write_text(json.dumps({"bots": [{"name": "a", "token": "101:a"}]}))
+    await runner.reload(config_path)
+    assert set(runner.bots) == {"a"}
+
+    await runner.stop()
+    assert not runner.bots and not runner.pool.is_open
+    for server in servers.values():
+        await server.stop()
@@ -0,0 +1,159 @@
+import asyncio
+import json
+
+import pytest
+from telegram import MessageEntity
+
+from telegram_signature_bot.database import Database, ProfileRecord
+from telegram_signature_bot.transfer import check_entities, main
+
+# Команды signature-db запускают свой event loop, поэтому тесты синхронные
+
+
+async def fill(db_path):
+    db = Database(db_path)
+    await db.set_signature(1, "Подпись 👋", [MessageEntity(MessageEntity.BOLD, 0, 7)])
+    await db.add_channel(1, "@first")
+    await db.add_channel(1, "@second")
+    await db.set_signature(2, "Только подпись")
+    await db.add_channel(3, "@only_channel")
+    await db.close()
+
+
+async def load_profiles(db_path):
+    db = Database(db_path)
+    try:
+        return [record async for record in db.export_profiles()]
+    finally:
+        await db.close()
+
+
+def profiles(db_path):
+    return asyncio.run(load_profiles(db_path))
+
+
+@pytest.fixture
+def source(tmp_path):
+    """Фикстура базы с профилями разных видов"""
+    db_path = str(tmp_path / "production.db")
+    asyncio.run(fill(db_path))
+    return db_path
+
+
+@pytest.mark.parametrize("extension", ["jsonl", "csv"])
+def test_round_trip(source, tmp_path, extension):
+    """Тест переноса профилей между базами через файл"""
+    dump = str(tmp_path / f"profiles.{extension}")
+    target = str(tmp_path / "development.db")
+    main(["export", "--db", source, "-o", dump, "-q"])
+    main(["import", "--db", target, "-i", dump, "--batch-size", "2", "-q"])
+
+    assert profiles(target) == profiles(source)
+    (record, *_) = profiles(target)
+    assert record.channels == ("@first", "@second")
+    assert record.entities == [{"type": "bold", "offset": 0, "length": 7}]
+
+
+async def test_import_loads_profile(tmp_path):
+    """Тест чтения профиля после импорта и сброса кэша"""
+    db = Database(str(tmp_path / "db.db"))
+    await db.set_signature(1, "Старая")
+    await db.get_profile(1)
+    await db.import_profiles(
+        [ProfileRecord(1, "Подпись 👋", [{"type": "bold", "offset": 0, "length": 7}], ("@a",))]
+    )
+    profile = await db.get_profile(1)
+    await db.close()
+    assert profile.channels == ("@a",)
+    assert profile.template.utf16_length == 10
+    assert profile.template.entities == (MessageEntity(MessageEntity.BOLD, 0, 7),)
+
+
+def test_jsonl_format(source, tmp_path):
+    """Тест формата строки JSONL"""
+    dump = tmp_path / "profiles.jsonl"
+    main(["export", "--db", source, "-o", str(dump), "-q"])
+    lines = dump.read_text(encoding="utf-8").splitlines()
+    assert json.loads(lines[2]) == {
+        "user_id": 3,
+        "signature": None,
+        "entities": None,
+        "channels": ["@only_channel"],
+    }
+
+
+async def seed(db_path):
+    db = Database(db_path)
+    await db.set_signature(1, "Старая подпись")
+    await db.add_channel(1, "@old")
+    await db.close()
+
+
+def test_merge_and_replace(tmp_path):
+    """Тест добавления каналов при импорте и полной замены профиля с --replace"""
+    db_path = str(tmp_path / "development.db")
+    asyncio.run(seed(db_path))
+
+    dump = tmp_path / "profiles.jsonl"
+    dump.write_text(json.dumps({"user_id": 1, "channels": ["@new"]}) + "\n", encoding="utf-8")
+
+    main(["import", "--db", db_path, "-i", str(dump), "-q"])
+    (record,) = profiles(db_path)
+    assert record.signature == "Старая подпись"
+    assert record.channels == ("@new", "@old")
+
+    main(["import", "--db", db_path, "-i", str(dump), "--replace", "-q"])
+    (record,) = profiles(db_path)
+    assert record.signature is None and record.channels == ("@new",)
+
+
+async def fill_bot(db_path, bot_id):
+    db = Database(db_path, bot_id=bot_id)
+    await db.set_signature(1, f"Подпись бота {bot_id}")
+    await db.close()
+
+
+def test_bot_id_selects_bot_profiles(tmp_path):
+    """Тест переноса профилей одного бота из общей базы start-bots"""
+    shared = str(tmp_path / "tenants.db")
+    for bot_id in (0, 42):
+        asyncio.run(fill_bot(shared, bot_id))
+    dump = str(tmp_path / "profiles.jsonl")
+    target = str(tmp_path / "target.db")
+    main(["export", "--db", shared, "--bot-id", "42", "-o", dump, "-q"])
+    main(["import", "--db", target, "--bot-id", "7", "-i", dump, "-q"])
+
+    (record,) = [json.loads(line) for line in open(dump, encoding="utf-8")]
+    assert record["signature"] == "Подпись бота 42"
+    assert profiles(target) == []
+    with pytest.raises(SystemExit):
+        main(["export", "--db", shared, "--backend", "sharded", "--bot-id", "42", "-o", dump])
+
+
+def test_invalid_line_reports_line_number(tmp_path, capsys):
+    """Тест ошибки с номером строки для некорректных данных"""
+    dump = tmp_path / "profiles.jsonl"
+    dump.write_text('{"user_id": 1}\n{"user_id": 2, "entities": [1]}\n', encoding="utf-8")
+    with pytest.raises(SystemExit):
+        main(["import", "--db", str(tmp_path / "db.db"), "-i", str(dump), "-q"])
+    assert "Строка 2" in capsys.readouterr().err
+
+
+def test_malformed_entity_rejected(tmp_path, capsys):
+    """Тест отказа импорта entities с неизвестными или отсутствующими полями"""
+    dump = tmp_path / "profiles.jsonl"
+    entity = {"type": "bold", "offset": 0, "length": 7, "colour": "red"}
+    dump.write_text(
+        json.dumps({"user_id": 1, "signature": "Подпись", "entities": [entity]}) + "\n",
+        encoding="utf-8",
+    )
+    target = str(tmp_path / "db.db")
+    with pytest.raises(SystemExit):
+        main(["import", "--db", target, "-i", str(dump), "-q"])
+    assert "Неизвестные поля entity: colour" in capsys.readouterr().err
+
+    user = {"id": 1, "first_name": "Иван", "is_bot": False, "nickname": "ivan"}
+    with pytest.raises(ValueError, match="Неизвестные поля user: nickname"):
+        check_entities([{"type": "text_mention", "offset": 0, "length": 4, "user": user}])
+    with pytest.raises(ValueError, match="нет полей: length"):
+        check_entities([{"type": "bold", "offset": 0}])
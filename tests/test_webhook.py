@@ -0,0 +1,86 @@
+import asyncio
+import inspect
+
+import httpx
+import pytest
+from telegram import Update
+
+from telegram_signature_bot.bot import SignatureBot
+from telegram_signature_bot.webhook import SECRET_TOKEN_HEADER, WebhookConfig, WebhookServer
+
+SECRET = "test-secret"
+
+
+def make_update(update_id, text):
+    """Синтетическое обновление в формате Bot API"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": 12345, "type": "private"},
+            "from": {"id": 12345, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+@pytest.fixture
+async def webhook(tmp_path):
+    """Фикстура запущенного сервера вебхука на свободном локальном порту"""
+    bot = SignatureBot("123:test_token", str(tmp_path / "test_signatures.db"))
+    config = WebhookConfig(
+        url="https://example.com", listen="127.0.0.1", port=0, secret_token=SECRET
+    )
+    server = WebhookServer(config, bot.application.bot, bot.application.update_queue)
+    await server.start()
+    yield bot, server
+    await server.stop()
+
+
+async def test_webhook_accepts_updates(webhook):
+    """Тест приема обновлений и передачи их обработчикам бота"""
+    bot, server = webhook
+    async with httpx.AsyncClient(base_url=server.http.url) as client:
+        for update_id in (1, 2):
+            response = await client.post(
+                "/webhook",
+                json=make_update(update_id, f"Сообщение {update_id}"),
+                headers={SECRET_TOKEN_HEADER: SECRET},
+            )
+            assert response.status_code == 200
+
+    queue = bot.application.update_queue
+    updates = [await asyncio.wait_for(queue.get(), 1) for _ in range(2)]
+    assert [update.update_id for update in updates] == [1, 2]
+    assert isinstance(updates[0], Update)
+    assert updates[0].message.text == "Сообщение 1"
+
+    # Обновление попадает в тот же обработчик текстовых сообщений (обернутый метриками
+    # и профилированием)
+    matching = [
+        inspect.unwrap(handler.callback)
+        for handler in bot.application.handlers[0]
+        if handler.check_update(updates[0])
+    ]
+    assert matching == [bot.handle_message]
+
+
+async def test_webhook_rejects_bad_requests(webhook):
+    """Тест отклонения запросов без секрета, с неверным путем или телом"""
+    bot, server = webhook
+    async with httpx.AsyncClient(base_url=server.http.url) as client:
+        response = await client.post("/webhook", json=make_update(1, "text"))
+        assert response.status_code == 403
+
+        response = await client.post(
+            "/other", json=make_update(1, "text"), headers={SECRET_TOKEN_HEADER: SECRET}
+        )
+        assert response.status_code == 404
+
+        response = await client.post(
+            "/webhook", content=b"not json", headers={SECRET_TOKEN_HEADER: SECRET}
+        )
+        assert response.status_code == 400
+
+    assert bot.application.update_queue.empty()
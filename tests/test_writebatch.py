@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from telegram_signature_bot.database import Database
+from telegram_signature_bot.writebatch import WRITE_BATCH_SIZE, WRITES_COALESCED
+
+
+@pytest.fixture
+async def test_db(tmp_path):
+    """Фикстура базы с окном группировки записей, достаточным для тестов"""
+    db = Database(str(tmp_path / "test_signatures.db"), write_window=0.01)
+    await db.connect()
+    yield db
+    await db.close()
+
+
+def batches() -> int:
+    return WRITE_BATCH_SIZE.labels().count
+
+
+async def test_concurrent_writes_share_transaction(test_db):
+    """Тест записи одновременных изменений одной транзакцией"""
+    before = batches()
+    await asyncio.gather(
+        *(test_db.set_signature(user_id, f"Подпись {user_id}") for user_id in range(100))
+    )
+    assert batches() == before + 1
+
+    # Чтение после возврата видит записанное, в том числе через кэш профилей
+    for user_id in range(100):
+        profile = await test_db.get_profile(user_id)
+        assert profile.signature == f"Подпись {user_id}"
+
+
+async def test_last_write_wins(test_db):
+    """Тест замены ожидающей записи подписи более поздней"""
+    coalesced = WRITES_COALESCED.labels().value
+    await asyncio.gather(
+        test_db.set_signature(1, "Первая"),
+        test_db.remove_signature(1),
+        test_db.set_signature(1, "Последняя"),
+    )
+    assert WRITES_COALESCED.labels().value == coalesced + 2
+    assert await test_db.get_signature(1) == ("Последняя", None)
+
+
+async def test_channel_writes_keep_order(test_db):
+    """Тест порядка изменений каналов внутри пачки"""
+    await asyncio.gather(
+        test_db.set_channel(1, "@a"),
+        test_db.add_channel(1, "@b"),
+        test_db.set_channel(1, "@c"),
+        test_db.add_channel(2, "@x"),
+        test_db.add_channel(2, "@y"),
+    )
+    assert await test_db.get_channels(1) == ["@c"]
+    assert sorted(await test_db.get_channels(2)) == ["@x", "@y"]
+
+    removed = await asyncio.gather(
+        test_db.remove_channel(2, "@x"), test_db.remove_channel(2, "@x"), test_db.remove_channel(2)
+    )
+    assert removed == [1, 0, 1]
+
+
+async def test_failed_write_does_not_affect_batch(test_db):
+    """Тест повторной записи по одной при ошибке в пачке"""
+    results = await asyncio.gather(
+        test_db.set_signature(1, "Подпись"),
+        test_db.writes.submit([("INSERT INTO missing_table VALUES (?)", (1,))]),
+        test_db.add_channel(1, "@channel"),
+        return_exceptions=True,
+    )
+    assert isinstance(results[1], Exception)
+    assert await test_db.get_signature(1) == ("Подпись", None)
+    assert await test_db.get_channels(1) == ["@channel"]
+
+
+async def test_close_flushes_pending(tmp_path):
+    """Тест записи ожидающих изменений при закрытии базы"""
+    db_path = str(tmp_path / "test_signatures.db")
+    db = Database(db_path, write_window=10.0)
+    await db.connect()
+    task = asyncio.create_task(db.set_signature(1, "Подпись"))
+    await asyncio.sleep(0)
+    assert db.writes.pending == 1
+    await db.close()
+    await task
+
+    db = Database(db_path)
+    assert await db.get_signature(1) == ("Подпись", None)
+    await db.close()